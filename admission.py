@@ -0,0 +1,209 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from metrics import CHAT_ACTIVE, CHAT_QUEUE_DEPTH, CHAT_QUEUE_WAIT, CHAT_REJECTED
+
+load_dotenv()
+
+# ==========================================
+# 1. 配置
+# ==========================================
+# 每个上游模型同时进行中的 /chat 上限 (一条对话从开始到流式结束占一个名额)
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "16"))
+# 按模型单独设置，如 "qwen-plus=32,deepseek-chat=8"
+CHAT_MODEL_LIMITS = os.getenv("CHAT_MODEL_LIMITS", "")
+# 名额满了之后每个模型最多排队多少个请求，再多直接 429
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "32"))
+# 排队超过这么多秒还没轮到就返回 503，不让请求一直挂着
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "10"))
+# Retry-After 的上下限 (秒)
+RETRY_AFTER_MIN, RETRY_AFTER_MAX = 1, 60
+# 最多同时记录多少个模型的限流器；超出时清掉空闲的 (调用方应先用 ALLOWED_MODELS 校验模型名)
+CHAT_MAX_MODELS = int(os.getenv("CHAT_MAX_MODELS", "32"))
+
+
+def _parse_model_limits(text: str) -> dict:
+    limits = {}
+    for item in text.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+MODEL_LIMITS = _parse_model_limits(CHAT_MODEL_LIMITS)
+
+
+class Overloaded(Exception):
+    """准入失败：status 为 429 (排队已满) 或 503 (排队超时)，retry_after 为建议的重试秒数"""
+
+    def __init__(self, status: int, reason: str, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ==========================================
+# 2. 单个模型的限流器
+# ==========================================
+class ModelLimiter:
+    """
+    并发名额 + 有界 FIFO 等待队列，只在事件循环里使用，不需要加锁。
+    释放名额时直接交给队首的等待者，后来的请求不会插队。
+    """
+
+    def __init__(self, model: str, limit: int, queue_size: int):
+        self.model = model
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self._waiters = deque()
+        # 名额平均占用时长的指数滑动平均，用来估算 Retry-After
+        self.avg_hold = 5.0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def waiting(self) -> int:
+        # 超时 / 断开的等待者留在队列里，释放名额时才被跳过，这里先把队首的清掉
+        while self._waiters and self._waiters[0].done():
+            self._waiters.popleft()
+        return sum(1 for f in self._waiters if not f.done())
+
+    def retry_after(self) -> int:
+        """前面还有多少人 / 并发数 × 平均占用时长，粗略估计多久以后能轮到"""
+        seconds = self.avg_hold * (self.waiting + 1) / self.limit
+        return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, math.ceil(seconds))))
+
+    async def acquire(self, timeout: float) -> float:
+        """拿到名额后返回排队时长；排队已满抛 Overloaded(429)，等待超时抛 Overloaded(503)"""
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            return 0.0
+        if self.waiting >= self.queue_size:
+            self._reject("queue_full")
+            raise Overloaded(429, "queue_full", self.retry_after(),
+                             f"模型 {self.model} 当前请求过多，排队已满，请稍后重试")
+
+        queued_at = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 超时 / 断开的同时刚好轮到：名额已经转交过来了，还回去
+                self.release()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("queue_timeout")
+            raise Overloaded(503, "queue_timeout", self.retry_after(),
+                             f"模型 {self.model} 排队超过 {timeout:g} 秒，请稍后重试")
+        self.admitted += 1
+        return time.perf_counter() - queued_at
+
+    def release(self, held: float = None):
+        if held is not None:
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # 名额直接转交，active 不变
+                waiter.set_result(True)
+                return
+        self.active = max(0, self.active - 1)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        CHAT_REJECTED.inc(model=self.model, reason=reason)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_hold_seconds": round(self.avg_hold, 3),
+        }
+
+
+class Admission:
+    """按模型名存放 ModelLimiter 的容器"""
+    limiters = {}
+
+
+def get_limiter(model: str) -> ModelLimiter:
+    limiter = Admission.limiters.get(model)
+    if limiter is None:
+        if len(Admission.limiters) >= CHAT_MAX_MODELS:
+            _drop_idle()
+        if len(Admission.limiters) >= CHAT_MAX_MODELS:
+            raise Overloaded(503, "too_many_models", RETRY_AFTER_MAX,
+                             f"同时使用的模型超过 {CHAT_MAX_MODELS} 个，请稍后重试")
+        limit = MODEL_LIMITS.get(model, CHAT_MAX_CONCURRENCY)
+        limiter = Admission.limiters[model] = ModelLimiter(model, limit, CHAT_QUEUE_SIZE)
+    return limiter
+
+
+def _drop_idle():
+    """清掉没有进行中、也没有排队请求的限流器 (下次用到时重新创建，名额本来就是空的)"""
+    for model, limiter in list(Admission.limiters.items()):
+        if limiter.active == 0 and limiter.waiting == 0:
+            del Admission.limiters[model]
+
+
+# ==========================================
+# 3. 对外接口
+# ==========================================
+class Slot:
+    """一个已拿到的名额；release 可以重复调用 (流结束和后台任务都会调一次)"""
+
+    def __init__(self, limiter: ModelLimiter):
+        self.limiter = limiter
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter.release(time.perf_counter() - self.started)
+
+
+async def admit(model: str, timeout: float = None) -> Slot:
+    """为一次对话申请 model 的名额，失败时抛 Overloaded"""
+    limiter = get_limiter(model)
+    waited = await limiter.acquire(CHAT_QUEUE_TIMEOUT if timeout is None else timeout)
+    CHAT_QUEUE_WAIT.observe(waited, model=model)
+    return Slot(limiter)
+
+
+async def guarded_stream(stream, slot: Slot):
+    """包装流式输出：流正常结束、出错或客户端断开时都归还名额"""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        slot.release()
+
+
+def admission_stats() -> dict:
+    return {model: limiter.stats() for model, limiter in Admission.limiters.items()}
+
+
+def _gauge(field: str):
+    return lambda: {(model,): getattr(limiter, field) for model, limiter in Admission.limiters.items()}
+
+
+CHAT_QUEUE_DEPTH.callback = _gauge("waiting")
+CHAT_ACTIVE.callback = _gauge("active")
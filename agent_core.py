@@ -1,12 +1,19 @@
 import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from typing import AsyncIterable, Any, Union
 
+import httpx
+
 from langchain.agents import AgentExecutor
+from langchain.agents.agent import MultiActionAgentOutputParser
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import tool, render_text_description
-from langchain_community.tools.ddg_search.tool import DuckDuckGoSearchRun
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
@@ -16,14 +23,28 @@ from langchain.agents.format_scratchpad import format_log_to_str
 from langchain_core.runnables import RunnablePassthrough
 from langchain.agents.output_parsers import ReActSingleInputOutputParser
 from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
 # 导入工具函数
 from tools.tool1_天气查询 import get_weather
-from tools.tool2_时间获取 import get_current_time
-from tools.tool4_finance import get_stock_data
-from tools.tool5_rag import knowledge_base_tool as rag_tool_func
+from tools.tool3_联网搜索 import web_search
+from tools.tool4_finance import get_stock_data, get_batch_stock_data
+from tools.tool6_indicators import get_technical_indicators
+from tools.tool7_screener import screen_stocks
+from tools.tool5_rag import knowledge_base_tool as rag_tool_func, current_namespace, normalize_namespace
+from tool_runtime import offload_tool
+from metrics import (
+    CHAT_REQUESTS, CHAT_DURATION, TIME_TO_FIRST_TOKEN, LLM_CALL_DURATION, REACT_ITERATIONS, PARALLEL_ACTIONS,
+)
+from history_store import get_session_history
+from history_context import build_chat_history, SUMMARY_TAG
+from router import route_query, ROUTE_DIRECT, ROUTE_CACHE
+import answer_cache
+from stream_parser import (
+    ReActStreamParser, sse_event,
+    EVENT_FINAL, EVENT_OBSERVATION, EVENT_ERROR, EVENT_DONE,
+)
 from datetime import datetime
-import pytz
 load_dotenv()
 
 
@@ -34,6 +55,19 @@ class StockInput(BaseModel):
     ticker: str = Field(description="股票代码...")
 
 
+class BatchStockInput(BaseModel):
+    tickers: str = Field(description="多个股票代码，用逗号分隔，如 '600519.SS,000858.SZ'")
+
+
+class IndicatorInput(BaseModel):
+    tickers: str = Field(description="一个或多个股票代码，用逗号分隔，如 'AAPL' 或 'AAPL,TSLA,600519.SS'")
+
+
+class ScreenerInput(BaseModel):
+    criteria: str = Field(description='JSON 字符串，如 {"universe": "AAPL,MSFT,GOOG", "filters": ["pe<20"], '
+                                      '"sort": "pe", "order": "asc", "top": 10}')
+
+
 class SearchInput(BaseModel):
     query: str = Field(description="查询关键词")
 
@@ -51,7 +85,34 @@ def stock_tool(ticker: str):
     return get_stock_data(ticker)
 
 
-search = DuckDuckGoSearchRun()
+@tool("batch_stock_tool", args_schema=BatchStockInput)
+def batch_stock_tool(tickers: str):
+    """
+    一次性查询多只股票的价格、市值、PE，返回对比表格。
+    对比两只及以上股票时优先使用本工具，一步拿到全部数据，不要逐个调用 stock_tool。
+    输入为逗号分隔的股票代码。
+    """
+    return get_batch_stock_data(tickers)
+
+
+@tool("indicator_tool", args_schema=IndicatorInput)
+def indicator_tool(tickers: str):
+    """
+    计算股票的技术指标：均线 MA5/20/60、RSI14、MACD、布林带、年化波动率，并给出超买/超卖等信号。
+    问到 超买、超卖、技术面、均线、RSI、MACD、布林、波动 时使用；多只股票一次传入，逗号分隔。
+    """
+    return get_technical_indicators(tickers)
+
+
+@tool("screener_tool", args_schema=ScreenerInput)
+def screener_tool(criteria: str):
+    """
+    股票筛选器：在一批股票 (可达数百只) 里按 PE / 市值 / 价格 / 距52周高低点 过滤和排序，一步返回前 N 名表格。
+    "从这些股票里找 PE 最低的几只" 这类问题必须用本工具，不要逐个调用 stock_tool。
+    输入为 JSON：universe 代码列表，filters 条件如 "pe<20"、"market_cap>1000" (市值单位亿)，
+    sort 可选 pe / price / market_cap / from_high / from_low，order 为 asc 或 desc，top 为返回条数。
+    """
+    return screen_stocks(criteria)
 
 
 @tool("search_tool", args_schema=SearchInput)
@@ -62,7 +123,8 @@ def search_tool(query: str):
     2. 近期财经新闻（如'Tesla latest news'）
     3. 通用知识查询
     """
-    return search.run(query)
+    # 走带缓存的搜索：相同问题 (归一化后) 在 TTL 内直接返回
+    return web_search(query)
 
 
 @tool("weather_tool", args_schema=WeatherInput)
@@ -86,6 +148,8 @@ def time_tool(any_text: str = ""):
     # 4. 我们在函数里直接无视这个参数。
 
     try:
+        import pytz
+
         tz = pytz.timezone('Asia/Shanghai')
         now = datetime.now(tz)
         return f"当前时间是：{now.strftime('%Y-%m-%d %H:%M:%S')} (星期{now.isoweekday()})"
@@ -94,7 +158,12 @@ def time_tool(any_text: str = ""):
 
 knowledge_base_tool = rag_tool_func
 
-tools = [weather_tool, time_tool, search_tool, stock_tool, knowledge_base_tool]
+# 阻塞型工具统一包一层异步执行：astream_events 走 ainvoke 时在线程池里跑，不卡事件循环
+tools = [
+    offload_tool(t)
+    for t in (weather_tool, time_tool, search_tool, stock_tool, batch_stock_tool, indicator_tool,
+              screener_tool, knowledge_base_tool)
+]
 tool_names = [t.name for t in tools]
 
 
@@ -112,27 +181,175 @@ class LooseReActParser(ReActSingleInputOutputParser):
             )
 
 
+# 一轮里允许模型连写多组 Action / Action Input，执行器 (异步路径) 会用 asyncio.gather 并发执行，
+# 这一轮的耗时取决于最慢的那个工具，而不是所有工具相加
+PARALLEL_TOOL_CALLS = os.getenv("PARALLEL_TOOL_CALLS", "1") == "1"
+# 一轮最多并发多少个工具调用，多出来的本轮不执行，scratchpad 里会用一条 Observation 告诉模型哪些被跳过了
+PARALLEL_MAX_ACTIONS = int(os.getenv("PARALLEL_MAX_ACTIONS", "4"))
+
+_ACTION_BLOCK_RE = re.compile(
+    r"Action\s*[:：][ \t]*(.*?)[ \t]*\n+\s*Action\s*Input\s*[:：][ \t]*(.*?)"
+    r"(?=\n\s*(?:Thought|Action|Observation|Final\s*Answer)\s*[:：]|\Z)",
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+class ParallelAgentAction(AgentAction):
+    """一轮并发动作里的最后一个：skipped 记录超出 PARALLEL_MAX_ACTIONS 没有执行的 (工具名, 参数)"""
+    skipped: list = []
+
+
+class MultiActionReActParser(MultiActionAgentOutputParser):
+    """
+    兼容单个 Action 的 ReAct 解析器：一轮里出现多组互不依赖的 Action 时返回动作列表。
+    第一个动作的 log 带上前面的 Thought，其余动作的 log 只有自己的 Action 块，
+    配合 format_parallel_scratchpad，每个 Observation 都紧跟在对应的 Action 后面。
+    """
+
+    def parse(self, text: str) -> Union[list, AgentFinish]:
+        blocks = list(_ACTION_BLOCK_RE.finditer(text))
+        if len(blocks) <= 1 or re.search(r"Final\s*Answer\s*[:：]", text, re.IGNORECASE):
+            step = LooseReActParser().parse(text)
+            if isinstance(step, AgentFinish):
+                return step
+            PARALLEL_ACTIONS.observe(1)
+            return [step]
+
+        actions = []
+        seen = set()
+        for i, block in enumerate(blocks[:PARALLEL_MAX_ACTIONS]):
+            tool_name = block.group(1).strip()
+            tool_input = block.group(2).strip(" ").strip('"').strip()
+            if (tool_name, tool_input) in seen:
+                continue
+            seen.add((tool_name, tool_input))
+            log = text[:block.end()] if i == 0 else block.group(0).strip()
+            actions.append(AgentAction(tool_name, tool_input, log))
+        skipped = [(b.group(1).strip(), b.group(2).strip(" ").strip('"').strip())
+                   for b in blocks[PARALLEL_MAX_ACTIONS:]]
+        if skipped:
+            last = actions[-1]
+            actions[-1] = ParallelAgentAction(tool=last.tool, tool_input=last.tool_input, log=last.log,
+                                              skipped=skipped)
+        PARALLEL_ACTIONS.observe(len(actions))
+        return actions
+
+    @property
+    def _type(self) -> str:
+        return "multi-action-react"
+
+
+def format_parallel_scratchpad(intermediate_steps) -> str:
+    """
+    和 format_log_to_str 一样拼接 Thought / Action / Observation，
+    只是同一轮并发的动作之间不插 "Thought: "，模型能看出它们是一起执行的。
+    """
+    thoughts = ""
+    for i, (action, observation) in enumerate(intermediate_steps):
+        thoughts += action.log
+        thoughts += f"\nObservation: {observation}\n"
+        skipped = getattr(action, "skipped", None)
+        if skipped:
+            calls = "；".join(f"{tool}({tool_input})" for tool, tool_input in skipped)
+            thoughts += (f"Observation: 一轮最多同时执行 {PARALLEL_MAX_ACTIONS} 个工具，以下调用没有执行，"
+                         f"如仍需要请在下一轮重新调用：{calls}\n")
+        following = intermediate_steps[i + 1][0].log if i + 1 < len(intermediate_steps) else ""
+        if not re.match(r"\s*Action\s*[:：]", following, re.IGNORECASE):
+            thoughts += "Thought: "
+    return thoughts
+
+
 # ==========================================
 # 3. 记忆管理
 # ==========================================
-store = {}
-
-
-def get_session_history(session_id: str):
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+# 会话历史由 history_store 管理：内存 LRU/TTL + 本地 SQLite，单会话有条数和 token 上限
 
 
 # ==========================================
 # 4. Agent 初始化 (🔥 核心修复区域)
 # ==========================================
-global_agent = None
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "qwen-plus")
+# 允许客户端选择的模型 (逗号分隔)。模型名会成为 LLM 客户端、准入名额和监控标签的键，
+# 不能让客户端随便传：每个新名字都会多出一份并发名额，字典和标签也会无限增长
+ALLOWED_MODELS = tuple(dict.fromkeys(
+    [m.strip() for m in os.getenv("ALLOWED_MODELS", "qwen-plus,qwen-turbo,glm-4-flash,deepseek-chat").split(",")
+     if m.strip()] + [DEFAULT_MODEL]
+))
+# 最多缓存多少套 (模型, 系统提示词) 组合的 Agent
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "16"))
+# 推给前端的工具返回最多多少字符
+OBSERVATION_PREVIEW_CHARS = int(os.getenv("OBSERVATION_PREVIEW_CHARS", "2000"))
+# 每个会话单独选择的配置最多记多少个
+SESSION_CONFIG_SIZE = int(os.getenv("SESSION_CONFIG_SIZE", "10000"))
+# 上游限流时重试只会放大压力，过载由 /chat 的准入控制 (admission.py) 负责，这里少重试
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+# 所有模型共用一套 HTTP 连接池，切换配置不会丢掉已经建好的 keep-alive 连接
+http_limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+shared_http_client = httpx.Client(limits=http_limits, timeout=60)
+shared_async_http_client = httpx.AsyncClient(limits=http_limits, timeout=60)
+
+
+class AgentRegistry:
+    """
+    预构建 Agent 的容器：
+    - llms：模型名 -> (流式主 LLM, 摘要 LLM)，同一模型的不同人设共用 (模型名只来自 ALLOWED_MODELS，数量有界)；
+    - agents：(模型名, 提示词哈希) -> Agent，LRU 淘汰；
+    - sessions：会话ID -> (模型名, 提示词)，会话级配置。
+    """
+    llms = {}
+    agents = OrderedDict()
+    sessions = OrderedDict()
+    default = (DEFAULT_MODEL, None)
+    lock = threading.Lock()
+
+
+def _prompt_key(system_prompt) -> str:
+    return hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()[:16]
+
+
+def validate_model(model_name: str) -> str:
+    """不在 ALLOWED_MODELS 里的模型名抛 ValueError"""
+    if model_name not in ALLOWED_MODELS:
+        raise ValueError(f"不支持的模型: {model_name}，可选 {', '.join(ALLOWED_MODELS)}")
+    return model_name
+
+
+def get_llm_clients(model_name: str):
+    """同一模型只创建一次 LLM 客户端"""
+    validate_model(model_name)
+    with AgentRegistry.lock:
+        if model_name not in AgentRegistry.llms:
+            llm = ChatOpenAI(
+                model=model_name,
+                temperature=0.1,
+                streaming=True,
+                max_retries=LLM_MAX_RETRIES,
+                model_kwargs={
+                    "stop": ["\nObservation:", "Observation:"]
+                },
+                http_client=shared_http_client,
+                http_async_client=shared_async_http_client,
+            )
+            # 历史摘要用的非流式小调用，打上 tag 以便在输出流里过滤掉
+            summary_llm = ChatOpenAI(
+                model=model_name,
+                temperature=0,
+                max_retries=1,
+                http_client=shared_http_client,
+                http_async_client=shared_async_http_client,
+            ).with_config(tags=[SUMMARY_TAG])
+            AgentRegistry.llms[model_name] = (llm, summary_llm)
+        return AgentRegistry.llms[model_name]
 
 
-def init_agent(model_name="qwen-plus", system_prompt=None):
-    global global_agent
+PARALLEL_HINT = """3. 需要多个互不依赖的数据 (如"杭州天气和茅台股价") -> 在同一轮里连续写多组 Action / Action Input，
+   它们会同时执行，Observation 按顺序一起返回；后一个工具要用到前一个结果时才分多轮。
+"""
+
 
+def build_agent(model_name=DEFAULT_MODEL, system_prompt=None):
+    """构建一个带记忆的 Agent (不做缓存，请通过 get_agent 获取)"""
     # 1. 设置 Prompt
     base_template = """
 【工具能力】
@@ -146,6 +363,9 @@ def init_agent(model_name="qwen-plus", system_prompt=None):
    Action: 工具名 (必须是 [{tool_names}] 之一)
    Action Input: 参数
    Observation: ...
+{parallel_hint}
+【历史对话】
+{chat_history}
 
 开始！
 
@@ -160,29 +380,28 @@ Question: {input}
 
     prompt = PromptTemplate.from_template(final_template).partial(
         tools=render_text_description(tools),
-        tool_names=", ".join([t.name for t in tools])
+        tool_names=", ".join([t.name for t in tools]),
+        parallel_hint=PARALLEL_HINT if PARALLEL_TOOL_CALLS else "",
     )
 
-    # 2. 初始化 LLM
-    llm = ChatOpenAI(
-        model=model_name,
-        temperature=0.1,
-        streaming=True,
-        max_retries=3,
-        model_kwargs={
-            "stop": ["\nObservation:", "Observation:"]
-        }
-    )
+    # 2. 获取 LLM (同一模型共享客户端)
+    llm, summary_llm = get_llm_clients(model_name)
+
+    scratchpad_formatter = format_parallel_scratchpad if PARALLEL_TOOL_CALLS else format_log_to_str
 
     # 3. 🔥 构建 Agent 链 (修复了 missing variable 问题)
-    # RunnablePassthrough.assign 负责把 intermediate_steps 转换成 agent_scratchpad
+    # RunnablePassthrough.assign 负责把 intermediate_steps 转换成 agent_scratchpad，
+    # 并把会话历史压缩到 token 预算内再填进 {chat_history}
     agent = (
             RunnablePassthrough.assign(
-                agent_scratchpad=lambda x: format_log_to_str(x["intermediate_steps"])
+                agent_scratchpad=lambda x: scratchpad_formatter(x["intermediate_steps"]),
+                chat_history=lambda x: build_chat_history(
+                    x.get("chat_history", []), x.get("session_id", ""), summary_llm
+                ),
             )
             | prompt
             | llm
-            | LooseReActParser()
+            | (MultiActionReActParser() if PARALLEL_TOOL_CALLS else LooseReActParser())
     )
 
     # 4. 创建执行器
@@ -200,34 +419,234 @@ Question: {input}
         input_messages_key="input",
         history_messages_key="chat_history",
     )
+    print(f"🧩 Agent 已构建 | 模型: {model_name}")
+    return agent_with_history
+
+
+def get_agent(model_name=None, system_prompt=None):
+    """按 (模型, 提示词哈希) 取预构建的 Agent，没有才现建，超出容量淘汰最久未用的"""
+    model_name = model_name or DEFAULT_MODEL
+    key = (model_name, _prompt_key(system_prompt))
+    with AgentRegistry.lock:
+        agent = AgentRegistry.agents.get(key)
+        if agent is not None:
+            AgentRegistry.agents.move_to_end(key)
+            return agent
+
+    agent = build_agent(model_name, system_prompt)
+    with AgentRegistry.lock:
+        # 并发构建时以先放进去的为准
+        agent = AgentRegistry.agents.setdefault(key, agent)
+        AgentRegistry.agents.move_to_end(key)
+        while len(AgentRegistry.agents) > AGENT_CACHE_SIZE:
+            AgentRegistry.agents.popitem(last=False)
+    return agent
+
 
-    global_agent = agent_with_history
+global_agent = None
+
+
+def init_agent(model_name=DEFAULT_MODEL, system_prompt=None):
+    """设置全局默认配置 (只影响之后未指定配置的请求，进行中的对话不受影响)"""
+    global global_agent
+
+    global_agent = get_agent(model_name, system_prompt)
+    AgentRegistry.default = (model_name, system_prompt)
     print(f"🔄 Agent 已更新 | 模型: {model_name}")
-    return agent_with_history
+    return global_agent
+
+
+def warmup_agent():
+    """
+    预构建默认配置的 Agent。导入本模块时不再自动构建，由启动预热在后台调用；
+    预热期间如果默认配置已被 /update_config 修改，以修改后的为准。
+    """
+    global global_agent
+
+    model_name, system_prompt = AgentRegistry.default
+    agent = get_agent(model_name, system_prompt)
+    if global_agent is None:
+        global_agent = agent
+    return agent
 
 
 # ==========================================
 # 5. 辅助函数
 # ==========================================
-init_agent()
 
 
-def update_agent_settings(model, prompt):
+def update_agent_settings(model, prompt, session_id=None):
+    """
+    更新配置：带 session_id 时只对该会话生效，否则修改全局默认配置。
+    对应的 Agent 会被预先构建好，之后的请求直接复用。模型不在 ALLOWED_MODELS 里时抛 ValueError。
+    """
+    validate_model(model)
+    if session_id:
+        get_agent(model, prompt)
+        with AgentRegistry.lock:
+            AgentRegistry.sessions[session_id] = (model, prompt)
+            AgentRegistry.sessions.move_to_end(session_id)
+            while len(AgentRegistry.sessions) > SESSION_CONFIG_SIZE:
+                AgentRegistry.sessions.popitem(last=False)
+        return f"会话 {session_id} 已切换为 {model}"
     init_agent(model_name=model, system_prompt=prompt)
     return f"Agent 已更新为 {model}"
 
 
-async def get_stream_response(query: str, session_id: str) -> AsyncIterable[str]:
+def resolve_agent_config(session_id: str, model=None, system_prompt=None):
+    """
+    请求参数 > 会话配置 > 全局默认，模型和提示词各自覆盖：只带了提示词的请求沿用会话里保存的模型。
+    请求里指定了不支持的模型时抛 ValueError。
+    """
+    if model:
+        validate_model(model)
+    with AgentRegistry.lock:
+        saved_model, saved_prompt = AgentRegistry.sessions.get(session_id, AgentRegistry.default)
+    return model or saved_model, system_prompt or saved_prompt
+
+
+async def get_direct_response(query: str, session_id: str, model: str,
+                              system_prompt: str = None) -> AsyncIterable[str]:
+    """
+    快速通道：闲聊类问题不带工具描述、不走 ReAct，直接一次流式调用。
+    对话照常写入会话历史，后续走 Agent 时上下文是连贯的。
+    """
+    llm, summary_llm = get_llm_clients(model)
+    history = get_session_history(session_id)
+    chat_history = await asyncio.to_thread(
+        build_chat_history, history.messages, session_id, summary_llm
+    )
+    messages = [
+        SystemMessage(content=f"{system_prompt or '你是一位全能智能助手。'}\n"
+                              f"请简洁自然地直接回答用户。\n\n【历史对话】\n{chat_history}"),
+        HumanMessage(content=query),
+    ]
+    answer = ""
+    async for chunk in llm.astream(messages):
+        if chunk.content:
+            answer += chunk.content
+            yield chunk.content
+    history.add_messages([HumanMessage(content=query), AIMessage(content=answer)])
+
+
+async def get_stream_response(query: str, session_id: str, model: str = None,
+                              system_prompt: str = None, namespace: str = None) -> AsyncIterable[str]:
+    """
+    以 SSE 形式输出结构化事件：thought / action / observation / final / error / done。
+    ReAct 文本在后端由状态机增量解析，前端只需要按事件类型追加增量。
+    同时记录首 token 延迟、每轮 LLM 耗时、迭代次数等指标 (见 /metrics)。
+    namespace 决定知识库工具检索哪一套索引 (通过 contextvar 传到工具线程里)。
+    走 Agent 的问题先查语义答案缓存，命中时直接按 final 事件回放答案。
+    """
+    started = time.perf_counter()
+    route = route_query(query)
+    status = "cancelled"  # 客户端中途断开时保持这个状态
+    first_token_seen = False
+
+    def mark_first_token():
+        nonlocal first_token_seen
+        if not first_token_seen:
+            first_token_seen = True
+            TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, model=model, route=route)
+
     try:
-        async for event in global_agent.astream_events(
-                {"input": query},
+        namespace = normalize_namespace(namespace)
+        current_namespace.set(namespace)
+        model, system_prompt = resolve_agent_config(session_id, model, system_prompt)
+        if route == ROUTE_DIRECT:
+            llm_started = time.perf_counter()
+            async for content in get_direct_response(query, session_id, model, system_prompt):
+                mark_first_token()
+                yield sse_event(EVENT_FINAL, {"delta": content})
+            LLM_CALL_DURATION.observe(time.perf_counter() - llm_started, model=model)
+            status = "ok"
+            yield sse_event(EVENT_DONE, {})
+            return
+
+        has_history = bool(await asyncio.to_thread(lambda: get_session_history(session_id).messages))
+        cached_answer, probe = await asyncio.to_thread(
+            answer_cache.lookup, query, model, system_prompt, namespace, has_history
+        )
+        if cached_answer is not None:
+            route = ROUTE_CACHE
+            for piece in answer_cache.replay_chunks(cached_answer):
+                mark_first_token()
+                yield sse_event(EVENT_FINAL, {"delta": piece})
+            # 照常写进会话历史，后续追问的上下文是连贯的
+            await asyncio.to_thread(
+                get_session_history(session_id).add_messages,
+                [HumanMessage(content=query), AIMessage(content=cached_answer)],
+            )
+            status = "ok"
+            yield sse_event(EVENT_DONE, {})
+            return
+
+        agent = get_agent(model, system_prompt)
+        parser = ReActStreamParser()
+        final_sent = False
+        agent_output = None
+        llm_runs = {}  # run_id -> 开始时间
+        iterations = 0
+        answer_text = ""
+        tools_used = set()
+        tool_failed = False
+        async for event in agent.astream_events(
+                {"input": query, "session_id": session_id},
                 config={"configurable": {"session_id": session_id}},
                 version="v1",
         ):
             kind = event["event"]
+            if SUMMARY_TAG in event.get("tags", []):
+                continue
+
+            if kind == "on_chat_model_start":
+                iterations += 1
+                llm_runs[event["run_id"]] = time.perf_counter()
+                parser.start_iteration()
+                continue
             if kind == "on_chat_model_stream":
                 content = event["data"]["chunk"].content
                 if content:
-                    yield content
+                    mark_first_token()
+                parsed = parser.feed(content) if content else []
+            elif kind == "on_chat_model_end":
+                llm_started = llm_runs.pop(event["run_id"], None)
+                if llm_started is not None:
+                    LLM_CALL_DURATION.observe(time.perf_counter() - llm_started, model=model)
+                parsed = parser.end_iteration()
+            elif kind == "on_tool_end":
+                output = str(event["data"].get("output", ""))
+                tools_used.add(event["name"])
+                # 工具报错 / 没查到数据时的回答不缓存
+                tool_failed = tool_failed or answer_cache.is_tool_error(output)
+                parsed = [(EVENT_OBSERVATION, {"tool": event["name"], "output": output[:OBSERVATION_PREVIEW_CHARS]})]
+            elif kind == "on_chain_end" and event["name"] == "AgentExecutor":
+                output = event["data"].get("output")
+                if isinstance(output, dict):
+                    agent_output = output.get("output")
+                continue
+            else:
+                continue
+
+            for event_type, data in parsed:
+                if event_type == EVENT_FINAL:
+                    final_sent = True
+                    answer_text += data["delta"]
+                yield sse_event(event_type, data)
+
+        REACT_ITERATIONS.observe(iterations, model=model)
+        # 比如达到最大迭代次数：模型没有输出 Final Answer，用执行器的兜底结果
+        if not final_sent and agent_output:
+            yield sse_event(EVENT_FINAL, {"delta": str(agent_output)})
+        elif probe is not None and not tool_failed:
+            # 达到最大迭代次数的兜底输出不缓存
+            await asyncio.to_thread(answer_cache.store, probe, answer_text, tools_used)
+        status = "ok"
+        yield sse_event(EVENT_DONE, {})
     except Exception as e:
-        yield f"Final Answer: 发生错误: {str(e)}"
\ No newline at end of file
+        status = "error"
+        yield sse_event(EVENT_ERROR, {"message": f"发生错误: {str(e)}"})
+        yield sse_event(EVENT_DONE, {})
+    finally:
+        CHAT_REQUESTS.inc(route=route, status=status)
+        CHAT_DURATION.observe(time.perf_counter() - started, route=route)
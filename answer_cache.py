@@ -0,0 +1,383 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ==========================================
+# 语义答案缓存：放在 Agent 前面，"茅台今天股价多少" 和 "茅台现在股价是多少" 这类
+# 意思相同的问题，在有效期内直接回放上一次的答案，不再走 ReAct 循环。
+# 分区键：(模型, 系统提示词哈希, 知识库 namespace)；分区内按问题向量的余弦相似度匹配，
+# 并且签名 (实体 + 意图) 必须一致。问题先做归一化 (公司名 -> 代码、去掉时间副词和虚词) 再算向量，
+# 说法不同的同一个问题归一化后几乎一样，相似度阈值主要用来挡住归一化没覆盖到的差异。
+# ==========================================
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+# 相似度阈值：越高越保守 (宁可不命中，也不要把别的股票的答案回放出去)
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+# 每个分区最多多少条、最多保留多少个分区
+ANSWER_CACHE_PARTITION_SIZE = int(os.getenv("ANSWER_CACHE_PARTITION_SIZE", "1000"))
+ANSWER_CACHE_PARTITIONS = int(os.getenv("ANSWER_CACHE_PARTITIONS", "64"))
+# 回放时每个 final 事件多少字符
+ANSWER_REPLAY_CHUNK = int(os.getenv("ANSWER_REPLAY_CHUNK", "32"))
+# 太长的问题基本不会重复，不缓存
+ANSWER_CACHE_MAX_QUERY_CHARS = 200
+
+# 答案用到了哪些工具决定它的"意图"和有效期 (秒)，多个工具取最短；0 表示不缓存
+# 可用环境变量覆盖，如 ANSWER_TTL_QUOTE=30
+TOOL_INTENTS = {
+    "stock_tool": "quote",
+    "batch_stock_tool": "quote",
+    "screener_tool": "quote",
+    "indicator_tool": "indicator",
+    "weather_tool": "weather",
+    "search_tool": "news",
+    "knowledge_base_tool": "knowledge_base",
+    "time_tool": "time",
+}
+_DEFAULT_TTLS = {
+    "quote": 60,
+    "indicator": 300,
+    "weather": 600,
+    "news": 1800,
+    "knowledge_base": 86400,
+    "general": 3600,  # 没用任何工具的回答
+    "time": 0,
+}
+INTENT_TTLS = {
+    intent: float(os.getenv(f"ANSWER_TTL_{intent.upper()}", str(ttl)))
+    for intent, ttl in _DEFAULT_TTLS.items()
+}
+
+# 依赖上文的问题 ("它的PE呢"、"那TSLA呢"、"继续") 答案因会话而异，不参与缓存。
+# 会话里已经有历史时，只有点名了具体实体 (代码 / 公司 / 城市) 的问题才走缓存 (见 cacheable)
+_CONTEXT_REF_RE = re.compile(r"它|他|她|这只|那只|这个|那个|这些|那些|上面|上述|刚才|刚刚|之前|前面|继续|接着|"
+                             r"还有呢|然后呢|^那|呢$")
+
+# 实体别名 -> 规范名：同一只股票的不同叫法归到同一个代码上，城市名原样保留。
+# 不在表里的公司名不会被识别成实体，只能靠相似度阈值区分；可以用 ANSWER_CACHE_ALIASES 指向一个
+# {"别名": "规范名"} 的 JSON 文件补充
+ENTITY_ALIASES = {
+    "贵州茅台": "600519.SS", "茅台": "600519.SS",
+    "五粮液": "000858.SZ", "泸州老窖": "000568.SZ", "老窖": "000568.SZ", "山西汾酒": "600809.SS", "汾酒": "600809.SS",
+    "宁德时代": "300750.SZ", "比亚迪": "002594.SZ", "中国平安": "601318.SS", "招商银行": "600036.SS",
+    "工商银行": "601398.SS", "中国石油": "601857.SS", "隆基绿能": "601012.SS", "美的集团": "000333.SZ",
+    "格力电器": "000651.SZ", "海康威视": "002415.SZ", "恒瑞医药": "600276.SS", "东方财富": "300059.SZ",
+    "腾讯控股": "00700.HK", "腾讯": "00700.HK", "阿里巴巴": "BABA", "阿里": "BABA", "美团": "03690.HK",
+    "小米集团": "01810.HK", "小米": "01810.HK", "京东": "JD", "百度": "BIDU", "拼多多": "PDD", "网易": "NTES",
+    "苹果": "AAPL", "apple": "AAPL", "特斯拉": "TSLA", "tesla": "TSLA", "英伟达": "NVDA", "nvidia": "NVDA",
+    "微软": "MSFT", "microsoft": "MSFT", "谷歌": "GOOGL", "google": "GOOGL", "亚马逊": "AMZN", "amazon": "AMZN",
+    "脸书": "META", "meta": "META",
+    "北京": "北京", "上海": "上海", "广州": "广州", "深圳": "深圳", "杭州": "杭州", "南京": "南京", "苏州": "苏州",
+    "成都": "成都", "重庆": "重庆", "武汉": "武汉", "西安": "西安", "天津": "天津", "长沙": "长沙", "郑州": "郑州",
+    "青岛": "青岛", "厦门": "厦门", "香港": "香港", "纽约": "纽约", "伦敦": "伦敦", "东京": "东京",
+}
+_ALIASES_FILE = os.getenv("ANSWER_CACHE_ALIASES", "")
+if _ALIASES_FILE and os.path.exists(_ALIASES_FILE):
+    with open(_ALIASES_FILE, encoding="utf-8") as f:
+        ENTITY_ALIASES.update(json.load(f))
+# 长的别名优先匹配 ("贵州茅台" 先于 "茅台")；英文别名要整词匹配 ("meta" 不能匹配 "metadata")
+_ALIAS_RE = re.compile(
+    "|".join(rf"(?<![A-Za-z]){re.escape(a)}(?![A-Za-z])" if a.isascii() else re.escape(a)
+             for a in sorted(ENTITY_ALIASES, key=len, reverse=True)),
+    re.IGNORECASE,
+)
+_ALIAS_LOOKUP = {alias.lower(): name for alias, name in ENTITY_ALIASES.items()}
+
+# 意图：问的是行情、指标还是天气…… 同一个实体不同意图的答案不能互相回放
+INTENT_KEYWORDS = {
+    "indicator": r"rsi|macd|kdj|均线|布林|超买|超卖|技术面|技术指标|指标",
+    "screener": r"筛选|选股|排名|最低|最高|前\d+",
+    "quote": r"股价|价格|行情|报价|涨|跌|市值|市盈率|市盈|pe|price|quote",
+    "weather": r"天气|气温|温度|下雨|下雪|weather",
+    "news": r"新闻|消息|公告|news",
+    "knowledge_base": r"文档|文件|报告|年报|财报|知识库|pdf",
+    "time": r"几点|时间|日期|星期",
+}
+_INTENT_RES = {intent: re.compile(pattern, re.IGNORECASE) for intent, pattern in INTENT_KEYWORDS.items()}
+
+# A 股 6 位、港股 5 位代码，后缀可有可无 ("600519" / "600519.SH" / "600519.SS" 都归到 600519.SS)
+_CODE_RE = re.compile(r"(?<![\d.])(\d{6}|\d{5})(?:\.(SS|SH|SZ|HK))?(?!\d)", re.IGNORECASE)
+# 大写字母代码 (AAPL、BRK.B)；小写英文单词不当成代码
+_UPPER_TICKER_RE = re.compile(r"(?<![A-Za-z])[A-Z]{2,5}(?:\.[A-Z]{1,2})?(?![A-Za-z])")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_FILLER_RE = re.compile(
+    r"今天|今日|现在|目前|当前|此刻|最新|实时|请问|麻烦|帮我|帮忙|给我|告诉我|一下|查询|查查|查看|查|看看|"
+    r"多少|怎么样|如何|什么|情况|是|的|了|吗|呢|吧|啊|呀|么"
+)
+_SEPARATOR_RE = re.compile(r"[\s!！?？。，,、~～…:：;；]+")
+
+# 工具出错 / 没查到数据时返回的文字 (各工具 except 分支和空结果分支的开头)，这种回答不缓存
+TOOL_ERROR_PREFIXES = (
+    "错误：", "接口调用出错", "天气查询服务暂无数据", "未找到城市",
+    "搜索失败",
+    "获取股票数据失败", "未找到代码为", "请提供至少一个股票代码", "一次最多",
+    "检索时发生错误", "当前知识库为空", "知识库里没找到相关信息",
+    "计算技术指标失败", "筛选失败", "筛选条件有误",
+)
+# 批量工具的表格里某几行出错 ("| AAPL | 获取失败: ... |")
+_TOOL_ERROR_RE = re.compile(r"失败|出错|错误")
+
+
+def _prompt_key(system_prompt) -> str:
+    return hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _canonical_code(match) -> str:
+    code, suffix = match.group(1), (match.group(2) or "").upper()
+    if len(code) == 5 or suffix == "HK":
+        return f"{code}.HK"
+    if suffix == "SZ" or (not suffix and code[0] not in "69"):
+        return f"{code}.SZ"
+    return f"{code}.SS"
+
+
+def normalize(query: str) -> tuple:
+    """
+    返回 (归一化后的问题, 签名)。
+    归一化：别名换成规范代码、代码补全后缀、去掉时间副词 / 疑问词 / 语气词和标点，
+    "茅台今天股价多少" 和 "贵州茅台现在股价" 都变成 "600519.SS股价"。
+    签名：(实体集合, 意图集合)，实体 = 规范代码 / 城市 / 问题里的其他数字 ("前10只" 和 "前5只" 不同)。
+    """
+    entities = set()
+
+    def alias(match):
+        name = _ALIAS_LOOKUP[match.group(0).lower()]
+        entities.add(name)
+        return f" {name} "
+
+    def code(match):
+        name = _canonical_code(match)
+        entities.add(name)
+        return f" {name} "
+
+    text = _ALIAS_RE.sub(alias, query)
+    text = _CODE_RE.sub(code, text)
+    intents = frozenset(intent for intent, pattern in _INTENT_RES.items() if pattern.search(text))
+    # 剩下的大写代码里去掉指标名 ("PE"、"RSI" 属于意图，不是实体)
+    for token in _UPPER_TICKER_RE.findall(_CODE_RE.sub(" ", text)):
+        if not any(pattern.fullmatch(token) for pattern in _INTENT_RES.values()):
+            entities.add(token)
+    rest = _UPPER_TICKER_RE.sub(" ", _CODE_RE.sub(" ", text))
+    entities.update(_NUMBER_RE.findall(rest))
+
+    text = _SEPARATOR_RE.sub(" ", _FILLER_RE.sub("", text)).strip().upper()
+    text = re.sub(r" ?([\u4e00-\u9fff]+) ?", r"\1", text)
+    return text, (frozenset(entities), intents)
+
+
+def _signature(query: str) -> tuple:
+    return normalize(query)[1]
+
+
+def cacheable(query: str, has_history: bool = False) -> bool:
+    """
+    追问 ("它的PE呢") 不走缓存。会话里已经有历史时，Agent 的回答可能依赖 chat_history，
+    只有点名了具体实体的问题 ("茅台股价多少") 才走缓存，"PE多少" 这种在不同会话里指的是不同的股票
+    """
+    query = (query or "").strip()
+    if not (ANSWER_CACHE_ENABLED and 0 < len(query) <= ANSWER_CACHE_MAX_QUERY_CHARS
+            and not _CONTEXT_REF_RE.search(query)):
+        return False
+    # 光有数字 ("前10只") 不算点名，可能是在接着上文的股票池问
+    return not has_history or any(not _NUMBER_RE.fullmatch(e) for e in _signature(query)[0])
+
+
+def is_tool_error(output: str) -> bool:
+    """工具返回的是报错 / 空结果"""
+    output = (output or "").strip()
+    return output.startswith(TOOL_ERROR_PREFIXES) or bool(_TOOL_ERROR_RE.search(output[:200]))
+
+
+def answer_ttl(tools_used) -> float:
+    """按用到的工具取最短的意图有效期"""
+    intents = {TOOL_INTENTS.get(name, "general") for name in tools_used} or {"general"}
+    return min(INTENT_TTLS.get(intent, INTENT_TTLS["general"]) for intent in intents)
+
+
+class AnswerCache:
+    """
+    分区键 -> {"vectors": (n, d) 归一化向量矩阵, "entries": [条目...]}，分区按最近使用淘汰。
+    条目：{"query", "answer", "signature", "expire_at", "kb_version", "hits"}
+    """
+    partitions = OrderedDict()
+    lock = threading.Lock()
+    hits = 0
+    misses = 0
+    stores = 0
+
+
+class Probe:
+    """一次查找的上下文：没命中时留着，回答完成后直接用它写回，不用再算一遍向量"""
+
+    def __init__(self, key: tuple, query: str, vector: np.ndarray, signature: tuple):
+        self.key = key
+        self.query = query
+        self.vector = vector
+        self.signature = signature
+
+
+# ==========================================
+# 1. 向量
+# ==========================================
+def _embed(query: str):
+    """复用知识库的 Embedding 模型；模型还没加载好 (预热中) 时返回 None，本次不走缓存"""
+    from tools.tool5_rag import RAGStorage
+
+    embeddings = RAGStorage.embeddings
+    if embeddings is None:
+        return None
+    vector = np.asarray(embeddings.embed_query(query), dtype="float32")
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+def _kb_version(namespace: str) -> str:
+    from tools.tool5_rag import get_kb_version
+
+    return get_kb_version(namespace)
+
+
+# ==========================================
+# 2. 查找 / 写回
+# ==========================================
+def lookup(query: str, model: str, system_prompt: str, namespace: str, has_history: bool = False):
+    """
+    返回 (answer, probe)：命中时 answer 为缓存的答案；
+    没命中时 answer 为 None，probe 用于回答完成后 store (不可缓存时 probe 也为 None)。
+    has_history：该会话已有对话历史，此时只有点名了具体实体的问题才查 / 写缓存。
+    """
+    if not cacheable(query, has_history):
+        return None, None
+    query = query.strip()
+    normalized, signature = normalize(query)
+    # 用归一化后的问题算向量，同一个问题的不同说法相似度接近 1
+    vector = _embed(normalized or query)
+    if vector is None:
+        return None, None
+    probe = Probe((model, _prompt_key(system_prompt), namespace), query, vector, signature)
+
+    with AnswerCache.lock:
+        partition = AnswerCache.partitions.get(probe.key)
+        candidates = []
+        if partition is not None and len(partition["entries"]):
+            AnswerCache.partitions.move_to_end(probe.key)
+            _purge_expired(partition)
+            if partition["entries"]:
+                scores = partition["vectors"] @ vector
+                for idx in np.argsort(-scores):
+                    if scores[idx] < ANSWER_CACHE_THRESHOLD:
+                        break
+                    entry = partition["entries"][idx]
+                    if entry["signature"] == probe.signature:
+                        candidates.append(entry)
+
+    # 用到知识库的答案，要确认知识库内容没变过 (读清单在锁外做)
+    for entry in candidates:
+        if entry["kb_version"] is None or entry["kb_version"] == _kb_version(namespace):
+            with AnswerCache.lock:
+                entry["hits"] += 1
+                AnswerCache.hits += 1
+            return entry["answer"], probe
+    with AnswerCache.lock:
+        AnswerCache.misses += 1
+    return None, probe
+
+
+def store(probe: Probe, answer: str, tools_used) -> bool:
+    """回答完成后写回；有效期为 0 (比如问了时间) 或答案为空时不缓存"""
+    ttl = answer_ttl(tools_used)
+    if probe is None or ttl <= 0 or not (answer or "").strip():
+        return False
+    kb_version = _kb_version(probe.key[2]) if "knowledge_base_tool" in tools_used else None
+    entry = {
+        "query": probe.query,
+        "answer": answer,
+        "signature": probe.signature,
+        "expire_at": time.monotonic() + ttl,
+        "kb_version": kb_version,
+        "hits": 0,
+    }
+    with AnswerCache.lock:
+        partition = AnswerCache.partitions.get(probe.key)
+        if partition is None:
+            partition = AnswerCache.partitions[probe.key] = {
+                "vectors": np.empty((0, len(probe.vector)), dtype="float32"),
+                "entries": [],
+            }
+        AnswerCache.partitions.move_to_end(probe.key)
+        _purge_expired(partition)
+        partition["vectors"] = np.vstack([partition["vectors"], probe.vector[None, :]])
+        partition["entries"].append(entry)
+        overflow = len(partition["entries"]) - ANSWER_CACHE_PARTITION_SIZE
+        if overflow > 0:
+            partition["vectors"] = partition["vectors"][overflow:]
+            partition["entries"] = partition["entries"][overflow:]
+        while len(AnswerCache.partitions) > ANSWER_CACHE_PARTITIONS:
+            AnswerCache.partitions.popitem(last=False)
+        AnswerCache.stores += 1
+    return True
+
+
+def _purge_expired(partition: dict):
+    """调用方需持有 AnswerCache.lock"""
+    now = time.monotonic()
+    keep = [i for i, e in enumerate(partition["entries"]) if e["expire_at"] > now]
+    if len(keep) != len(partition["entries"]):
+        partition["vectors"] = partition["vectors"][keep]
+        partition["entries"] = [partition["entries"][i] for i in keep]
+
+
+def replay_chunks(answer: str) -> list:
+    """把缓存的答案切成小段，按 final 事件逐段推给前端"""
+    return [answer[i:i + ANSWER_REPLAY_CHUNK] for i in range(0, len(answer), ANSWER_REPLAY_CHUNK)]
+
+
+def invalidate():
+    with AnswerCache.lock:
+        AnswerCache.partitions.clear()
+
+
+def get_answer_cache_stats() -> dict:
+    with AnswerCache.lock:
+        total = AnswerCache.hits + AnswerCache.misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "threshold": ANSWER_CACHE_THRESHOLD,
+            "partitions": len(AnswerCache.partitions),
+            "entries": sum(len(p["entries"]) for p in AnswerCache.partitions.values()),
+            "hits": AnswerCache.hits,
+            "misses": AnswerCache.misses,
+            "stores": AnswerCache.stores,
+            "hit_rate": round(AnswerCache.hits / total, 4) if total else 0.0,
+            "ttls": INTENT_TTLS,
+        }
+
+
+if __name__ == "__main__":
+    # 自测：同一个问题的不同说法命中同一条缓存，不同股票 / 不同意图不命中
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    from tools.tool5_rag import RAGStorage
+
+    RAGStorage.embeddings = DeterministicFakeEmbedding(size=64)
+    assert normalize("茅台今天股价多少") == normalize("贵州茅台现在股价")
+    assert _signature("茅台今天股价多少") != _signature("五粮液今天股价多少")
+    assert _signature("茅台股价") != _signature("茅台RSI")
+    assert _signature("meta股价")[0] == {"META"} and not _signature("metadata")[0]
+    assert cacheable("茅台股价多少", has_history=True)
+    assert not cacheable("PE多少", has_history=True) and not cacheable("那五粮液呢")
+
+    args = ("qwen-plus", None, "default")
+    answer, probe = lookup("茅台今天股价多少", *args)
+    assert answer is None and store(probe, "贵州茅台 (600519.SS) 当前价格 1500", ["stock_tool"])
+    for query, expected in [("贵州茅台现在股价", True), ("茅台现在股价是多少？", True), ("600519股价", True),
+                            ("五粮液今天股价多少", False), ("茅台RSI多少", False)]:
+        answer, _ = lookup(query, *args, has_history=True)
+        print(f"{'✅' if (answer is not None) == expected else '❌'} {query} -> {'命中' if answer else '未命中'}")
+    print(get_answer_cache_stats())
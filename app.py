@@ -1,9 +1,9 @@
 import streamlit as st
 import requests
 import uuid
-import yfinance as yf
 import pandas as pd
-import re
+import json
+import time
 
 # 1. 页面配置
 st.set_page_config(page_title="智能助手 Pro", page_icon="🤖", layout="wide")
@@ -15,14 +15,24 @@ if "session_id" not in st.session_state:
 if "history" not in st.session_state:
     st.session_state.history = []
 
+# 通过 /update_config 保存到后端的会话配置 (模型, 提示词)
+if "saved_config" not in st.session_state:
+    st.session_state.saved_config = None
+
 
 def clear_history():
     st.session_state.history = []
     st.session_state.session_id = str(uuid.uuid4())
+    st.session_state.saved_config = None
 
 
 # 后端地址
 BACKEND_URL = "http://127.0.0.1:8000"
+# 等待后台入库任务的最长时间 (秒)，超时后任务仍在后台继续，可稍后在文档列表里查看
+UPLOAD_POLL_TIMEOUT = 600
+# 流式输出时两次重绘之间的最小间隔 (秒)：每次重绘都要把整段文本重新渲染成 markdown，
+# 逐个增量重绘的总开销随回答长度平方增长
+STREAM_RENDER_INTERVAL = 0.1
 
 # 3. 侧边栏
 with st.sidebar:
@@ -36,21 +46,57 @@ with st.sidebar:
 
         if st.button("🔄 更新 Agent 配置"):
             try:
+                # 只对当前会话生效，不影响其他用户
                 res = requests.post(f"{BACKEND_URL}/update_config", json={
                     "model": selected_model,
-                    "system_prompt": system_prompt
+                    "system_prompt": system_prompt,
+                    "session_id": st.session_state.session_id
                 })
                 if res.status_code == 200:
+                    # 记下已保存的配置，之后对话时和它一致就不再随请求发送
+                    st.session_state.saved_config = (selected_model, system_prompt)
                     st.success("配置已生效！")
             except Exception as e:
                 st.error(f"连接失败: {e}")
 
     with st.expander("📚 知识库管理", expanded=False):
+        # 不同 namespace 的文档互相隔离，对话时只检索当前 namespace
+        kb_namespace = st.text_input("知识库 namespace", value="default")
         uploaded_file = st.file_uploader("上传 PDF", type=["pdf"])
         if uploaded_file and st.button("📂 上传"):
             files = {"file": (uploaded_file.name, uploaded_file, "application/pdf")}
-            requests.post(f"{BACKEND_URL}/upload", files=files)
-            st.success("上传成功")
+            res = requests.post(f"{BACKEND_URL}/upload", files=files, data={"namespace": kb_namespace})
+            if res.status_code == 202:
+                job_id = res.json()["job"]["job_id"]
+                progress_bar = st.progress(0, text="排队中...")
+                # 轮询后台任务进度
+                deadline = time.time() + UPLOAD_POLL_TIMEOUT
+                job = None
+                while time.time() < deadline:
+                    job_res = requests.get(f"{BACKEND_URL}/jobs/{job_id}", timeout=10)
+                    if job_res.status_code == 404:
+                        # 后端重启过，或任务记录已被清理
+                        job = None
+                        break
+                    job = job_res.json()
+                    if job["status"] in ("done", "failed"):
+                        break
+                    if job["total"]:
+                        progress_bar.progress(job["done"] / job["total"],
+                                              text=f"处理中: {job['done']}/{job['total']} 页，"
+                                                   f"已向量化 {job['chunks']} 个片段")
+                    time.sleep(0.5)
+                progress_bar.empty()
+                if job is None:
+                    st.error("入库任务已不存在 (后端可能已重启)，请到文档列表确认后重新上传")
+                elif job["status"] == "done":
+                    st.success("上传成功")
+                elif job["status"] == "failed":
+                    st.error(f"知识库构建失败: {job['error']}")
+                else:
+                    st.warning("入库仍在后台进行中，请稍后在文档列表中查看")
+            else:
+                st.error(f"上传失败: {res.text}")
 
     st.divider()
     st.subheader("📈 市场观察")
@@ -58,12 +104,12 @@ with st.sidebar:
     if st.button("生成K线图"):
         try:
             with st.spinner("正在加载数据..."):
-                # 获取历史数据
-                stock = yf.Ticker(ticker_input)
-                # 获取最近 3 个月数据
-                hist = stock.history(period="3mo")
+                # 获取最近 3 个月数据 (后端走本地行情缓存，只增量拉新 K 线)
+                res = requests.get(f"{BACKEND_URL}/history", params={"ticker": ticker_input, "period": "3mo"})
+                hist = pd.DataFrame(res.json()["columns"]) if res.status_code == 200 else pd.DataFrame()
 
                 if not hist.empty:
+                    hist = hist.rename(columns={"close": "Close"}).set_index("date")
                     st.success(f"{ticker_input} 近3个月走势")
                     # Streamlit 自带的折线图，非常丝滑
                     st.line_chart(hist['Close'])
@@ -91,56 +137,24 @@ for role, msg in st.session_state.history:
 
 
 # ==========================================
-# 🔥 核心：强力清洗函数
+# 🔥 核心：SSE 事件读取
 # ==========================================
-def parse_agent_output(text):
+def iter_sse_events(response):
     """
-    将后端返回的混合文本拆分为 (思考过程, 最终答案)
+    逐条读取后端推送的 SSE 事件，产出 (事件类型, 数据字典)。
+    ReAct 文本已经在后端解析好了，这里只负责拆包。
     """
-    # 1. 优先尝试寻找标准的 "Final Answer:" 分界线
-    split_pattern = r"(?i)Final\s*Answer\s*[:：]|Answer\s*[:：]|回答\s*[:：]"
-    match = re.search(split_pattern, text)
-    if match:
-        thought = text[:match.start()].strip()
-        answer = text[match.end():].strip()
-        return thought, answer
-
-    # 2. 如果没找到 Final Answer，尝试切除 ReAct 的技术日志
-    # 优化正则：不再贪婪地吃掉 Action Input 后的所有内容
-    # 逻辑：找到 "Action Input:"，只吃掉它前面的部分，保留后面的内容作为潜在答案
-
-    # 查找最后一次出现的 Action Input
-    action_input_pattern = r"(?i)Action\s*Input\s*[:：]"
-    matches = list(re.finditer(action_input_pattern, text))
-
-    if matches:
-        last_match = matches[-1]
-        # split_point 是 "Action Input:" 这个词结束的位置
-        split_point = last_match.end()
-
-        # 提取 "Action Input:" 之后的内容
-        potential_answer = text[split_point:].strip()
-
-        # 简单的启发式规则：
-        # 如果 Action Input 后面跟着的内容很短（比如只是个城市名 "杭州"），那它可能是参数，不是答案，我们把它归为思考。
-        # 如果内容很长（比如 "现在是2025年..."），那它大概率是模型偷懒直接给出的答案。
-        if len(potential_answer) > 20:  # 阈值设为 20 个字符
-            thought = text[:split_point].strip()
-            answer = potential_answer
-            return thought, answer
-
-        # 否则，按照老规矩，把整行都当成思考（配合换行符）
-        react_end_pattern = r"Thought:[\s\S]*?Action\s*Input\s*[:：].*?(\n|$)"
-        match = re.search(react_end_pattern, text)
-        if match:
-            return text[:match.end()].strip(), text[match.end():].strip()
-
-    # 3. 如果既没 Final Answer 也没 Thought，那全是答案 (比如闲聊)
-    if not text.strip().startswith("Thought:"):
-        return "", text
-
-    # 4. 兜底：如果是纯思考，但流已经结束了（在外部调用逻辑中处理），这里暂且返回原样
-    return text, ""
+    event_type, data_lines = None, []
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line is None:
+            continue
+        if line.startswith("event:"):
+            event_type = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+        elif line == "" and event_type:
+            yield event_type, json.loads("\n".join(data_lines) or "{}")
+            event_type, data_lines = None, []
 
 
 # 5. 输入处理逻辑
@@ -155,51 +169,70 @@ if prompt := st.chat_input("请输入问题..."):
             thought_placeholder = st.empty()
 
         answer_placeholder = st.empty()
-        full_buffer = ""
-        final_answer_text = ""
+        thought_text = ""
+        answer = ""
+        last_render = 0.0
+        answering = False
 
         try:
-            payload = {"query": prompt, "session_id": st.session_state.session_id}
+            payload = {
+                "query": prompt,
+                "session_id": st.session_state.session_id,
+                "namespace": kb_namespace,
+            }
+            # 侧边栏的选择和已保存的会话配置一致时不随请求发送，由后端按会话配置处理；
+            # 改了但还没点"更新"时，本次请求临时使用侧边栏的选择
+            if st.session_state.saved_config != (selected_model, system_prompt):
+                payload["model"] = selected_model
+                payload["system_prompt"] = system_prompt
 
             with requests.post(f"{BACKEND_URL}/chat", json=payload, stream=True) as r:
                 if r.status_code == 200:
-                    if check_stream:
-                        for chunk in r.iter_content(chunk_size=None, decode_unicode=True):
-                            if chunk:
-                                full_buffer += chunk
-
-                                # 🔥 调用清洗函数
-                                thought, answer = parse_agent_output(full_buffer)
-
-                                # 更新 UI
-                                if thought:
-                                    thought_placeholder.markdown(thought)
-
-                                if answer:
-                                    # 一旦有了答案，就把思考框关掉
-                                    status_box.update(label="✅ 思考完毕", state="complete", expanded=False)
-                                    answer_placeholder.markdown(answer + "▌")
-                                    final_answer_text = answer
-                                else:
-                                    # 还没答案，说明还在想
-                                    status_box.update(label="🤔 智能体正在思考...", state="running", expanded=True)
-
-                        # 循环结束
-                        # 再次清洗，确保最终结果正确
-                        thought, answer = parse_agent_output(full_buffer)
-                        if not answer and full_buffer and not thought:
-                            # 兜底：如果全是答案
-                            answer = full_buffer
-
-                        answer_placeholder.markdown(answer)
-                        status_box.update(label="✅ 完成", state="complete", expanded=False)
-                        st.session_state.history.append(("ai", answer))
-
-                    else:
-                        st.markdown(r.text)
+                    for event_type, data in iter_sse_events(r):
+                        # 每个事件只追加增量，不再反复解析整段文本
+                        if event_type == "thought":
+                            thought_text += data["delta"]
+                        elif event_type == "action":
+                            thought_text += f"\n\n🔧 调用 `{data['tool']}`：{data['input']}\n\n"
+                        elif event_type == "observation":
+                            thought_text += f"> {data['output'][:300]}\n\n"
+                        elif event_type == "final":
+                            answer += data["delta"]
+                        elif event_type == "error":
+                            answer += data["message"]
+                        else:
+                            continue
+
+                        if not check_stream:
+                            continue
+                        if event_type in ("final", "error") and not answering:
+                            # 一旦有了答案，就把思考框关掉 (只在切换时更新一次)
+                            answering = True
+                            thought_placeholder.markdown(thought_text)
+                            status_box.update(label="✅ 思考完毕", state="complete", expanded=False)
+                        # 按时间节流，没画上的增量留到下一次或循环结束后一起画
+                        now = time.time()
+                        if now - last_render < STREAM_RENDER_INTERVAL:
+                            continue
+                        last_render = now
+                        if event_type in ("thought", "action", "observation"):
+                            thought_placeholder.markdown(thought_text)
+                        else:
+                            answer_placeholder.markdown(answer + "▌")
+
+                    # 循环结束
+                    thought_placeholder.markdown(thought_text)
+                    answer_placeholder.markdown(answer)
+                    status_box.update(label="✅ 完成", state="complete", expanded=False)
+                    st.session_state.history.append(("ai", answer))
+                elif r.status_code in (429, 503):
+                    # 后端过载：按 Retry-After 提示用户稍后重试
+                    retry_after = r.headers.get("Retry-After", "几")
+                    status_box.update(label="⏳ 服务繁忙", state="error")
+                    st.warning(f"当前请求较多，请 {retry_after} 秒后重试。")
                 else:
                     st.error(f"错误: {r.text}")
 
         except Exception as e:
             status_box.update(label="❌ 错误", state="error")
-            st.error(f"连接失败: {e}")
\ No newline at end of file
+            st.error(f"连接失败: {e}")
@@ -0,0 +1,152 @@
+"""
+压测用的假数据后端：替换 yfinance / 高德 / DuckDuckGo / HuggingFace Embedding，
+每次调用按配置 sleep 一段时间模拟网络延迟，不访问外网。
+必须在 import main 之后、发请求之前调用 install()。
+"""
+import hashlib
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+from langchain_core.embeddings import Embeddings
+
+FAKE_EMBEDDING_DIM = 384
+
+
+class FakeLatency:
+    """各后端的模拟延迟 (秒)，实际延迟在 [0.5x, 1.5x] 之间抖动"""
+    quote = 0.3
+    history = 0.5
+    weather = 0.15
+    search = 0.8
+
+    @staticmethod
+    def sleep(seconds: float):
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(0.5, 1.5))
+
+
+# ==========================================
+# 1. 行情 / 天气 / 搜索
+# ==========================================
+def fake_fetch_quote(ticker: str):
+    FakeLatency.sleep(FakeLatency.quote)
+    seed = int(hashlib.md5(ticker.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    price = round(rng.uniform(5, 2000), 2)
+    return {
+        "longName": f"Fake Corp {ticker}",
+        "currentPrice": price,
+        "currency": "CNY",
+        "marketCap": rng.randint(10 ** 9, 3 * 10 ** 12),
+        "trailingPE": round(rng.uniform(5, 60), 2),
+        "fiftyTwoWeekHigh": round(price * 1.3, 2),
+        "fiftyTwoWeekLow": round(price * 0.7, 2),
+    }
+
+
+def fake_fetch_history(ticker: str, start=None):
+    """确定性的随机游走日线，签名与 price_history._fetch 一致"""
+    FakeLatency.sleep(FakeLatency.history)
+    end = pd.Timestamp.today().normalize()
+    dates = pd.bdate_range(pd.Timestamp(start) if start else end - pd.Timedelta(days=3650), end)
+    seed = int(hashlib.md5(ticker.encode("utf-8")).hexdigest()[:8], 16)
+    rng = np.random.default_rng(seed)
+    # 整段历史用同一个种子生成，增量拉取时和之前存下的部分能对上
+    full = pd.bdate_range(end - pd.Timedelta(days=3650), end)
+    close = pd.Series(100 * np.exp(np.cumsum(rng.normal(0, 0.015, len(full)))), index=full).reindex(dates)
+    frame = pd.DataFrame({
+        "date": dates,
+        "open": close.to_numpy() * 0.995,
+        "high": close.to_numpy() * 1.01,
+        "low": close.to_numpy() * 0.99,
+        "close": close.to_numpy(),
+        "volume": np.full(len(dates), 1e6),
+    })
+    return frame, []
+
+
+class _FakeResponse:
+    def __init__(self, payload: dict):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class FakeAmapSession:
+    """只实现天气工具用到的 session.get"""
+
+    def get(self, url, params=None, timeout=None):
+        FakeLatency.sleep(FakeLatency.weather)
+        params = params or {}
+        if "district" in url:
+            name = params.get("keywords", "")
+            adcode = str(330000 + int(hashlib.md5(name.encode("utf-8")).hexdigest()[:4], 16) % 1000)
+            return _FakeResponse({"status": "1", "districts": [{"adcode": adcode, "name": name}]})
+        return _FakeResponse({"status": "1", "lives": [{
+            "province": "浙江", "city": params.get("city", ""), "weather": "多云",
+            "temperature": "22", "winddirection": "东南", "windpower": "≤3",
+            "humidity": "65", "reporttime": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }]})
+
+
+class FakeSearchEngine:
+    def run(self, query: str) -> str:
+        FakeLatency.sleep(FakeLatency.search)
+        return f"[fake] Top results for '{query}': company announced quarterly results; analysts raised targets."
+
+
+# ==========================================
+# 2. Embedding
+# ==========================================
+class FakeHashEmbeddings(Embeddings):
+    """
+    按词哈希生成的确定性向量，CPU 开销很小，用来单独测量解析 + 切分 + FAISS 的吞吐。
+    想把真实模型的编码耗时算进去时，run_bench 加 --real-embeddings 即可。
+    """
+
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list:
+        vec = np.zeros(self.dim, dtype="float32")
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16) % self.dim] += 1.0
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self._embed(text)
+
+
+def install(quote: float = None, weather: float = None, search: float = None,
+            fake_embeddings: bool = True):
+    """把各工具的外部依赖替换成本地假实现"""
+    import tools.tool1_天气查询 as weather_module
+    import tools.tool3_联网搜索 as search_module
+    import tools.tool4_finance as finance_module
+    import tools.price_history as history_module
+    from tools.tool5_rag import RAGStorage
+
+    if quote is not None:
+        FakeLatency.quote = quote
+    if weather is not None:
+        FakeLatency.weather = weather
+    if search is not None:
+        FakeLatency.search = search
+
+    os.environ["API_KEY"] = "bench-fake-key"
+    finance_module._fetch_quote = fake_fetch_quote
+    history_module._fetch = fake_fetch_history
+    weather_module.session = FakeAmapSession()
+    search_module.search_engine = FakeSearchEngine()
+    if fake_embeddings:
+        RAGStorage.embeddings = FakeHashEmbeddings()
+    print(f"🧪 已安装假后端 | quote={FakeLatency.quote}s weather={FakeLatency.weather}s "
+          f"search={FakeLatency.search}s fake_embeddings={fake_embeddings}")
@@ -0,0 +1,140 @@
+"""
+本地假 LLM 服务：兼容 OpenAI /v1/chat/completions (含流式)，按问题关键词输出预设的 ReAct 文本。
+压测时替代真实的大模型接口，延迟可配置，结果可复现。
+
+    python bench/fake_llm_server.py --port 9001 --first-token-ms 200 --token-ms 10
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FakeLLMConfig:
+    first_token_ms = 200  # 首 token 延迟
+    token_ms = 10  # 每个 token 的间隔
+    chars_per_token = 2
+    answer_chars = 300  # 最终答案的大致长度
+
+
+# 问题关键词 -> (工具名, 参数)
+SCRIPTED_ACTIONS = [
+    (("超买", "超卖", "技术面"), "indicator_tool", "600519.SS,AAPL"),
+    (("筛选", "选股"), "screener_tool",
+     '{"universe": "' + ",".join(f"{600000 + i}.SS" for i in range(200)) + '", "filters": ["pe<30"], "sort": "pe", "top": 10}'),
+    (("对比", "比较"), "batch_stock_tool", "600519.SS,000858.SZ,000568.SZ"),
+    (("股价", "价格", "市值"), "stock_tool", "600519.SS"),
+    (("天气",), "weather_tool", "杭州"),
+    (("新闻", "消息"), "search_tool", "Tesla latest news"),
+    (("报告", "文档", "知识库"), "knowledge_base_tool", "revenue growth"),
+    (("几点", "时间"), "time_tool", ""),
+]
+
+FILLER = "根据查询结果，综合基本面与近期走势来看，整体表现稳健，建议结合自身风险偏好审慎决策。"
+
+
+def _last_question(prompt: str) -> str:
+    matches = re.findall(r"Question:\s*(.*)", prompt)
+    return matches[-1] if matches else prompt[-200:]
+
+
+def script_response(prompt: str) -> str:
+    """根据 Prompt 决定这一轮输出什么"""
+    if "请把下面的对话压缩" in prompt:
+        return "用户此前询问了行情与天气，已给出答复。"
+    if "请简洁自然地直接回答" in prompt:
+        return "你好！我是你的智能助手，有什么可以帮你的吗？"
+
+    question = _last_question(prompt)
+    scratchpad = prompt.split("Question:")[-1]
+    if "Observation:" in scratchpad:
+        answer = (FILLER * (FakeLLMConfig.answer_chars // len(FILLER) + 1))[:FakeLLMConfig.answer_chars]
+        # Prompt 以 "Thought: " 结尾时，真实模型不会再写一遍标记，直接接着想
+        prefix = "" if scratchpad.rstrip().endswith("Thought:") else "Thought: "
+        return f"{prefix}已经拿到所需数据，可以回答了。\nFinal Answer: {answer}"
+
+    # Prompt 里有并发提示时，一轮写出所有需要的 Action (和真实模型在并发模式下的行为一致)
+    parallel = "连续写多组 Action" in prompt
+    actions = []
+    for keywords, tool, tool_input in SCRIPTED_ACTIONS:
+        if any(k in question for k in keywords):
+            actions.append(f"Action: {tool}\nAction Input: {tool_input}\n")
+            if not parallel:
+                break
+    if actions:
+        return "Thought: 需要调用工具获取数据。\n" + "".join(actions)
+    return "Thought: 这个问题可以直接回答。\nFinal Answer: " + FILLER
+
+
+def _prompt_text(body: dict) -> str:
+    parts = []
+    for m in body.get("messages", []):
+        content = m.get("content")
+        if isinstance(content, list):
+            content = "".join(c.get("text", "") for c in content if isinstance(c, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+app = FastAPI(title="Fake OpenAI-compatible LLM")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake-model")
+    text = script_response(_prompt_text(body))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    if not body.get("stream"):
+        await asyncio.sleep(FakeLLMConfig.first_token_ms / 1000)
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    async def stream():
+        await asyncio.sleep(FakeLLMConfig.first_token_ms / 1000)
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+        step = FakeLLMConfig.chars_per_token
+        for i in range(0, len(text), step):
+            yield _chunk(completion_id, model, {"content": text[i:i + step]})
+            await asyncio.sleep(FakeLLMConfig.token_ms / 1000)
+        yield _chunk(completion_id, model, {}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--first-token-ms", type=float, default=FakeLLMConfig.first_token_ms)
+    parser.add_argument("--token-ms", type=float, default=FakeLLMConfig.token_ms)
+    args = parser.parse_args()
+    FakeLLMConfig.first_token_ms = args.first_token_ms
+    FakeLLMConfig.token_ms = args.token_ms
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
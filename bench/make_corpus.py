@@ -0,0 +1,84 @@
+"""
+生成压测用的样例 PDF 语料 (bench/sample_corpus/*.pdf)。
+不依赖任何第三方库，直接手写最小可用的 PDF 结构，pypdf 可以正常抽取文本。
+
+    python bench/make_corpus.py
+"""
+import os
+import random
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_corpus")
+
+# (文件名, 页数)
+DOCUMENTS = [
+    ("annual_report_small.pdf", 12),
+    ("annual_report_medium.pdf", 40),
+    ("prospectus_large.pdf", 120),
+]
+
+SENTENCES = [
+    "Revenue for the fiscal year increased {n} percent driven by strong demand in core markets.",
+    "Gross margin improved to {n} percent as input costs declined and pricing remained firm.",
+    "Operating cash flow reached {n} billion, supporting dividends and share repurchases.",
+    "The board proposes a cash dividend of {n} per share subject to shareholder approval.",
+    "Inventory turnover days decreased to {n} following supply chain optimization.",
+    "Research and development expenses accounted for {n} percent of total revenue.",
+    "Risk factors include currency fluctuation, regulatory change and raw material prices.",
+    "The company expects capital expenditure of approximately {n} billion next year.",
+    "Net profit attributable to shareholders grew {n} percent year over year.",
+    "Management will continue to focus on premium products and channel reform.",
+]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(path: str, pages: list):
+    """pages: 每页若干行文本"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2 * len(pages)
+    for i, lines in enumerate(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        body = "BT /F1 10 Tf 14 TL 50 740 Td " + " ".join(f"({_escape(l)}) Tj T*" for l in lines) + " ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += b"".join(f"{o:010d} 00000 n \n".encode("latin-1") for o in offsets)
+    out += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+            f"startxref\n{xref_at}\n%%EOF\n").encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def build_corpus(corpus_dir: str = CORPUS_DIR) -> list:
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(42)
+    paths = []
+    for name, page_count in DOCUMENTS:
+        pages = []
+        for p in range(page_count):
+            lines = [f"{name.split('.')[0].replace('_', ' ').title()} - Page {p + 1}"]
+            lines += [rng.choice(SENTENCES).format(n=rng.randint(2, 80)) for _ in range(30)]
+            pages.append(lines)
+        path = os.path.join(corpus_dir, name)
+        make_pdf(path, pages)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    for p in build_corpus():
+        print(f"✅ {p} ({os.path.getsize(p) // 1024} KB)")
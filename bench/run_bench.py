@@ -0,0 +1,296 @@
+"""
+离线压测：本地起假 LLM + 假数据后端，在指定并发下压 /chat 和 /upload，
+输出首 token 延迟 (p50/p99)、生成速度 (tokens/s) 和入库吞吐 (pages/s)。
+不需要真实的大模型接口、yfinance 或高德 Key，结果可以在发布前横向对比。
+
+    python bench/run_bench.py --concurrency 16 --requests 200
+    python bench/run_bench.py --skip-ingest --first-token-ms 500 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+# 各类问题按比例混合：闲聊走快速通道，其余走 ReAct + 工具
+QUERY_MIX = [
+    "你好",
+    "贵州茅台现在的股价是多少？",
+    "对比一下茅台、五粮液和泸州老窖",
+    "茅台和苹果现在超买了吗？",
+    "帮我筛选这200只股票里PE最低的10只",
+    "杭州今天天气怎么样？",
+    "杭州天气怎么样，现在几点了，茅台股价多少",
+    "特斯拉最近有什么新闻？",
+    "年报里营收增长了多少？",
+    "现在几点了",
+]
+
+TEXT_EVENTS = ("thought", "final")
+
+
+def percentile(values: list, pct: float) -> float:
+    """最近秩法求分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def _summary(values: list, scale: float = 1.0) -> dict:
+    if not values:
+        return {"p50": 0.0, "p99": 0.0, "mean": 0.0}
+    return {
+        "p50": round(percentile(values, 50) * scale, 2),
+        "p99": round(percentile(values, 99) * scale, 2),
+        "mean": round(statistics.fmean(values) * scale, 2),
+    }
+
+
+# ==========================================
+# 1. 启动服务
+# ==========================================
+def start_server(app, port: int):
+    """在后台线程里跑 uvicorn，等到端口可用再返回"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError(f"服务启动超时: 端口 {port}")
+        time.sleep(0.05)
+    return server
+
+
+def prepare_env(args, workdir: str):
+    """必须在 import main 之前设置：各模块在导入时读取这些环境变量"""
+    base_url = f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ["OPENAI_API_BASE"] = base_url
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "bench-fake-key"
+    os.environ["HISTORY_BACKEND"] = "memory"
+    # 预热跑完再开始计时，测的是稳态而不是冷启动
+    os.environ["STARTUP_MODE"] = "eager"
+    os.environ["CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(workdir, "cache", "embeddings.sqlite")
+    os.environ["KB_DB_PATH"] = os.path.join(workdir, "faiss_index_db")
+    os.environ["PRICE_HISTORY_DIR"] = os.path.join(workdir, "cache", "price_history")
+    # 假行情后端没有真实的限流，放开筛选器的回源速率，只测并发扇出本身
+    os.environ.setdefault("SCREENER_RATE", "200")
+    os.environ.setdefault("SCREENER_BURST", "200")
+
+
+# ==========================================
+# 2. /chat 压测
+# ==========================================
+async def one_chat(client: httpx.AsyncClient, url: str, query: str, session_id: str,
+                   chars_per_token: int) -> dict:
+    start = time.perf_counter()
+    first_token = None
+    chars = 0
+    event = None
+    status = "ok"
+    async with client.stream("POST", url, json={"query": query, "session_id": session_id}) as resp:
+        if resp.status_code != 200:
+            return {"status": f"http_{resp.status_code}", "total": time.perf_counter() - start}
+        async for line in resp.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event in TEXT_EVENTS:
+                delta = json.loads(line[5:]).get("delta", "")
+                if delta and first_token is None:
+                    first_token = time.perf_counter()
+                chars += len(delta)
+            elif line.startswith("data:") and event == "error":
+                status = "error"
+    end = time.perf_counter()
+    result = {"status": status, "total": end - start, "tokens": chars / chars_per_token}
+    if first_token is not None:
+        result["ttft"] = first_token - start
+        if end > first_token:
+            result["tokens_per_s"] = result["tokens"] / (end - first_token)
+    return result
+
+
+async def bench_chat(base_url: str, concurrency: int, total: int, sessions: int,
+                     chars_per_token: int) -> dict:
+    url = f"{base_url}/chat"
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        async def worker(i: int):
+            async with semaphore:
+                query = QUERY_MIX[i % len(QUERY_MIX)]
+                try:
+                    results.append(await one_chat(client, url, query, f"bench-{i % sessions}",
+                                                  chars_per_token))
+                except Exception as e:
+                    results.append({"status": f"exception:{type(e).__name__}"})
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(total)))
+        wall = time.perf_counter() - wall_start
+
+    ok = [r for r in results if r["status"] == "ok"]
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "failed": total - len(ok),
+        "wall_s": round(wall, 2),
+        "requests_per_s": round(len(ok) / wall, 2) if wall else 0.0,
+        "ttft_ms": _summary([r["ttft"] for r in ok if "ttft" in r], 1000),
+        "latency_ms": _summary([r["total"] for r in ok], 1000),
+        "tokens_per_s": _summary([r["tokens_per_s"] for r in ok if "tokens_per_s" in r]),
+        "aggregate_tokens_per_s": round(sum(r.get("tokens", 0) for r in ok) / wall, 1) if wall else 0.0,
+    }
+
+
+# ==========================================
+# 3. /upload 入库压测
+# ==========================================
+def bench_ingest(base_url: str, pdf_paths: list, timeout: float = 600) -> dict:
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        wall_start = time.perf_counter()
+        submitted = {}
+        for path in pdf_paths:
+            # 相同内容会按 doc_id 去重跳过，所以每次运行都用新的临时 KB 目录
+            with open(path, "rb") as f:
+                resp = client.post("/upload", files={"file": (os.path.basename(path), f, "application/pdf")})
+            resp.raise_for_status()
+            submitted[resp.json()["job"]["job_id"]] = {"file": os.path.basename(path), "start": time.perf_counter()}
+
+        docs = []
+        pending = dict(submitted)
+        deadline = time.time() + timeout
+        while pending and time.time() < deadline:
+            time.sleep(0.2)
+            for job_id in list(pending):
+                job = client.get(f"/jobs/{job_id}").json()
+                if job["status"] in ("done", "failed"):
+                    info = pending.pop(job_id)
+                    elapsed = time.perf_counter() - info["start"]
+                    docs.append({
+                        "file": info["file"],
+                        "status": job["status"],
+                        "pages": job.get("total") or 0,
+                        "chunks": job.get("chunks") or 0,
+                        "seconds": round(elapsed, 2),
+                        "pages_per_s": round((job.get("total") or 0) / elapsed, 1) if elapsed else 0.0,
+                        "error": job.get("error"),
+                    })
+        wall = time.perf_counter() - wall_start
+
+    pages = sum(d["pages"] for d in docs if d["status"] == "done")
+    return {
+        "documents": docs,
+        "timed_out": len(pending),
+        "wall_s": round(wall, 2),
+        "pages": pages,
+        "pages_per_s": round(pages / wall, 1) if wall else 0.0,
+    }
+
+
+# ==========================================
+# 4. 入口
+# ==========================================
+def _print_report(report: dict):
+    chat = report.get("chat")
+    if chat:
+        print("\n📊 /chat")
+        print(f"   请求 {chat['ok']}/{chat['requests']} 成功 | 并发 {chat['concurrency']} | "
+              f"{chat['requests_per_s']} req/s")
+        print(f"   首 token  p50 {chat['ttft_ms']['p50']} ms | p99 {chat['ttft_ms']['p99']} ms")
+        print(f"   总耗时    p50 {chat['latency_ms']['p50']} ms | p99 {chat['latency_ms']['p99']} ms")
+        print(f"   生成速度  p50 {chat['tokens_per_s']['p50']} tokens/s | "
+              f"总吞吐 {chat['aggregate_tokens_per_s']} tokens/s")
+    ingest = report.get("ingest")
+    if ingest:
+        print("\n📚 /upload")
+        for d in ingest["documents"]:
+            print(f"   {d['file']}: {d['status']} | {d['pages']} 页 / {d['chunks']} 片段 | "
+                  f"{d['seconds']} s | {d['pages_per_s']} pages/s")
+        print(f"   合计 {ingest['pages']} 页 | {ingest['wall_s']} s | {ingest['pages_per_s']} pages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--sessions", type=int, default=16, help="轮流使用的会话数")
+    parser.add_argument("--first-token-ms", type=float, default=200)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--quote-latency", type=float, default=0.3)
+    parser.add_argument("--weather-latency", type=float, default=0.15)
+    parser.add_argument("--search-latency", type=float, default=0.8)
+    parser.add_argument("--real-embeddings", action="store_true", help="入库时使用真实的 HuggingFace 模型")
+    parser.add_argument("--corpus", nargs="*", help="要上传的 PDF，默认使用 bench/sample_corpus")
+    parser.add_argument("--skip-chat", action="store_true")
+    parser.add_argument("--skip-ingest", action="store_true")
+    parser.add_argument("--llm-port", type=int, default=9001)
+    parser.add_argument("--app-port", type=int, default=9000)
+    parser.add_argument("--json", help="把结果写到 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    prepare_env(args, workdir)
+
+    import fake_llm_server
+    from fake_llm_server import FakeLLMConfig
+    FakeLLMConfig.first_token_ms = args.first_token_ms
+    FakeLLMConfig.token_ms = args.token_ms
+
+    os.chdir(ROOT_DIR)
+    import main as app_module
+    import fake_backends
+    fake_backends.install(args.quote_latency, args.weather_latency, args.search_latency,
+                          fake_embeddings=not args.real_embeddings)
+
+    llm_server = start_server(fake_llm_server.app, args.llm_port)
+    app_server = start_server(app_module.app, args.app_port)
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    print(f"🚀 压测开始 | 工作目录 {workdir}")
+
+    report = {"config": vars(args)}
+    try:
+        if not args.skip_chat:
+            report["chat"] = asyncio.run(bench_chat(
+                base_url, args.concurrency, args.requests, args.sessions, FakeLLMConfig.chars_per_token))
+        if not args.skip_ingest:
+            pdf_paths = args.corpus
+            if not pdf_paths:
+                from make_corpus import build_corpus, CORPUS_DIR, DOCUMENTS
+                pdf_paths = [os.path.join(CORPUS_DIR, name) for name, _ in DOCUMENTS]
+                if not all(os.path.exists(p) for p in pdf_paths):
+                    pdf_paths = build_corpus()
+            report["ingest"] = bench_ingest(base_url, pdf_paths)
+    finally:
+        app_server.should_exit = True
+        llm_server.should_exit = True
+
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from dotenv import load_dotenv
+
+from history_store import estimate_tokens, message_tokens
+
+load_dotenv()
+
+# ==========================================
+# 1. 配置
+# ==========================================
+# 注入 Prompt 的历史总预算 (token)，ReAct 每轮迭代都会带上这段历史
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# 预算中留给早先对话摘要的部分
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+# 摘要缓存最多保留多少个会话
+HISTORY_SUMMARY_SESSIONS = int(os.getenv("HISTORY_SUMMARY_SESSIONS", "1000"))
+
+# 摘要调用带上这个 tag，流式输出时据此过滤，不会混进回答里
+SUMMARY_TAG = "history_summary"
+
+SUMMARY_PROMPT = """请把下面的对话压缩成一段简洁的中文摘要，保留用户关心的股票代码、城市、数字结论和未完成的问题，不超过{limit}字。
+
+【已有摘要】
+{summary}
+
+【新增对话】
+{dialogue}
+
+只输出更新后的摘要："""
+
+
+class SummaryCache:
+    """session_id -> (最后一条已折叠消息的指纹, 摘要)，LRU 淘汰"""
+    entries = OrderedDict()
+    lock = threading.Lock()
+
+
+def _fingerprint(message: BaseMessage) -> str:
+    return hashlib.sha1(f"{message.type}:{message.content}".encode("utf-8")).hexdigest()
+
+
+def _render_messages(messages: List[BaseMessage]) -> str:
+    lines = []
+    for m in messages:
+        role = "用户" if isinstance(m, HumanMessage) else "助手"
+        lines.append(f"{role}: {m.content}")
+    return "\n".join(lines)
+
+
+def _split_by_budget(messages: List[BaseMessage], budget: int):
+    """从最新的消息往前数，能放进预算的部分原样保留，其余的交给摘要"""
+    used = 0
+    keep_from = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        cost = message_tokens(messages[i])
+        if used + cost > budget:
+            break
+        used += cost
+        keep_from = i
+    return messages[:keep_from], messages[keep_from:]
+
+
+def _summarize(llm, summary: str, new_messages: List[BaseMessage]) -> str:
+    prompt = SUMMARY_PROMPT.format(
+        limit=HISTORY_SUMMARY_TOKENS,
+        summary=summary or "(无)",
+        dialogue=_render_messages(new_messages),
+    )
+    return llm.invoke(prompt).content.strip()
+
+
+def _get_summary(session_id: str, older: List[BaseMessage], llm) -> str:
+    """
+    增量摘要：只把上次摘要之后新滚出预算的消息折叠进去。
+    找不到上次的位置 (比如历史被清空过) 时，对全部旧消息重新摘要。
+    """
+    with SummaryCache.lock:
+        cached = SummaryCache.entries.get(session_id)
+        if cached:
+            SummaryCache.entries.move_to_end(session_id)
+
+    summary, start = "", 0
+    if cached:
+        last_fp, cached_summary = cached
+        for i in range(len(older) - 1, -1, -1):
+            if _fingerprint(older[i]) == last_fp:
+                summary, start = cached_summary, i + 1
+                break
+
+    new_messages = older[start:]
+    if not new_messages:
+        return summary
+
+    summary = _summarize(llm, summary, new_messages)
+    with SummaryCache.lock:
+        SummaryCache.entries[session_id] = (_fingerprint(older[-1]), summary)
+        SummaryCache.entries.move_to_end(session_id)
+        while len(SummaryCache.entries) > HISTORY_SUMMARY_SESSIONS:
+            SummaryCache.entries.popitem(last=False)
+    return summary
+
+
+# ==========================================
+# 2. 对外接口
+# ==========================================
+def build_chat_history(messages: List[BaseMessage], session_id: str, llm) -> str:
+    """
+    把会话历史渲染成注入 Prompt 的文本，总长度控制在 HISTORY_TOKEN_BUDGET 内：
+    最近的几轮原样保留，更早的折叠成缓存的增量摘要。
+    """
+    if not messages:
+        return "(无)"
+
+    # 全部放得下就不需要摘要，留给摘要的额度也一并用上
+    if sum(message_tokens(m) for m in messages) <= HISTORY_TOKEN_BUDGET:
+        return _render_messages(messages)
+
+    older, recent = _split_by_budget(messages, HISTORY_TOKEN_BUDGET - HISTORY_SUMMARY_TOKENS)
+
+    try:
+        summary = _get_summary(session_id, older, llm)
+    except Exception as e:
+        # 摘要失败时直接丢弃更早的对话，不影响本次回答
+        print(f"⚠️ 历史摘要失败: {e}")
+        summary = ""
+
+    if not summary:
+        return _render_messages(recent)
+    if estimate_tokens(summary) > HISTORY_SUMMARY_TOKENS:
+        # 模型没守字数限制时硬截断，1 个字符至多算 1 个 token
+        summary = summary[:HISTORY_SUMMARY_TOKENS]
+    return f"【早先对话摘要】{summary}\n{_render_messages(recent)}"
@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ==========================================
+# 1. 配置
+# ==========================================
+# memory：只存内存 (LRU + TTL)；sqlite：内存只缓存热会话，完整历史落到本地 SQLite，重启不丢
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(os.getenv("CACHE_DIR", "cache"), "history.sqlite"))
+# 内存里最多保留多少个会话、多久没访问就淘汰
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "1000"))
+HISTORY_SESSION_TTL = float(os.getenv("HISTORY_SESSION_TTL", str(24 * 3600)))
+# 单个会话的上限：超过后从最早的消息开始丢弃
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "50"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "8000"))
+
+_CJK = re.compile(r"[一-鿿　-〿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，其余字符约 4 个 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return estimate_tokens(content) + 4  # 每条消息的角色等额外开销
+
+
+# ==========================================
+# 2. SQLite 持久层
+# ==========================================
+class SQLiteHistoryBackend:
+    """按会话存储消息，每条消息一行 (JSON)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " session_id TEXT NOT NULL,"
+                " message TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq)"
+            )
+        return self._conn
+
+    def load(self, session_id: str) -> List[BaseMessage]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        return messages_from_dict([json.loads(r[0]) for r in rows])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage], keep_last: int):
+        """追加消息，并只保留该会话最近 keep_last 条"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT INTO messages (session_id, message, created_at) VALUES (?, ?, ?)",
+                [(session_id, json.dumps(m, ensure_ascii=False), now) for m in messages_to_dict(messages)],
+            )
+            conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND seq NOT IN ("
+                " SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?)",
+                (session_id, session_id, keep_last),
+            )
+            conn.commit()
+
+    def clear(self, session_id: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.commit()
+
+    def session_count(self) -> int:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(DISTINCT session_id) FROM messages"
+            ).fetchone()[0]
+
+
+# ==========================================
+# 3. 带上限的会话历史
+# ==========================================
+class CappedChatMessageHistory(BaseChatMessageHistory):
+    """
+    单个会话的历史：超过消息条数或 token 上限时，从最早的消息开始丢弃。
+    配了持久层时，每次写入同步落盘。
+    """
+
+    def __init__(self, session_id: str, backend: SQLiteHistoryBackend = None,
+                 max_messages: int = HISTORY_MAX_MESSAGES, max_tokens: int = HISTORY_MAX_TOKENS):
+        self.session_id = session_id
+        self.backend = backend
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self._messages = backend.load(session_id) if backend else []
+        self._trim()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return list(self._messages)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._messages.extend(messages)
+        self._trim()
+        if self.backend:
+            self.backend.append(self.session_id, messages, keep_last=len(self._messages))
+
+    def clear(self) -> None:
+        self._messages = []
+        if self.backend:
+            self.backend.clear(self.session_id)
+
+    def _trim(self):
+        if len(self._messages) > self.max_messages:
+            self._messages = self._messages[-self.max_messages:]
+        total = sum(message_tokens(m) for m in self._messages)
+        while len(self._messages) > 1 and total > self.max_tokens:
+            total -= message_tokens(self._messages.pop(0))
+
+
+# ==========================================
+# 4. 内存层：LRU + TTL
+# ==========================================
+class HistoryStore:
+    """
+    会话ID -> 历史对象的内存缓存，容量和空闲时间都有上限，长期运行内存保持平稳。
+    memory 模式下被淘汰的会话历史随之丢弃；sqlite 模式下下次访问会从磁盘重新加载。
+    """
+
+    def __init__(self, backend: SQLiteHistoryBackend = None,
+                 max_sessions: int = HISTORY_MAX_SESSIONS, ttl: float = HISTORY_SESSION_TTL):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # session_id -> (last_access, history)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> CappedChatMessageHistory:
+        now = time.monotonic()
+        with self._lock:
+            item = self._sessions.get(session_id)
+            if item is not None and now - item[0] <= self.ttl:
+                history = item[1]
+            else:
+                history = CappedChatMessageHistory(session_id, backend=self.backend)
+            self._sessions[session_id] = (now, history)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+        return history
+
+    def _evict(self, now: float):
+        # 先清掉过期的 (最久未访问的在最前面)
+        while self._sessions:
+            last_access, _ = next(iter(self._sessions.values()))
+            if now - last_access <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {"backend": HISTORY_BACKEND, "sessions_in_memory": len(self._sessions)}
+        if self.backend:
+            stats["sessions_on_disk"] = self.backend.session_count()
+        return stats
+
+
+history_store = HistoryStore(
+    backend=SQLiteHistoryBackend(HISTORY_DB_PATH) if HISTORY_BACKEND == "sqlite" else None
+)
+
+
+def get_session_history(session_id: str) -> CappedChatMessageHistory:
+    return history_store.get(session_id)
+
+
+def get_history_stats() -> dict:
+    return history_store.stats()
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from tools.tool5_rag import DEFAULT_NAMESPACE, ingest_document, needs_rebuild, rebuild_knowledge_base
+
+load_dotenv()
+
+
+# ==========================================
+# 1. 后台入库任务队列
+# ==========================================
+# /upload 只负责把文件落盘并登记任务，解析 -> 切分 -> 向量化 -> 建索引全部在这里的线程池里完成，
+# 事件循环不会被大 PDF 卡住。
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# 已结束的任务最多保留多少条，防止任务表无限增长
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "200"))
+
+
+class IngestJobs:
+    """存放任务状态的容器：job_id -> 状态字典"""
+    executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+    jobs = {}
+    lock = threading.Lock()
+    rebuild_jobs = {}  # namespace -> 排队中 / 进行中的索引重建任务，每个 namespace 同一时间只保留一个
+
+
+def _update(job_id: str, **fields):
+    with IngestJobs.lock:
+        IngestJobs.jobs[job_id].update(fields)
+
+
+def _prune_finished():
+    """只保留最近的若干条已结束任务 (调用方需持有锁)"""
+    finished = [j for j in IngestJobs.jobs.values() if j["status"] in ("done", "failed")]
+    if len(finished) <= INGEST_JOB_HISTORY:
+        return
+    finished.sort(key=lambda j: j["finished_at"])
+    for job in finished[:len(finished) - INGEST_JOB_HISTORY]:
+        IngestJobs.jobs.pop(job["job_id"], None)
+
+
+def _run_job(job_id: str, file_path: str, filename: str, namespace: str):
+    _update(job_id, status="running", started_at=time.time())
+
+    def on_progress(pages_done, pages_total, chunks_done):
+        _update(job_id, stage="index", done=pages_done, total=pages_total, chunks=chunks_done)
+
+    try:
+        result = ingest_document(file_path, progress=on_progress, source=filename, namespace=namespace)
+        _update(job_id, status="done", stage="done", result=result, finished_at=time.time())
+    except Exception as e:
+        traceback.print_exc()
+        _update(job_id, status="failed", error=str(e), finished_at=time.time())
+        return
+    finally:
+        # 上传的临时文件已经切分入库 (或失败)，shard 在知识库目录里，原文件不再需要
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    # 增量部分积累到阈值后，自动把它并入基础索引
+    if needs_rebuild(namespace):
+        submit_rebuild(namespace=namespace)
+
+
+def _run_rebuild(job_id: str, index_type: str, namespace: str):
+    _update(job_id, status="running", stage="train", started_at=time.time())
+
+    def on_progress(vectors_done, vectors_total):
+        _update(job_id, stage="index", done=vectors_done, total=vectors_total)
+
+    try:
+        result = rebuild_knowledge_base(index_type, progress=on_progress, namespace=namespace)
+        _update(job_id, status="done", stage="done", result=result, finished_at=time.time())
+    except Exception as e:
+        traceback.print_exc()
+        _update(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        with IngestJobs.lock:
+            if IngestJobs.rebuild_jobs.get(namespace) == job_id:
+                del IngestJobs.rebuild_jobs[namespace]
+
+
+def submit_ingest(file_path: str, filename: str, job_id: str = None, namespace: str = DEFAULT_NAMESPACE) -> dict:
+    """登记一个入库任务并立即返回任务状态"""
+    job_id = job_id or uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "kind": "ingest",
+        "namespace": namespace,
+        "filename": filename,
+        "status": "queued",  # queued -> running -> done / failed
+        "stage": "queued",  # queued -> index -> done
+        "done": 0,  # 已入索引的页数
+        "total": 0,  # 总页数
+        "chunks": 0,  # 已向量化的片段数
+        "result": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+    with IngestJobs.lock:
+        _prune_finished()
+        IngestJobs.jobs[job_id] = job
+    IngestJobs.executor.submit(_run_job, job_id, file_path, filename, namespace)
+    return dict(job)
+
+
+def submit_rebuild(index_type: str = None, namespace: str = DEFAULT_NAMESPACE) -> dict:
+    """
+    登记一个基础索引重建任务 (训练 + 构建 + 切换)，done / total 为已写入的向量数。
+    该 namespace 已有重建任务在排队或进行中时直接返回那一个。
+    """
+    with IngestJobs.lock:
+        running = IngestJobs.jobs.get(IngestJobs.rebuild_jobs.get(namespace))
+        if running is not None:
+            return dict(running)
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "kind": "rebuild",
+            "namespace": namespace,
+            "filename": None,
+            "index_type": index_type,
+            "status": "queued",  # queued -> running -> done / failed
+            "stage": "queued",  # queued -> train -> index -> done
+            "done": 0,  # 已写入基础索引的向量数
+            "total": 0,
+            "chunks": 0,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        _prune_finished()
+        IngestJobs.jobs[job_id] = job
+        IngestJobs.rebuild_jobs[namespace] = job_id
+    IngestJobs.executor.submit(_run_rebuild, job_id, index_type, namespace)
+    return dict(job)
+
+
+def get_job(job_id: str):
+    """查询任务状态，不存在返回 None"""
+    with IngestJobs.lock:
+        job = IngestJobs.jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def list_jobs() -> list:
+    with IngestJobs.lock:
+        return sorted((dict(j) for j in IngestJobs.jobs.values()),
+                      key=lambda j: j["created_at"], reverse=True)
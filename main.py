@@ -1,12 +1,47 @@
 import shutil
 import os
-from fastapi import FastAPI,Body,UploadFile,File,HTTPException
-from fastapi.responses import StreamingResponse
-from agent_core import get_stream_response,global_agent,update_agent_settings
-from tools.tool5_rag import initialize_knowledge_base
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI,Body,UploadFile,File,Form,Query,HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
+from tools.tool4_finance import get_quote_cache_stats
+from tools.tool1_天气查询 import get_weather_cache_stats
+from tools.tool3_联网搜索 import get_search_cache_stats
+from metrics import render_metrics
+from admission import admit, guarded_stream, admission_stats, Overloaded
+from warmup import load_module, start_warmup, readiness
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时按 STARTUP_MODE 预热 Agent、Embedding 模型和知识库存档 (lazy 模式不阻塞启动)"""
+    await run_in_threadpool(start_warmup)
+    yield
+
 
 # 初始化FasrAPI应用
-app = FastAPI(title="Smart Agent API",description="基于langChain的智能体服务")
+app = FastAPI(title="Smart Agent API",description="基于langChain的智能体服务",lifespan=lifespan)
+
+
+async def lazy(name: str):
+    """
+    agent_core / 知识库 / 会话历史 这些模块导入要拉起整套 langchain，启动时不导入，
+    第一次用到 (或后台预热) 时再在线程池里导入，避免卡住事件循环
+    """
+    return await run_in_threadpool(load_module, name)
+
+
+async def resolve_namespace(namespace: str) -> str:
+    """校验知识库 namespace (空值为默认知识库)，非法时返回 400"""
+    rag = await lazy("tools.tool5_rag")
+    try:
+        return rag.normalize_namespace(namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 """
 FastAPI默认会将路径参数或者查询参数作为函数参数，
 但是在前端UI界面我们使用requests库请求后端服务网址的时候
@@ -16,68 +51,264 @@ FastAPI默认会将路径参数或者查询参数作为函数参数，
 @app.post("/chat")
 async def chat(
     query: str = Body(..., title="用户问题"),
-    session_id: str = Body(..., title="会话ID")
+    session_id: str = Body(..., title="会话ID"),
+    model: str = Body(None, title="模型名称 (可选，不填则用会话配置或全局默认)"),
+    system_prompt: str = Body(None, title="系统提示词 (可选，不填则用会话配置或全局默认)"),
+    namespace: str = Body(None, title="知识库 namespace (可选，如会话ID / 投研小组，不填为默认知识库)")
 ):
     """
-    流式对话接口
+    流式对话接口。
+    每个上游模型有并发名额和有界排队 (见 admission.py)：排队已满返回 429，排队超时返回 503，
+    都带 Retry-After 头，客户端按提示退避即可。模型不在 ALLOWED_MODELS 里时返回 400。
     """
+    namespace = await resolve_namespace(namespace)
+    agent_core = await lazy("agent_core")
+    try:
+        # 先校验模型再申请名额：名额按模型划分，不认识的模型名不能换来一份新名额
+        model, system_prompt = agent_core.resolve_agent_config(session_id, model, system_prompt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        slot = await admit(model)
+    except Overloaded as e:
+        return JSONResponse(
+            {"detail": str(e), "reason": e.reason, "retry_after": e.retry_after},
+            status_code=e.status,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    # 流结束 / 出错 / 客户端断开时归还名额；响应没能开始发送时由后台任务兜底
     return StreamingResponse(
-        get_stream_response(query, session_id),
-        media_type="text/event-stream"
+        guarded_stream(agent_core.get_stream_response(query, session_id, model, system_prompt, namespace), slot),
+        media_type="text/event-stream",
+        background=BackgroundTask(slot.release),
     )
 # 2. Agent 配置更新接口 (多模型 & 提示词管理)
 @app.post("/update_config")
 async def update_config(
     model: str = Body(..., embed=True, description="模型名称，如 Qwen/Qwen3-8B"),
-    system_prompt: str = Body(..., embed=True, description="自定义系统提示词")
+    system_prompt: str = Body(..., embed=True, description="自定义系统提示词"),
+    session_id: str = Body(None, embed=True, description="会话ID，填写时只对该会话生效")
 ):
     """
-    动态更新 Agent 的底层模型和人设
+    动态更新 Agent 的底层模型和人设 (预构建后缓存，切换无需重建)
     """
     try:
-        print(f"正在更新配置: Model={model}, Prompt长度={len(system_prompt)}")
-        msg = update_agent_settings(model, system_prompt)
+        print(f"正在更新配置: Model={model}, Prompt长度={len(system_prompt)}, Session={session_id}")
+        agent_core = await lazy("agent_core")
+        msg = await run_in_threadpool(agent_core.update_agent_settings, model, system_prompt, session_id)
         return {"message": msg, "status": "success"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"配置更新失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # 3. 知识库文件上传接口 (RAG)
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+@app.post("/upload", status_code=202)
+async def upload_file(
+    file: UploadFile = File(...),
+    namespace: str = Form(None, description="写入哪个知识库 namespace，不填为默认知识库")
+):
     """
-    上传 PDF 文件并构建向量知识库
+    上传 PDF 文件，立即返回任务ID，由后台线程池完成向量知识库构建
     """
+    namespace = await resolve_namespace(namespace)
+
     # 1. 创建临时目录保存上传的文件
     temp_dir = "temp_uploads"
     os.makedirs(temp_dir, exist_ok=True)
 
-    file_path = os.path.join(temp_dir, file.filename)
+    # 用任务ID做前缀，同名文件并发上传也不会互相覆盖
+    job_id = uuid.uuid4().hex
+    file_path = os.path.join(temp_dir, f"{job_id}_{os.path.basename(file.filename)}")
 
     try:
-        # 2. 将上传的文件写入硬盘
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # 2. 将上传的文件写入硬盘 (放到线程池里，不阻塞事件循环)
+        def _save():
+            with open(file_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
 
+        await run_in_threadpool(_save)
         print(f"文件已保存至: {file_path}")
 
-        # 3. 调用 RAG 工具进行初始化 (切分 -> 向量化 -> 存库)
-        success = initialize_knowledge_base(file_path)
-
-        if success:
-            return {"message": f"文件 '{file.filename}' 已成功加载入知识库！", "status": "success"}
-        else:
-            # 如果构建失败，返回 500 错误
-            raise HTTPException(status_code=500, detail="知识库构建失败，请检查后端日志")
+        # 3. 提交后台入库任务 (切分 -> 向量化 -> 追加到已有索引)
+        ingest_jobs = await lazy("ingest_jobs")
+        job = ingest_jobs.submit_ingest(file_path, file.filename, job_id=job_id, namespace=namespace)
+        return {"message": f"文件 '{file.filename}' 已进入后台处理队列", "status": "accepted", "job": job}
 
     except Exception as e:
         print(f"上传处理出错: {e}")
+        # 没能交给后台任务的文件由这里清理，交出去之后由入库任务结束时删除
+        if os.path.exists(file_path):
+            os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
-    finally:
-        # 可选：处理完后是否删除临时文件？
-        # 为了演示 RAG 效果，建议保留，或者由 initialize_knowledge_base 内部处理持久化
-        pass
+
+
+@app.get("/jobs")
+async def jobs():
+    """
+    列出最近的知识库入库任务
+    """
+    ingest_jobs = await lazy("ingest_jobs")
+    return {"jobs": ingest_jobs.list_jobs()}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """
+    查询入库任务进度：done / total 为已入索引的页数 / 总页数，chunks 为已向量化的片段数
+    """
+    ingest_jobs = await lazy("ingest_jobs")
+    job = ingest_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"未找到任务: {job_id}")
+    return job
+
+
+# 4. 知识库文档管理接口
+@app.get("/namespaces")
+async def namespaces():
+    """
+    列出全部知识库 namespace，以及是否已加载到内存、占用大小
+    """
+    rag = await lazy("tools.tool5_rag")
+    return {"namespaces": await run_in_threadpool(rag.list_namespaces)}
+
+
+@app.get("/documents")
+async def documents(namespace: str = Query(None, description="知识库 namespace，不填为默认知识库")):
+    """
+    列出已入库的文档 (doc_id 为文件内容哈希)
+    """
+    namespace = await resolve_namespace(namespace)
+    rag = await lazy("tools.tool5_rag")
+    return {"namespace": namespace, "documents": await run_in_threadpool(rag.list_documents, namespace)}
+
+
+@app.delete("/documents/{doc_id}")
+async def remove_document(doc_id: str, namespace: str = Query(None, description="知识库 namespace")):
+    """
+    按 doc_id 从知识库中删除文档
+    """
+    namespace = await resolve_namespace(namespace)
+    rag = await lazy("tools.tool5_rag")
+    if not await run_in_threadpool(rag.delete_document, doc_id, namespace):
+        raise HTTPException(status_code=404, detail=f"未找到文档: {doc_id}")
+    return {"message": f"文档 {doc_id} 已删除", "status": "success"}
+
+
+@app.get("/index")
+async def index_info(namespace: str = Query(None, description="知识库 namespace")):
+    """
+    查看向量索引结构：基础索引类型 (flat / ivf / hnsw / pq)、向量数，以及尚未并入的增量大小
+    """
+    namespace = await resolve_namespace(namespace)
+    rag = await lazy("tools.tool5_rag")
+    return await run_in_threadpool(rag.get_index_info, namespace)
+
+
+@app.post("/index/rebuild", status_code=202)
+async def rebuild_index(
+    index_type: str = Body(None, embed=True, description="flat / ivf / hnsw / pq，不填则用 KB_INDEX_TYPE"),
+    namespace: str = Body(None, embed=True, description="知识库 namespace")
+):
+    """
+    后台重新训练并构建基础索引，立即返回任务，进度通过 /jobs/{job_id} 查询
+    """
+    namespace = await resolve_namespace(namespace)
+    rag_index = await lazy("tools.rag_index")
+    if index_type and index_type.lower() not in rag_index.INDEX_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的索引类型: {index_type}")
+    ingest_jobs = await lazy("ingest_jobs")
+    job = ingest_jobs.submit_rebuild(index_type.lower() if index_type else None, namespace=namespace)
+    return {"message": "索引重建已进入后台队列", "status": "accepted", "job": job}
+
+
+# 行情历史接口
+@app.get("/history")
+async def price_history(
+    ticker: str = Query(..., description="股票代码，例如 AAPL、600519.SS"),
+    period: str = Query("3mo", description="区间：5d / 1mo / 3mo / 6mo / ytd / 1y / 2y / 5y / 10y / max")
+):
+    """
+    日线 OHLCV (前复权)，按列返回。数据来自本地 Parquet 缓存，只有新 K 线才回源 yfinance
+    """
+    price_history = await lazy("tools.price_history")
+    try:
+        price_history.period_start(period)
+        frame = await run_in_threadpool(price_history.get_history, ticker, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"行情数据获取失败: {e}")
+    if frame.empty:
+        raise HTTPException(status_code=404, detail=f"未找到 {ticker} 的历史行情，请检查代码格式")
+    return {
+        "ticker": price_history.normalize_ticker(ticker),
+        "period": period,
+        "rows": len(frame),
+        "columns": price_history.history_to_columns(frame),
+    }
+
+
+# 5. 缓存统计接口
+@app.get("/cache_stats")
+async def cache_stats():
+    """
+    查看各类工具缓存的命中 / 未命中 / 合并请求计数
+    """
+    rag = await lazy("tools.tool5_rag")
+    history_store = await lazy("history_store")
+    price_history = await lazy("tools.price_history")
+    indicators = await lazy("tools.tool6_indicators")
+    answers = await lazy("answer_cache")
+
+    def collect():
+        return {
+            "quote": get_quote_cache_stats(),
+            "weather": get_weather_cache_stats(),
+            "search": get_search_cache_stats(),
+            "embedding": rag.get_embedding_cache_stats(),
+            "knowledge_base": rag.get_kb_cache_stats(),
+            "history": history_store.get_history_stats(),
+            "price_history": price_history.get_price_history_stats(),
+            "indicator": indicators.get_indicator_cache_stats(),
+            "answer": answers.get_answer_cache_stats(),
+        }
+
+    # 向量缓存要在 SQLite 里汇总大小、K 线缓存要扫目录，都是阻塞 IO，放到线程池里做
+    return await run_in_threadpool(collect)
+
+
+# 6. 监控指标接口 (Prometheus 格式)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    首 token 延迟、每轮 LLM 耗时、工具耗时、ReAct 迭代次数、检索耗时等直方图
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# 准入控制状态
+@app.get("/admission")
+async def admission():
+    """
+    各模型的并发名额、正在进行 / 排队中的请求数、累计被拒绝数
+    """
+    return {"models": admission_stats()}
+
+
+# 7. 就绪检查接口
+@app.get("/ready")
+async def ready():
+    """
+    就绪检查：预热结束前返回 503，可直接配置成负载均衡 / k8s 的 readinessProbe
+    """
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
 if __name__=="__main__":
     import uvicorn
     uvicorn.run(app)
\ No newline at end of file
@@ -0,0 +1,163 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# ==========================================
+# 轻量级 Prometheus 指标 (只实现用到的 Counter / Histogram / Gauge)
+# 输出格式遵循 Prometheus text exposition format 0.0.4，可直接被抓取
+# ==========================================
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self):
+        return [f"{self.name}{_label_str(self.label_names, k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """取值时回调函数，适合队列深度这类现成的状态"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self.callback = callback  # 返回 {标签值元组: 数值}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _render_samples(self):
+        values = dict(self._values)
+        if self.callback:
+            values.update(self.callback())
+        return [f"{self.name}{_label_str(self.label_names, k)} {v}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # 标签 -> [各桶计数..., 总和, 总数]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            idx = bisect.bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self):
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _label_str(self.label_names + ("le",), key + (repr(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_str(self.label_names + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            base = _label_str(self.label_names, key)
+            lines.append(f"{self.name}_sum{base} {series[-2]}")
+            lines.append(f"{self.name}_count{base} {series[-1]}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==========================================
+# 业务指标
+# ==========================================
+CHAT_REQUESTS = Counter(
+    "agent_chat_requests_total", "Chat requests by route and outcome", ("route", "status"))
+CHAT_DURATION = Histogram(
+    "agent_chat_duration_seconds", "End-to-end duration of a chat request", ("route",))
+TIME_TO_FIRST_TOKEN = Histogram(
+    "agent_time_to_first_token_seconds", "Time from request start to the first model token", ("model", "route"))
+LLM_CALL_DURATION = Histogram(
+    "agent_llm_call_duration_seconds", "Duration of one LLM call (one ReAct iteration)", ("model",))
+REACT_ITERATIONS = Histogram(
+    "agent_react_iterations", "LLM calls per agent run", ("model",), buckets=COUNT_BUCKETS)
+PARALLEL_ACTIONS = Histogram(
+    "agent_actions_per_step", "Tool calls emitted by one ReAct step (run concurrently)", buckets=COUNT_BUCKETS)
+TOOL_DURATION = Histogram(
+    "agent_tool_duration_seconds", "Execution time of a tool call", ("tool",))
+TOOL_QUEUE_WAIT = Histogram(
+    "agent_tool_queue_wait_seconds", "Time a tool call waited for its concurrency slot", ("tool",))
+CHAT_QUEUE_WAIT = Histogram(
+    "agent_chat_queue_wait_seconds", "Time a chat request waited for an upstream model slot", ("model",))
+CHAT_REJECTED = Counter(
+    "agent_chat_rejected_total", "Chat requests rejected by admission control", ("model", "reason"))
+# 取值回调由 admission 模块设置
+CHAT_QUEUE_DEPTH = Gauge(
+    "agent_chat_queue_depth", "Chat requests waiting for an upstream model slot", ("model",))
+CHAT_ACTIVE = Gauge(
+    "agent_chat_active", "Chat requests holding an upstream model slot", ("model",))
+RETRIEVER_DURATION = Histogram(
+    "agent_retriever_duration_seconds", "Knowledge-base retrieval time (query embedding + FAISS search)")
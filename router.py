@@ -0,0 +1,68 @@
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ==========================================
+# 快速路由：闲聊 / 无需工具的问题直接走一次简短的流式 LLM 调用，
+# 不再渲染五个工具的描述，也不经过 ReAct 循环和解析器。
+# ==========================================
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+# 由几句寒暄拼成的问题 ("好的谢谢再见") 不超过这个长度时也直接回答；
+# 只看长度不看内容会把 "茅台呢"、"aapl?" 这类简短追问误判成闲聊，所以长度只用在寒暄上
+FAST_PATH_MAX_CHARS = int(os.getenv("FAST_PATH_MAX_CHARS", "12"))
+
+ROUTE_DIRECT = "direct"
+ROUTE_AGENT = "agent"
+# 命中语义答案缓存 (answer_cache.py)，由 agent_core 在查缓存之后改写，只用于指标标签
+ROUTE_CACHE = "cache"
+
+_SMALL_TALK_PHRASES = (
+    r"(你好|您好|嗨|哈喽|在吗|在不在|早上好|中午好|下午好|晚上好|晚安|早安|"
+    r"谢谢|多谢|感谢|谢啦|辛苦了|好的|好吧|嗯|哦|ok|okay|收到|明白了?|知道了|"
+    r"再见|拜拜|回见|bye|hi|hello|hey|thanks|thank you|(hi|hello|hey) there|"
+    r"good (morning|afternoon|evening|night)|"
+    r"你是谁|你叫什么(名字)?|你能做什么|你会什么|介绍一下你自己)"
+    r"(呀|啊|呢|吧|哈|啦|嘛)?"
+)
+# 整句就是寒暄 / 致谢 / 告别 / 问身份
+SMALL_TALK_PATTERN = re.compile(rf"^{_SMALL_TALK_PHRASES}$", re.IGNORECASE)
+# 连着几句寒暄，中间可以有空格
+SMALL_TALK_RUN_PATTERN = re.compile(rf"^(?:{_SMALL_TALK_PHRASES} ?)+$", re.IGNORECASE)
+
+# 出现这些词说明大概率要查数据或用工具，必须走 Agent
+TOOL_KEYWORDS = (
+    "股", "价", "市值", "市盈", "pe", "行情", "涨", "跌", "k线", "代码", "基金", "指数", "财报",
+    "超买", "超卖", "均线", "rsi", "macd", "布林", "波动", "技术面", "指标", "筛选", "选股", "排名",
+    "天气", "气温", "下雨", "温度", "时间", "几点", "日期", "今天", "星期", "现在",
+    "新闻", "消息", "最新", "搜索", "查", "对比", "比较",
+    "文档", "文件", "报告", "知识库", "上传", "pdf",
+)
+
+# 股票代码的样子：AAPL、600519、600519.SS、00700.HK。
+# 字母代码只认大写，否则 "thank you" 里的 THANK 也会被当成代码；小写的 "aapl?" 不是寒暄，照样走 Agent
+TICKER_PATTERN = re.compile(r"\b[A-Z]{2,5}\b|\d{5,6}(\.(SS|SZ|SH|HK))?")
+
+# 标点和空白统一折叠成一个空格，英文单词之间的分隔要保留 ("thank you" 不能变成 "thankyou")
+_SEPARATORS = re.compile(r"[\s!！?？。，,.~～…、]+")
+
+
+def route_query(query: str) -> str:
+    """返回 ROUTE_DIRECT (直接回答) 或 ROUTE_AGENT (走 ReAct Agent)"""
+    if not FAST_PATH_ENABLED:
+        return ROUTE_AGENT
+
+    text = _SEPARATORS.sub(" ", query or "").strip().lower()
+    if not text:
+        return ROUTE_DIRECT
+    if SMALL_TALK_PATTERN.match(text):
+        return ROUTE_DIRECT
+    # 整句都是寒暄时里面不会有工具关键词，先判断它，免得 "OK thanks" 里的 OK 被当成股票代码
+    if len(text) <= FAST_PATH_MAX_CHARS and SMALL_TALK_RUN_PATTERN.match(text):
+        return ROUTE_DIRECT
+    if any(k in text for k in TOOL_KEYWORDS) or TICKER_PATTERN.search(query):
+        return ROUTE_AGENT
+    # 其余的 (包括很短的实体名 / 追问) 都交给 Agent
+    return ROUTE_AGENT
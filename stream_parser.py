@@ -0,0 +1,233 @@
+import json
+import re
+
+# ==========================================
+# 1. SSE 事件
+# ==========================================
+EVENT_THOUGHT = "thought"  # {"delta": 思考过程的增量文本}
+EVENT_ACTION = "action"  # {"tool": 工具名, "input": 参数}
+EVENT_OBSERVATION = "observation"  # {"tool": 工具名, "output": 工具返回}
+EVENT_FINAL = "final"  # {"delta": 最终答案的增量文本}
+EVENT_ERROR = "error"  # {"message": 错误信息}
+EVENT_DONE = "done"  # {}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """格式化成一条 text/event-stream 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ==========================================
+# 2. 增量 ReAct 解析器
+# ==========================================
+# 标记统一成：小写、去掉空白、全角冒号转半角
+_MARKERS = {
+    "thought:": "thought",
+    "action:": "action",
+    "actioninput:": "action_input",
+    "finalanswer:": "final",
+    "observation:": "observation",
+}
+_MARKER_RE = re.compile(
+    r"(?<![A-Za-z])(Thought|Action\s*Input|Action|Final\s*Answer|Observation)\s*[:：]",
+    re.IGNORECASE,
+)
+# 缓冲区末尾最多留这么多字符等待判断是否是标记的开头
+_MAX_HOLD = 24
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", "", text.replace("：", ":")).lower()
+
+
+def _marker_kind(text: str) -> str:
+    return _MARKERS[_normalize(text)]
+
+
+def _is_letter(ch: str) -> bool:
+    return ch.isascii() and ch.isalpha()
+
+
+def _hold_from(buffer: str, prev_char: str = "") -> int:
+    """返回需要暂缓输出的起始位置：从这里开始的尾巴可能是一个还没收全的标记"""
+    start = max(0, len(buffer) - _MAX_HOLD)
+    for i in range(start, len(buffer)):
+        before = buffer[i - 1] if i > 0 else prev_char
+        if not _is_letter(buffer[i]) or _is_letter(before):
+            continue
+        tail = _normalize(buffer[i:])
+        if any(m.startswith(tail) for m in _MARKERS):
+            return i
+    return len(buffer)
+
+
+class ReActStreamParser:
+    """
+    逐 token 解析 ReAct 输出的状态机，每个字符只处理常数次，长回答也是线性时间。
+    状态 (每轮 LLM 调用开始时重置)：
+    - start：第一轮刚开始，还不知道是 ReAct 格式还是直接回答，没有标记的内容直接当答案流出去；
+    - pending：调用过工具之后的一轮刚开始。Prompt 以 "Thought: " 结尾，模型往往不写标记直接接着想，
+      这段内容先攒着：后面出现标记说明是思考，整轮都没有标记才当作答案；
+    - thought：思考过程；
+    - action / action_input：正在收集工具名和参数，本轮结束或遇到下一个 Action 时产出；
+    - final：最终答案 (Final Answer 之后的内容全部算答案，不再识别标记)。
+    feed / end_iteration 返回 [(事件类型, 数据), ...]。
+    """
+
+    def __init__(self):
+        self.state = "start"
+        self.buffer = ""
+        self.action = ""
+        self.action_input = ""
+        self.strip_next = False  # 标记后面紧跟的空白不输出
+        self.prev_char = ""  # 上一个已消费的字符，用于判断标记的词边界
+        self.pending = ""  # pending 状态下攒着的内容
+        self.steps = 0  # 已产出的工具调用数
+
+    def start_iteration(self):
+        """每次 LLM 调用 (一轮 ReAct) 开始时调用"""
+        self.state = "pending" if self.steps else "start"
+        self.buffer = ""
+        self.pending = ""
+        self.strip_next = False
+        self.prev_char = ""
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        events = []
+        while self.buffer:
+            if self.state == "final":
+                self._consume(len(self.buffer), events)
+                break
+
+            # 带上已消费的最后一个字符，避免把 "Reaction:" 拆开后误认成 "Action:"
+            context = self.prev_char + self.buffer
+            offset = len(self.prev_char)
+            match = _MARKER_RE.search(context, offset)
+            if match:
+                self._consume(match.start() - offset, events)
+                self._switch(_marker_kind(match.group(0)), events)
+                self._consume(match.end() - match.start(), None)
+                continue
+
+            # 没有完整标记：除了可能是标记开头的尾巴，其余都可以输出
+            hold = _hold_from(self.buffer, self.prev_char)
+            if self.state == "start" and hold == 0:
+                break
+            self._consume(hold, events)
+            break
+        return events
+
+    def end_iteration(self) -> list:
+        """一次 LLM 调用结束：把缓冲区剩余内容和未产出的工具调用都吐出来"""
+        events = []
+        rest, self.buffer = self.buffer, ""
+        self._emit_text(rest, events)
+        self._flush_action(events)
+        if self.state == "pending":
+            # 整轮都没有标记：模型省略了 Final Answer，直接给了答案
+            answer, self.pending = self.pending.strip(), ""
+            self.state = "final"
+            if answer:
+                events.append((EVENT_FINAL, {"delta": answer}))
+        return events
+
+    # ---------- 内部方法 ----------
+    def _consume(self, length: int, events):
+        """从缓冲区取走前 length 个字符；events 为 None 时直接丢弃 (标记本身)"""
+        if length <= 0:
+            return
+        text, self.buffer = self.buffer[:length], self.buffer[length:]
+        self.prev_char = text[-1]
+        if events is not None:
+            self._emit_text(text, events)
+
+    def _emit_text(self, text: str, events: list):
+        if self.strip_next:
+            text = text.lstrip()
+            self.strip_next = not text
+        if not text:
+            return
+        if self.state == "start":
+            if not text.strip():
+                return
+            # 开头不是 ReAct 标记，说明模型直接给了答案
+            self.state = "final"
+            text = text.lstrip()
+        if self.state == "pending":
+            self.pending += text
+        elif self.state == "final":
+            events.append((EVENT_FINAL, {"delta": text}))
+        elif self.state == "thought":
+            events.append((EVENT_THOUGHT, {"delta": text}))
+        elif self.state == "action":
+            self.action += text
+        elif self.state == "action_input":
+            self.action_input += text
+
+    def _switch(self, kind: str, events: list):
+        if self.state == "pending":
+            # 出现了标记，前面攒着的是思考过程
+            thought, self.pending = self.pending.strip(), ""
+            if thought:
+                events.append((EVENT_THOUGHT, {"delta": thought}))
+        if kind in ("action", "thought", "final", "observation"):
+            self._flush_action(events)
+        if kind == "observation":
+            # 模型自己编了 Observation (stop 词没生效)，后面的内容当思考处理
+            kind = "thought"
+        self.state = kind
+        self.strip_next = True
+
+    def _flush_action(self, events: list):
+        tool = self.action.strip()
+        if tool:
+            tool_input = self.action_input.strip().strip('"').strip()
+            events.append((EVENT_ACTION, {"tool": tool, "input": tool_input}))
+            self.steps += 1
+        self.action = ""
+        self.action_input = ""
+
+
+# 单元测试
+if __name__ == "__main__":
+    def replay(turns, chunk=3):
+        """把每轮输出按 chunk 个字符切开逐段喂进去，返回 事件类型 -> 拼接后的文本 / 工具调用列表"""
+        parser = ReActStreamParser()
+        result = {EVENT_THOUGHT: "", EVENT_FINAL: "", EVENT_ACTION: []}
+        for turn in turns:
+            parser.start_iteration()
+            events = []
+            for i in range(0, len(turn), chunk):
+                events += parser.feed(turn[i:i + chunk])
+            events += parser.end_iteration()
+            for kind, data in events:
+                if kind == EVENT_ACTION:
+                    result[kind].append((data["tool"], data["input"]))
+                else:
+                    result[kind] += data["delta"]
+        return result
+
+    # 第一轮没有标记：直接回答
+    r = replay(["你好！有什么可以帮你？"])
+    assert r[EVENT_FINAL] == "你好！有什么可以帮你？", r
+
+    # 调用工具后的一轮不带 Thought: 标记 (Prompt 已经以 "Thought: " 结尾)
+    r = replay(["Thought: 需要查股价\nAction: stock_tool\nAction Input: AAPL", "我已获得数据。\nFinal Answer: 价格是100"])
+    assert r[EVENT_ACTION] == [("stock_tool", "AAPL")], r
+    assert r[EVENT_THOUGHT] == "需要查股价\n我已获得数据。", r
+    assert r[EVENT_FINAL] == "价格是100", r
+
+    # 工具之后又想了一步、再调一次工具，最后才回答
+    r = replay([
+        "Thought: 先查股价\nAction: stock_tool\nAction Input: AAPL",
+        "还需要天气。\nAction: weather_tool\nAction Input: 杭州",
+        "都拿到了\nFinal Answer: 完成",
+    ], chunk=1)
+    assert r[EVENT_ACTION] == [("stock_tool", "AAPL"), ("weather_tool", "杭州")], r
+    assert "Action" not in r[EVENT_FINAL] and r[EVENT_FINAL] == "完成", r
+
+    # 工具之后整轮都没有标记：当作答案
+    r = replay(["Action: time_tool\nAction Input: now", "现在是下午三点。"])
+    assert r[EVENT_FINAL] == "现在是下午三点。" and r[EVENT_THOUGHT] == "", r
+    print("✅ stream_parser 测试通过")
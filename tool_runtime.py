@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.tools import BaseTool, StructuredTool
+from dotenv import load_dotenv
+
+from metrics import TOOL_DURATION, TOOL_QUEUE_WAIT
+
+load_dotenv()
+
+
+# ==========================================
+# 1. 工具专用线程池
+# ==========================================
+# yfinance / requests / DuckDuckGo 都是阻塞调用，
+# 直接在事件循环里跑会卡住所有会话的流式输出，所以统一丢到这个有界线程池里。
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "16"))
+
+TOOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=TOOL_MAX_WORKERS,
+    thread_name_prefix="agent-tool"
+)
+
+# 每个工具的并发上限：防止某一个慢接口 (比如 yfinance) 把整个线程池占满
+DEFAULT_TOOL_CONCURRENCY = 4
+TOOL_CONCURRENCY = {
+    "stock_tool": 4,
+    "batch_stock_tool": 2,
+    "indicator_tool": 2,
+    # 一次扫描本身就会在 screener 线程池里并发几百个请求，同时跑的扫描不宜多
+    "screener_tool": 1,
+    "weather_tool": 4,
+    "search_tool": 2,
+    "knowledge_base_tool": 2,
+    "time_tool": 8,
+}
+
+
+class ToolLimits:
+    """
+    按工具名存放 asyncio.Semaphore 的容器。
+    信号量在第一次使用时才创建，保证绑定的是 uvicorn 正在运行的事件循环。
+    """
+    semaphores = {}
+
+
+def get_tool_limit(name: str) -> int:
+    """读取工具并发上限，支持环境变量覆盖，如 TOOL_LIMIT_STOCK_TOOL=8"""
+    env_value = os.getenv(f"TOOL_LIMIT_{name.upper()}")
+    if env_value:
+        return max(1, int(env_value))
+    return TOOL_CONCURRENCY.get(name, DEFAULT_TOOL_CONCURRENCY)
+
+
+def _get_semaphore(name: str) -> asyncio.Semaphore:
+    if name not in ToolLimits.semaphores:
+        ToolLimits.semaphores[name] = asyncio.Semaphore(get_tool_limit(name))
+    return ToolLimits.semaphores[name]
+
+
+# ==========================================
+# 2. 异步执行入口
+# ==========================================
+async def run_blocking(name: str, func, *args, **kwargs):
+    """
+    在工具线程池中执行阻塞函数，并受该工具的并发上限约束。
+    contextvars 会一并带入线程，LangChain 的回调链路不会断。
+    """
+    queued_at = time.perf_counter()
+    async with _get_semaphore(name):
+        TOOL_QUEUE_WAIT.observe(time.perf_counter() - queued_at, tool=name)
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        with TOOL_DURATION.time(tool=name):
+            return await loop.run_in_executor(TOOL_EXECUTOR, call)
+
+
+def offload_tool(sync_tool: BaseTool) -> StructuredTool:
+    """
+    给同步工具补上 coroutine：
+    - 同步调用 (invoke) 行为不变；
+    - 异步调用 (ainvoke / astream_events) 走有界线程池，不再阻塞事件循环。
+    """
+    func = sync_tool.func
+    name = sync_tool.name
+
+    async def _acall(*args, **kwargs):
+        return await run_blocking(name, func, *args, **kwargs)
+
+    return StructuredTool.from_function(
+        func=func,
+        coroutine=_acall,
+        name=name,
+        description=sync_tool.description,
+        args_schema=sync_tool.args_schema,
+    )
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+
+# 超过 max_bytes 的这个倍数才触发淘汰，一次淘汰回 max_bytes，避免每次写入都扫描全表
+EVICT_HIGH_WATER = 1.1
+
+
+class EmbeddingStore:
+    """
+    以 (模型名, 文本哈希) 为键的向量磁盘缓存，底层是一个 SQLite 文件。
+    修订版报告 / 重叠的公告里大量片段完全相同，命中后就不用再在 CPU 上重算。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes  # 0 表示不限制大小
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        # 向量总大小的估计值 (覆盖写入会多算，只会让淘汰提前触发，淘汰时重新精确统计)
+        self._approx_bytes = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " vec BLOB NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " PRIMARY KEY (model, hash))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings (last_access)"
+            )
+        return self._conn
+
+    def get_many(self, model: str, hashes: List[str]) -> dict:
+        """批量查询，返回 {hash: vector}，同时刷新命中条目的访问时间"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[h] = vec.tolist()
+                if rows:
+                    conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE model = ? AND hash = ?",
+                        [(now, model, h) for h, _ in rows],
+                    )
+            conn.commit()
+        return found
+
+    def record(self, hits: int, misses: int):
+        """累计命中 / 未命中次数 (入库线程和检索线程会同时调用)"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _total_bytes(self, conn) -> int:
+        """调用方需持有 self._lock"""
+        return conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+
+    def put_many(self, model: str, items: dict):
+        """批量写入 {hash: vector}；估计大小超过高水位时才淘汰"""
+        now = time.time()
+        rows = [(model, h, array("f", vec).tobytes(), now) for h, vec in items.items()]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vec, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+            if self._approx_bytes is None:
+                self._approx_bytes = self._total_bytes(conn)
+            else:
+                self._approx_bytes += sum(len(row[2]) for row in rows)
+            over = self.max_bytes and self._approx_bytes > self.max_bytes * EVICT_HIGH_WATER
+        if over:
+            self.evict(self.max_bytes)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes(self._connect())
+
+    def evict(self, max_bytes: int) -> int:
+        """按最久未访问优先淘汰，直到向量总大小不超过 max_bytes，返回删除条数"""
+        removed = 0
+        with self._lock:
+            conn = self._connect()
+            total = self._total_bytes(conn)
+            if total <= max_bytes:
+                self._approx_bytes = total
+                return 0
+            rows = conn.execute(
+                "SELECT model, hash, LENGTH(vec) FROM embeddings ORDER BY last_access"
+            )
+            victims = []
+            for model, h, size in rows:
+                if total <= max_bytes:
+                    break
+                victims.append((model, h))
+                total -= size
+            conn.executemany("DELETE FROM embeddings WHERE model = ? AND hash = ?", victims)
+            conn.commit()
+            self._approx_bytes = total
+            removed = len(victims)
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            entries = 0
+            if self._conn is not None or os.path.exists(self.path):
+                entries = self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "name": "embedding",
+            "entries": entries,
+            "bytes": self.size_bytes() if entries else 0,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    给任意 Embeddings 套一层磁盘缓存：只把没命中的片段按批次送去编码。
+    检索时的 query 每次都不一样，直接透传给底层模型。
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, store: EmbeddingStore,
+                 batch_size: int = 64):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store
+        self.batch_size = batch_size
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self.text_hash(t) for t in texts]
+        cached = self.store.get_many(self.model_name, list(dict.fromkeys(hashes)))
+
+        # 同一批里重复的片段也只算一次
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        self.store.record(len(texts) - len(missing), len(missing))
+
+        miss_hashes = list(missing)
+        for i in range(0, len(miss_hashes), self.batch_size):
+            batch = miss_hashes[i:i + self.batch_size]
+            vectors = self.underlying.embed_documents([missing[h] for h in batch])
+            computed = dict(zip(batch, vectors))
+            self.store.put_many(self.model_name, computed)
+            cached.update(computed)
+
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
@@ -0,0 +1,116 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pypdf import PdfReader
+
+from tools.pdf_worker import extract_page_range
+
+# 解析进程数：默认等于 CPU 核数；设为 0 则在当前进程里顺序解析
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# 每个任务解析多少页
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_worker.py")
+
+
+class ParseWorker:
+    """
+    一个常驻的解析子进程 (tools/pdf_worker.py)，同一时间只处理一个请求。
+    进程池是在入库线程里创建的，此时进程里已经加载了 torch / FAISS 并有多个线程在跑，
+    直接 fork 可能继承到被别的线程持有的锁而死锁；multiprocessing 的 spawn / forkserver
+    又会在每个子进程里重新导入 main.py。这里直接 exec 一个只依赖 pypdf 的小脚本。
+    """
+
+    def __init__(self):
+        self.proc = None
+        self._start()
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+
+    def call(self, file_path, start: int, end: int) -> list:
+        try:
+            self.proc.stdin.write(json.dumps([file_path, start, end], ensure_ascii=False) + "\n")
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError):
+            line = ""
+        if not line:
+            # 子进程挂了 (比如被 OOM kill)，换一个新的，本次任务报错
+            self.proc.kill()
+            self._start()
+            raise RuntimeError(f"PDF 解析进程异常退出: {file_path} 第 {start}-{end} 页")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"PDF 解析失败: {reply['error']}")
+        return [(i, text) for i, text in reply["pages"]]
+
+
+class ParsePool:
+    """解析进程池容器，第一次用到时才创建"""
+    idle = None       # 空闲的 ParseWorker
+    executor = None   # 把任务分派给空闲子进程的线程
+    lock = threading.Lock()
+
+
+def _get_pool():
+    with ParsePool.lock:
+        if ParsePool.executor is None:
+            ParsePool.idle = queue.Queue()
+            for _ in range(PDF_PARSE_WORKERS):
+                ParsePool.idle.put(ParseWorker())
+            ParsePool.executor = ThreadPoolExecutor(
+                max_workers=PDF_PARSE_WORKERS, thread_name_prefix="pdf-parse"
+            )
+    return ParsePool.executor
+
+
+def _run_task(file_path, start: int, end: int) -> list:
+    worker = ParsePool.idle.get()
+    try:
+        return worker.call(file_path, start, end)
+    finally:
+        ParsePool.idle.put(worker)
+
+
+def count_pages(file_path) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def iter_pdf_pages(file_path, total_pages: int = None):
+    """
+    按页码顺序逐页产出 (页码, 文本)。
+    多进程并行解析，但同时在途的任务数有上限 (进程数 × 2)，
+    消费方处理得慢时不会把整本招股书都堆在内存里。
+    """
+    total_pages = count_pages(file_path) if total_pages is None else total_pages
+    ranges = [(s, min(s + PDF_PAGES_PER_TASK, total_pages))
+              for s in range(0, total_pages, PDF_PAGES_PER_TASK)]
+
+    if PDF_PARSE_WORKERS <= 0:
+        for start, end in ranges:
+            yield from extract_page_range(file_path, start, end)
+        return
+
+    pool = _get_pool()
+    max_inflight = PDF_PARSE_WORKERS * 2
+    pending = deque()
+    next_range = 0
+    while next_range < len(ranges) or pending:
+        while next_range < len(ranges) and len(pending) < max_inflight:
+            start, end = ranges[next_range]
+            pending.append(pool.submit(_run_task, file_path, start, end))
+            next_range += 1
+        yield from pending.popleft().result()
@@ -0,0 +1,32 @@
+import json
+import sys
+
+from pypdf import PdfReader
+
+# PDF 解析子进程的入口，由 pdf_pipeline 用 `python tools/pdf_worker.py` 直接启动。
+# 这个文件只依赖 pypdf，子进程不会去导入 main.py / langchain / 向量模型；
+# multiprocessing 的 spawn / forkserver 都会在每个子进程里重新导入父进程的 __main__，所以这里不用它。
+#
+# 协议：stdin 每行一个请求 [文件路径, 起始页, 结束页]，stdout 每行一个 JSON 回复
+# {"pages": [[页码, 文本], ...]} 或 {"error": "..."}；stdin 关闭 (父进程退出) 时子进程随之退出。
+
+
+def extract_page_range(file_path, start: int, end: int) -> list:
+    """解析 [start, end) 页，返回 [(页码, 文本), ...]"""
+    reader = PdfReader(file_path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def main():
+    for line in sys.stdin:
+        file_path, start, end = json.loads(line)
+        try:
+            reply = {"pages": extract_page_range(file_path, start, end)}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        sys.stdout.write(json.dumps(reply, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+日线行情 (OHLCV) 的本地列式缓存：每只股票一个 Parquet 文件，
+请求时只向 yfinance 增量拉取最后一根 K 线之后的数据，画图 / 算指标都变成本地读取。
+
+    python -m tools.price_history AAPL 6mo
+"""
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from tools.tool4_finance import normalize_ticker
+from tools.tool_cache import TTLCache
+
+load_dotenv()
+
+# ==========================================
+# 1. 配置
+# ==========================================
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+PRICE_HISTORY_DIR = os.getenv("PRICE_HISTORY_DIR", os.path.join(CACHE_DIR, "price_history"))
+# 距上次向 yfinance 检查新 K 线超过这么多秒才会再检查 (盘中最后一根 K 线会被覆盖更新)
+PRICE_HISTORY_REFRESH_SECONDS = float(os.getenv("PRICE_HISTORY_REFRESH_SECONDS", "300"))
+# 第一次拉某只股票时至少拉多长，之后请求更短的区间都不用再回源
+PRICE_HISTORY_BOOTSTRAP_PERIOD = os.getenv("PRICE_HISTORY_BOOTSTRAP_PERIOD", "1y")
+PRICE_HISTORY_CACHE_SIZE = int(os.getenv("PRICE_HISTORY_CACHE_SIZE", "256"))
+
+COLUMNS = ("date", "open", "high", "low", "close", "volume")
+PERIODS = ("5d", "1mo", "3mo", "6mo", "ytd", "1y", "2y", "5y", "10y", "max")
+_PERIOD_RE = re.compile(r"^(\d+)(d|mo|y)$")
+# 代码会拼进文件路径，只允许 yfinance 代码里会出现的字符 (AAPL、600519.SS、^GSPC、EURUSD=X、BRK-B)
+_TICKER_RE = re.compile(r"^[A-Z0-9.^=-]{1,15}$")
+
+# 内存里的热数据：ticker -> {"frame", "since", "checked_at"}，过期后再走一次增量检查
+history_cache = TTLCache("price_history", maxsize=PRICE_HISTORY_CACHE_SIZE, ttl=PRICE_HISTORY_REFRESH_SECONDS)
+# 按代码哈希分到固定数量的锁上 (锁分段)，不会每来一个新代码就多一把锁
+_FILE_LOCK_STRIPES = 64
+_file_locks = [threading.Lock() for _ in range(_FILE_LOCK_STRIPES)]
+
+
+def _file_lock(ticker: str) -> threading.Lock:
+    return _file_locks[hash(ticker) % _FILE_LOCK_STRIPES]
+
+
+def validate_ticker(ticker: str) -> str:
+    """规范化代码并校验字符集，不合法时抛 ValueError (防止 ../ 之类拼出缓存目录以外的路径)"""
+    code = normalize_ticker(ticker or "")
+    if not _TICKER_RE.match(code) or code.strip(".") == "":
+        raise ValueError(f"非法的股票代码: {ticker}")
+    return code
+
+
+def period_start(period: str, today: date = None):
+    """把 yfinance 风格的区间换算成起始日期；'max' 返回 None，'5d' 这类按交易日数在读取时截取"""
+    today = today or date.today()
+    period = (period or "").lower()
+    if period == "max":
+        return None
+    if period == "ytd":
+        return date(today.year, 1, 1)
+    match = _PERIOD_RE.match(period)
+    if not match:
+        raise ValueError(f"不支持的区间: {period}，可选 {', '.join(PERIODS)}")
+    n, unit = int(match.group(1)), match.group(2)
+    if unit == "d":
+        # 交易日数换算成日历日，多留出周末和节假日
+        return today - timedelta(days=n * 2 + 7)
+    if unit == "mo":
+        return (pd.Timestamp(today) - pd.DateOffset(months=n)).date()
+    return (pd.Timestamp(today) - pd.DateOffset(years=n)).date()
+
+
+def _covers(since, start) -> bool:
+    """已缓存的起点 since 是否覆盖了 start (None 表示全部历史)"""
+    if since == "max":
+        return True
+    if start is None:
+        return False
+    return date.fromisoformat(since) <= start
+
+
+# ==========================================
+# 2. Parquet 读写
+# ==========================================
+def _path(ticker: str) -> str:
+    return os.path.join(PRICE_HISTORY_DIR, f"{ticker}.parquet")
+
+
+def _read(ticker: str):
+    """返回 (frame, meta)；文件不存在时返回 (None, {})"""
+    path = _path(ticker)
+    if not os.path.exists(path):
+        return None, {}
+    table = pq.read_table(path, memory_map=True)
+    meta = json.loads((table.schema.metadata or {}).get(b"price_history", b"{}"))
+    return table.to_pandas(), meta
+
+
+def _write(ticker: str, frame: pd.DataFrame, meta: dict):
+    """先写临时文件再原子替换，读的一方不会看到写了一半的文件"""
+    os.makedirs(PRICE_HISTORY_DIR, exist_ok=True)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"price_history": json.dumps(meta).encode("utf-8"),
+    })
+    tmp_path = _path(ticker) + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, _path(ticker))
+
+
+# ==========================================
+# 3. 回源拉取
+# ==========================================
+def _fetch(ticker: str, start=None):
+    """
+    从 yfinance 拉取 start (含) 之后的日线，返回 (frame, action_dates)。
+    action_dates 是有分红 / 拆股的日期：前复权价格会整体变化，这之前存的数据需要重拉。
+    """
+    import yfinance as yf
+
+    if start is None:
+        hist = yf.Ticker(ticker).history(period="max", interval="1d", auto_adjust=True, actions=True)
+    else:
+        hist = yf.Ticker(ticker).history(start=start.isoformat(), interval="1d", auto_adjust=True, actions=True)
+    if hist is None or hist.empty:
+        return _empty(), []
+
+    index = hist.index
+    if getattr(index, "tz", None) is not None:
+        index = index.tz_localize(None)
+    index = index.normalize()
+    has_action = pd.Series(False, index=hist.index)
+    for column in ("Dividends", "Stock Splits"):
+        if column in hist.columns:
+            has_action |= hist[column].fillna(0) != 0
+    frame = pd.DataFrame({
+        "date": index,
+        "open": hist["Open"].to_numpy(dtype="float64"),
+        "high": hist["High"].to_numpy(dtype="float64"),
+        "low": hist["Low"].to_numpy(dtype="float64"),
+        "close": hist["Close"].to_numpy(dtype="float64"),
+        "volume": hist["Volume"].to_numpy(dtype="float64"),
+    })
+    frame = frame.drop_duplicates("date", keep="last").reset_index(drop=True)
+    return frame, list(index[has_action.to_numpy()])
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame({
+        "date": pd.Series(dtype="datetime64[ns]"),
+        **{column: pd.Series(dtype="float64") for column in COLUMNS[1:]},
+    })
+
+
+def _sync(ticker: str, start) -> dict:
+    """
+    读本地文件，按需回源：
+    - 本地没有或覆盖不到 start：从 start 起全量拉取；
+    - 距上次检查超过 PRICE_HISTORY_REFRESH_SECONDS：从最后一根 K 线 (含，盘中会变) 起增量拉取；
+    - 增量里出现分红 / 拆股：复权价格变了，整段重拉。
+    回源失败时如果本地有数据，就先用旧数据。
+    """
+    with _file_lock(ticker):
+        frame, meta = _read(ticker)
+        since = meta.get("since")
+        checked_at = meta.get("checked_at", 0)
+        try:
+            if frame is None or frame.empty or not since or not _covers(since, start):
+                frame, _ = _fetch(ticker, start)
+                since = start.isoformat() if start else "max"
+                print(f"📥 {ticker} 日线全量拉取: {len(frame)} 根 (起点 {since})")
+            elif time.time() - checked_at >= PRICE_HISTORY_REFRESH_SECONDS:
+                last = frame["date"].iloc[-1].date()
+                new, action_dates = _fetch(ticker, last)
+                if any(d.date() > last for d in action_dates):
+                    start = None if since == "max" else date.fromisoformat(since)
+                    frame, _ = _fetch(ticker, start)
+                    print(f"📥 {ticker} 出现分红/拆股，复权数据整段重拉: {len(frame)} 根")
+                elif not new.empty:
+                    frame = pd.concat([frame[frame["date"] < new["date"].iloc[0]], new], ignore_index=True)
+            else:
+                return {"frame": frame, "since": since, "checked_at": checked_at}
+        except Exception as e:
+            if frame is None or frame.empty:
+                raise
+            print(f"⚠️ {ticker} 日线回源失败，使用本地数据: {e}")
+            return {"frame": frame, "since": since, "checked_at": checked_at}
+
+        if frame.empty:
+            # 代码不存在 / 停牌太久：不落盘，交给调用方提示
+            return {"frame": frame, "since": since, "checked_at": time.time()}
+        checked_at = time.time()
+        _write(ticker, frame, {"since": since, "checked_at": checked_at})
+        return {"frame": frame, "since": since, "checked_at": checked_at}
+
+
+# ==========================================
+# 4. 对外接口
+# ==========================================
+def get_history(ticker: str, period: str = "3mo") -> pd.DataFrame:
+    """
+    取某只股票最近 period 的日线 (date/open/high/low/close/volume，前复权)。
+    热数据在内存里，冷数据读本地 Parquet，只有新 K 线才回源 yfinance。
+    代码或区间不合法时抛 ValueError。
+    """
+    ticker = validate_ticker(ticker)
+    start = period_start(period)
+    bootstrap = period_start(PRICE_HISTORY_BOOTSTRAP_PERIOD)
+    if start is None or bootstrap is None:
+        start = None
+    else:
+        start = min(start, bootstrap)
+
+    entry = history_cache.get_or_load(ticker, lambda: _sync(ticker, start))
+    if not _covers(entry["since"], start):
+        # 请求的区间比已缓存的长：往前补数据
+        history_cache.invalidate(ticker)
+        entry = history_cache.get_or_load(ticker, lambda: _sync(ticker, start))
+
+    frame = entry["frame"]
+    match = _PERIOD_RE.match(period.lower())
+    if match and match.group(2) == "d":
+        return frame.tail(int(match.group(1))).reset_index(drop=True)
+    wanted = period_start(period)
+    if wanted is None:
+        return frame
+    return frame[frame["date"] >= pd.Timestamp(wanted)].reset_index(drop=True)
+
+
+def history_to_columns(frame: pd.DataFrame) -> dict:
+    """转成按列组织的 JSON (比逐行的对象数组小得多，前端可直接 pd.DataFrame(columns) 还原)"""
+    columns = {"date": frame["date"].dt.strftime("%Y-%m-%d").tolist()}
+    for column in COLUMNS[1:]:
+        columns[column] = [None if pd.isna(v) else round(float(v), 4) for v in frame[column].to_numpy()]
+    return columns
+
+
+def get_price_history_stats() -> dict:
+    stats = history_cache.stats()
+    stats["dir"] = PRICE_HISTORY_DIR
+    stats["tickers_on_disk"] = len([f for f in os.listdir(PRICE_HISTORY_DIR) if f.endswith(".parquet")]) \
+        if os.path.isdir(PRICE_HISTORY_DIR) else 0
+    return stats
+
+
+# 单元测试
+if __name__ == "__main__":
+    import sys
+
+    args = sys.argv[1:] or ["AAPL"]
+    start_time = time.perf_counter()
+    df = get_history(args[0], args[1] if len(args) > 1 else "3mo")
+    print(df.tail())
+    print(f"{len(df)} 根 K 线, 耗时 {time.perf_counter() - start_time:.3f}s")
+    start_time = time.perf_counter()
+    get_history(args[0], args[1] if len(args) > 1 else "3mo")
+    print(f"第二次读取耗时 {time.perf_counter() - start_time:.6f}s")
@@ -0,0 +1,286 @@
+"""
+知识库的 "基础索引"：把所有文档 shard 合成一个可训练的 FAISS 索引 (IVF / HNSW / IVF-PQ)，
+检索代价不再随语料线性增长；落盘后可以 mmap 加载，多个 worker 进程共享同一份页缓存。
+
+    python -m tools.rag_index info
+    python -m tools.rag_index rebuild --type ivf
+    python -m tools.rag_index rebuild --type hnsw --namespace team-a
+"""
+import json
+import math
+import os
+import pickle
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+# ==========================================
+# 1. 配置
+# ==========================================
+# flat：精确检索 (原来的行为)；ivf：倒排 + 精确向量；hnsw：图索引；pq：倒排 + 乘积量化 (内存最省)
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq")
+KB_INDEX_TYPE = os.getenv("KB_INDEX_TYPE", "flat").lower()
+# IVF 聚类中心数，0 表示按向量数自动取 4 * sqrt(n)
+KB_IVF_NLIST = int(os.getenv("KB_IVF_NLIST", "0"))
+# 每次检索扫描的聚类数，越大召回越高、越慢
+KB_IVF_NPROBE = int(os.getenv("KB_IVF_NPROBE", "16"))
+KB_HNSW_M = int(os.getenv("KB_HNSW_M", "32"))
+KB_HNSW_EF_CONSTRUCTION = int(os.getenv("KB_HNSW_EF_CONSTRUCTION", "200"))
+KB_HNSW_EF_SEARCH = int(os.getenv("KB_HNSW_EF_SEARCH", "64"))
+# PQ 子空间数 (需整除向量维度，不能整除时自动取不超过它的最大约数)，每个子空间的编码位数
+KB_PQ_M = int(os.getenv("KB_PQ_M", "16"))
+KB_PQ_NBITS = int(os.getenv("KB_PQ_NBITS", "8"))
+# 训练最多采样多少条向量，语料再大训练时间也有上限
+KB_TRAIN_SAMPLE = int(os.getenv("KB_TRAIN_SAMPLE", "100000"))
+# 是否以 mmap 方式加载基础索引 (只读)，多进程部署时共享内存页
+KB_MMAP = os.getenv("KB_MMAP", "0") == "1"
+
+# faiss 聚类要求每个中心至少 39 个训练点，数据太少时自动退回更简单的索引
+_MIN_POINTS_PER_CENTROID = 39
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+# 基础索引的文档不再整份 pickle 进内存，而是按 FAISS 行号存在 SQLite 里，检索时只读命中的几行
+SQLITE_DOCSTORE_FILE = "docstore.sqlite"
+
+
+def _faiss():
+    import faiss
+
+    return faiss
+
+
+def _auto_nlist(n: int) -> int:
+    if KB_IVF_NLIST > 0:
+        return KB_IVF_NLIST
+    return max(1, min(int(4 * math.sqrt(n)), n // _MIN_POINTS_PER_CENTROID))
+
+
+def _pq_m(dim: int) -> int:
+    m = min(KB_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def effective_index_type(index_type: str, n: int) -> str:
+    """按数据量降级：向量太少时训练不出像样的聚类 / 码本，用更简单的索引更准也更快"""
+    if index_type == "pq" and n < (1 << KB_PQ_NBITS) * _MIN_POINTS_PER_CENTROID:
+        index_type = "ivf"
+    if index_type == "ivf" and n < 1000:
+        index_type = "flat"
+    return index_type
+
+
+def index_factory_string(index_type: str, dim: int, n: int) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf":
+        return f"IVF{_auto_nlist(n)},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{KB_HNSW_M}"
+    if index_type == "pq":
+        return f"IVF{_auto_nlist(n)},PQ{_pq_m(dim)}x{KB_PQ_NBITS}"
+    raise ValueError(f"不支持的索引类型: {index_type}，可选 {', '.join(INDEX_TYPES)}")
+
+
+def tune_index(index):
+    """设置检索期参数 (不写进文件，每次加载后调用)"""
+    faiss = _faiss()
+    try:
+        faiss.extract_index_ivf(index).nprobe = KB_IVF_NPROBE
+    except Exception:
+        pass
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = KB_HNSW_EF_SEARCH
+    return index
+
+
+# ==========================================
+# 2. 读写
+# ==========================================
+def read_index(path: str, mmap: bool = False):
+    """读取 FAISS 索引文件；mmap=True 时只读映射，失败 (旧版本 faiss / 不支持的类型) 则整份读入内存"""
+    faiss = _faiss()
+    if mmap:
+        flag_sets = []
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            flag_sets.append(faiss.IO_FLAG_MMAP_IFC)
+        flag_sets.append(faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        for flags in flag_sets:
+            try:
+                return faiss.read_index(path, flags)
+            except Exception as e:
+                print(f"⚠️ mmap 加载失败 (flags={flags}): {e}")
+    return faiss.read_index(path)
+
+
+class SQLiteDocstore:
+    """
+    只读的文档存储 (实现 langchain Docstore 的 search 接口)，键是 FAISS 行号。
+    连接只有一个，检索线程之间用锁串行 (每次只按主键读一行)；
+    rebuild 删掉旧版本目录后，已打开的连接仍然可以继续读。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def search(self, search):
+        from langchain_core.documents import Document
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, metadata FROM docs WHERE row = ?", (int(search),)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+
+class _RowIds(Mapping):
+    """FAISS 行号 -> 文档键 的映射，SQLite 文档存储里两者相同，不用在内存里建一张大表"""
+
+    def __init__(self, ntotal: int):
+        self.ntotal = ntotal
+
+    def __getitem__(self, row):
+        row = int(row)
+        if not 0 <= row < self.ntotal:
+            raise KeyError(row)
+        return row
+
+    def __iter__(self):
+        return iter(range(self.ntotal))
+
+    def __len__(self):
+        return self.ntotal
+
+
+def read_folder(folder: str, mmap: bool = False):
+    """
+    读取索引目录，返回 (index, docstore, index_to_docstore_id)。
+    基础索引的文档在 SQLite 里；文档 shard 和旧版基础索引是 FAISS.save_local 的 pickle 格式。
+    """
+    index = read_index(os.path.join(folder, INDEX_FILE), mmap=mmap)
+    sqlite_path = os.path.join(folder, SQLITE_DOCSTORE_FILE)
+    if os.path.exists(sqlite_path):
+        return index, SQLiteDocstore(sqlite_path), _RowIds(index.ntotal)
+    with open(os.path.join(folder, DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return index, docstore, index_to_docstore_id
+
+
+def _vectors(index) -> np.ndarray:
+    """取出 shard (精确的 Flat 索引) 里的全部原始向量"""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# ==========================================
+# 3. 训练 + 构建
+# ==========================================
+def build_index(sources: list, index_type: str, out_dir: str, progress=None) -> dict:
+    """
+    从若干 FAISS 目录 (每个文档的 shard，都是 Flat) 构建一个基础索引写到 out_dir。
+    两遍扫描：第一遍按比例采样训练向量，第二遍逐个 shard 追加，
+    内存里同时只有一个 shard 的向量 + 训练样本，不需要把整个语料读进来；
+    文档边扫描边写进 SQLite (键是 FAISS 行号)，也不会在内存里攒成一个大 docstore。
+    progress(vectors_done, vectors_total) 每处理完一个 shard 回调一次。
+    返回 {"index_type", "factory", "ntotal", "dim"}
+    """
+    faiss = _faiss()
+    progress = progress or (lambda done, total: None)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}，可选 {', '.join(INDEX_TYPES)}")
+
+    sizes = []
+    dim = None
+    for folder in sources:
+        index = read_index(os.path.join(folder, INDEX_FILE))
+        sizes.append(index.ntotal)
+        dim = dim or index.d
+    total = sum(sizes)
+    if not total:
+        raise ValueError("知识库为空，没有可构建的向量")
+
+    effective = effective_index_type(index_type, total)
+    factory = index_factory_string(effective, dim, total)
+    if effective != index_type:
+        print(f"⚠️ 向量数 {total} 太少，索引类型 {index_type} 降级为 {effective}")
+    index = faiss.index_factory(dim, factory)
+
+    # 1. 训练 (Flat / HNSW 不需要)
+    if not index.is_trained:
+        ratio = min(1.0, KB_TRAIN_SAMPLE / total)
+        rng = np.random.default_rng(0)
+        samples = []
+        for folder, size in zip(sources, sizes):
+            vectors = _vectors(read_index(os.path.join(folder, INDEX_FILE)))
+            take = max(1, int(round(size * ratio)))
+            samples.append(vectors[rng.choice(size, size=min(take, size), replace=False)])
+        train = np.ascontiguousarray(np.vstack(samples), dtype="float32")
+        print(f"🏋️ 训练 {factory} ({len(train)} 条样本)...")
+        index.train(train)
+        del samples, train
+
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = KB_HNSW_EF_CONSTRUCTION
+
+    # 2. 逐个 shard 追加向量和文档，SQLite 里的行号与 FAISS 行号一一对应
+    os.makedirs(out_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(out_dir, SQLITE_DOCSTORE_FILE))
+    try:
+        # 新建的文件，失败时整个目录会被删掉，不需要日志和同步写
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE docs (row INTEGER PRIMARY KEY, doc_key TEXT NOT NULL,"
+            " content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        done = 0
+        for folder in sources:
+            shard_index, shard_store, shard_ids = read_folder(folder)
+            index.add(np.ascontiguousarray(_vectors(shard_index), dtype="float32"))
+            rows = []
+            for row in range(shard_index.ntotal):
+                doc_key = shard_ids[row]
+                doc = shard_store.search(doc_key)
+                rows.append((done + row, str(doc_key), doc.page_content,
+                             json.dumps(doc.metadata, ensure_ascii=False, default=str)))
+            conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+            done += shard_index.ntotal
+            del shard_index, shard_store, shard_ids, rows
+            progress(done, total)
+    finally:
+        conn.close()
+
+    faiss.write_index(index, os.path.join(out_dir, INDEX_FILE))
+    print(f"✅ 基础索引构建完成: {factory}, {index.ntotal} 条向量")
+    return {"index_type": effective, "factory": factory, "ntotal": int(index.ntotal), "dim": int(dim)}
+
+
+# ==========================================
+# 4. 命令行
+# ==========================================
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="用全部文档 shard 重新训练并构建基础索引")
+    rebuild.add_argument("--type", choices=INDEX_TYPES, default=None, help="默认取 KB_INDEX_TYPE")
+    info = sub.add_parser("info", help="查看当前基础索引信息")
+    for command in (rebuild, info):
+        command.add_argument("--namespace", default=None, help="知识库 namespace，默认为 default")
+    args = parser.parse_args()
+
+    from tools.tool5_rag import rebuild_knowledge_base, get_index_info
+
+    if args.command == "rebuild":
+        print(json.dumps(rebuild_knowledge_base(args.type, namespace=args.namespace), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(get_index_info(args.namespace), ensure_ascii=False, indent=2))
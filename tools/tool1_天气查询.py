@@ -1,12 +1,148 @@
 # tool1_天气查询.py
-import requests,os
+import csv
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+
+from tools.tool_cache import TTLCache
+
 load_dotenv()
 
+# ==========================================
+# 1. 连接池 & 缓存配置
+# ==========================================
+# 复用 keep-alive 连接，重复查询不再每次握手
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+# 城市名 -> adcode 的映射基本不会变，落盘永久缓存
+ADCODE_CACHE_PATH = os.getenv("ADCODE_CACHE_PATH", os.path.join(CACHE_DIR, "adcode.json"))
+# 可选：本地行政区划表 (CSV: 城市名,adcode[,全称] 或 JSON: {城市名: adcode})，启动时预加载
+ADCODE_TABLE = os.getenv("ADCODE_TABLE", "")
+
+# 实时天气按 adcode 短时缓存，高德实况本身大约半小时更新一次
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+weather_cache = TTLCache("weather", maxsize=int(os.getenv("WEATHER_CACHE_SIZE", "512")), ttl=WEATHER_CACHE_TTL)
+
+
+class AdcodeStore:
+    """城市名 -> (adcode, 完整名称) 的持久化缓存容器"""
+    mapping = None
+    lock = threading.Lock()
+
+
+def _normalize_city(city: str) -> str:
+    return "".join(str(city).split()).strip("'\"")
+
+
+def _load_adcodes():
+    """第一次用到时从磁盘读取缓存，并合并本地行政区划表"""
+    if AdcodeStore.mapping is not None:
+        return AdcodeStore.mapping
+    with AdcodeStore.lock:
+        if AdcodeStore.mapping is not None:
+            return AdcodeStore.mapping
+        mapping = {}
+        if os.path.exists(ADCODE_CACHE_PATH):
+            try:
+                with open(ADCODE_CACHE_PATH, "r", encoding="utf-8") as f:
+                    mapping = json.load(f)
+            except Exception as e:
+                print(f"⚠️ adcode 缓存读取失败，将重新构建: {e}")
+        AdcodeStore.mapping = mapping
+    if ADCODE_TABLE:
+        preload_adcodes(ADCODE_TABLE)
+    return AdcodeStore.mapping
+
+
+def _save_adcodes():
+    """先写临时文件再替换，避免进程中途退出留下半个 JSON"""
+    os.makedirs(os.path.dirname(ADCODE_CACHE_PATH) or ".", exist_ok=True)
+    tmp_path = ADCODE_CACHE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(AdcodeStore.mapping, f, ensure_ascii=False)
+    os.replace(tmp_path, ADCODE_CACHE_PATH)
+
+
+def preload_adcodes(table_path: str) -> int:
+    """
+    从本地表批量导入城市 -> adcode，返回导入条数。
+    CSV 每行：城市名,adcode[,完整名称]；JSON：{"杭州": "330100", ...}
+    """
+    mapping = _load_adcodes()
+    entries = {}
+    if table_path.endswith(".json"):
+        with open(table_path, "r", encoding="utf-8") as f:
+            for city, adcode in json.load(f).items():
+                entries[_normalize_city(city)] = [str(adcode), city]
+    else:
+        with open(table_path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 2 or not row[1].strip().isdigit():
+                    continue  # 跳过表头和空行
+                name = row[2].strip() if len(row) > 2 and row[2].strip() else row[0].strip()
+                entries[_normalize_city(row[0])] = [row[1].strip(), name]
+
+    with AdcodeStore.lock:
+        mapping.update(entries)
+        _save_adcodes()
+    return len(entries)
+
+
+def resolve_adcode(city: str, api_key: str):
+    """城市名 -> (adcode, 完整名称)，先查本地缓存，查不到才请求高德行政区划接口"""
+    key = _normalize_city(city)
+    mapping = _load_adcodes()
+    if key in mapping:
+        adcode, full_name = mapping[key]
+        return adcode, full_name
+
+    # 这里的 city 可能是 "杭州" 也可能是 "杭州市"，高德都能识别
+    geo_res = session.get(
+        "https://restapi.amap.com/v3/config/district",
+        params={"keywords": city, "subdistrict": 0, "key": api_key},
+        timeout=5,
+    ).json()
+    if geo_res['status'] != '1' or not geo_res['districts']:
+        return None, None
+
+    adcode = geo_res['districts'][0]['adcode']
+    full_name = geo_res['districts'][0]['name']
+    with AdcodeStore.lock:
+        mapping[key] = [adcode, full_name]
+        _save_adcodes()
+    return adcode, full_name
+
+
+def _fetch_live_weather(adcode: str, api_key: str):
+    weather_res = session.get(
+        "https://restapi.amap.com/v3/weather/weatherInfo",
+        params={"city": adcode, "key": api_key},
+        timeout=5,
+    ).json()
+    if weather_res['status'] == '1' and weather_res['lives']:
+        return weather_res['lives'][0]
+    return None
+
+
+def get_weather_cache_stats() -> dict:
+    stats = weather_cache.stats()
+    stats["adcodes"] = len(_load_adcodes())
+    return stats
+
+
+# ==========================================
+# 2. 对外接口
+# ==========================================
 def get_weather(city):
     """
     使用高德地图API查询天气
-    流程：先通过城市名查行政区划编码(adcode)，再通过编码查天气
+    流程：先通过城市名查行政区划编码(adcode，本地缓存)，再通过编码查天气(短时缓存)
     """
     # ⚠️⚠️⚠️ 在这里填入你的高德 Key ⚠️⚠️⚠️
     API_KEY = os.getenv("API_KEY")
@@ -16,22 +152,14 @@ def get_weather(city):
 
     try:
         # 1. 地理编码：把“杭州”变成“330100”
-        # 这里的 city 可能是 "杭州" 也可能是 "杭州市"，高德都能识别
-        geo_url = f"https://restapi.amap.com/v3/config/district?keywords={city}&subdistrict=0&key={API_KEY}"
-        geo_res = requests.get(geo_url, timeout=5).json()
-
-        if geo_res['status'] != '1' or not geo_res['districts']:
+        adcode, full_city_name = resolve_adcode(city, API_KEY)
+        if not adcode:
             return f"未找到城市：{city}，请检查名称是否正确"
 
-        adcode = geo_res['districts'][0]['adcode']
-        full_city_name = geo_res['districts'][0]['name']
-
         # 2. 天气查询
-        weather_url = f"https://restapi.amap.com/v3/weather/weatherInfo?city={adcode}&key={API_KEY}"
-        weather_res = requests.get(weather_url, timeout=5).json()
+        live = weather_cache.get_or_load(adcode, lambda: _fetch_live_weather(adcode, API_KEY))
 
-        if weather_res['status'] == '1' and weather_res['lives']:
-            live = weather_res['lives'][0]
+        if live:
             # 组装一段自然的回复
             return (f"【{full_city_name}实时天气】\n"
                     f"天气现象：{live['weather']}\n"
@@ -52,4 +180,5 @@ if __name__ == "__main__":
     print("正在测试高德API...")
     print(get_weather("杭州"))
     print("-" * 20)
-    print(get_weather("北京"))
\ No newline at end of file
+    print(get_weather("北京"))
+    print(get_weather_cache_stats())
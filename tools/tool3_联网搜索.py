@@ -1,10 +1,104 @@
-from langchain_community.tools import DuckDuckGoSearchRun
-search_engine = DuckDuckGoSearchRun()
+import atexit
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from dotenv import load_dotenv
+
+from tools.tool_cache import TTLCache
+
+load_dotenv()
+
+# 第一次搜索时才创建，启动时不加载 duckduckgo 相关依赖
+search_engine = None
+
+
+def get_search_engine():
+    global search_engine
+    if search_engine is None:
+        from langchain_community.tools import DuckDuckGoSearchRun
+        search_engine = DuckDuckGoSearchRun()
+    return search_engine
+
+# 搜索结果缓存：多个会话问同一个 "Tesla latest news" 只真正搜一次，也能少触发限流
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", os.path.join(CACHE_DIR, "search.json"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+# 落盘间隔：避免每次 miss 都重写整个文件，退出时也会再写一次
+SEARCH_CACHE_FLUSH_SECONDS = float(os.getenv("SEARCH_CACHE_FLUSH_SECONDS", "30"))
+search_cache = TTLCache(
+    "search",
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "1000")),
+    ttl=SEARCH_CACHE_TTL,
+    max_bytes=int(float(os.getenv("SEARCH_CACHE_MAX_MB", "16")) * 1024 * 1024),
+    sizer=lambda value: len(value.encode("utf-8")),
+)
+
+
+class SearchCacheState:
+    """记录缓存是否已从磁盘恢复、上次落盘时间"""
+    loaded = False
+    last_flush = 0.0
+    lock = threading.Lock()
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、转小写、压缩空白、去掉首尾标点，让写法不同的同一问题命中同一个 key"""
+    query = unicodedata.normalize("NFKC", query or "").lower()
+    query = re.sub(r"\s+", " ", query)
+    return query.strip(" \t\"'“”‘’?？!！。.,，")
+
+
+def _ensure_loaded():
+    if SearchCacheState.loaded:
+        return
+    with SearchCacheState.lock:
+        if SearchCacheState.loaded:
+            return
+        try:
+            count = search_cache.load(SEARCH_CACHE_PATH)
+            if count:
+                print(f"📂 已恢复 {count} 条搜索缓存")
+        except Exception as e:
+            print(f"⚠️ 搜索缓存读取失败: {e}")
+        SearchCacheState.last_flush = time.monotonic()
+        SearchCacheState.loaded = True
+
+
+def flush_search_cache(force: bool = False):
+    """按间隔把缓存写回磁盘"""
+    with SearchCacheState.lock:
+        if not force and time.monotonic() - SearchCacheState.last_flush < SEARCH_CACHE_FLUSH_SECONDS:
+            return
+        SearchCacheState.last_flush = time.monotonic()
+    try:
+        search_cache.save(SEARCH_CACHE_PATH)
+    except Exception as e:
+        print(f"⚠️ 搜索缓存保存失败: {e}")
+
+
+def _flush_on_exit():
+    if SearchCacheState.loaded:
+        flush_search_cache(force=True)
+
+
+atexit.register(_flush_on_exit)
+
+
+def get_search_cache_stats() -> dict:
+    return search_cache.stats()
+
 
 def web_search(query: str):
-    """联网搜索"""
+    """联网搜索 (同一问题在 TTL 内直接返回缓存，并发的相同查询只搜一次)"""
+    _ensure_loaded()
+    key = normalize_query(query)
     try:
-        return search_engine.run(query)
+        result = search_cache.get_or_load(key, lambda: get_search_engine().run(query))
+        flush_search_cache()
+        return result
     except Exception as e:
         return f"搜索失败: {str(e)}"
 
@@ -13,4 +107,5 @@ if __name__ == "__main__":
     print(search_result)
 
     search_result = web_search("浙江农林大学智科专业怎么样？")
-    print(search_result)
\ No newline at end of file
+    print(search_result)
+    print(get_search_cache_stats())
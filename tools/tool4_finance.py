@@ -1,4 +1,82 @@
-import yfinance as yf
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from tools.tool_cache import TTLCache
+
+load_dotenv()
+
+# 行情缓存：开盘时大量会话同时问 AAPL / 600519.SS，只需要真正请求一次 .info
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "30"))
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", "512"))
+quote_cache = TTLCache("quote", maxsize=QUOTE_CACHE_SIZE, ttl=QUOTE_CACHE_TTL)
+
+# 批量查询：一次最多多少只、并发拉取的线程数
+BATCH_QUOTE_MAX = int(os.getenv("BATCH_QUOTE_MAX", "20"))
+BATCH_QUOTE_WORKERS = int(os.getenv("BATCH_QUOTE_WORKERS", "8"))
+quote_pool = ThreadPoolExecutor(max_workers=BATCH_QUOTE_WORKERS, thread_name_prefix="quote")
+
+# .info 很大，缓存里只留用得到的字段
+QUOTE_FIELDS = (
+    "currentPrice", "regularMarketPrice", "marketCap", "trailingPE",
+    "currency", "longName", "fiftyTwoWeekHigh", "fiftyTwoWeekLow",
+)
+
+
+def normalize_ticker(ticker: str) -> str:
+    """统一代码格式：去空白、转大写，'600519.SH' 这种写法转成 yfinance 认识的 '.SS'"""
+    ticker = "".join(ticker.split()).strip("'\"").upper()
+    if ticker.endswith(".SH"):
+        ticker = ticker[:-3] + ".SS"
+    return ticker
+
+
+def _fetch_quote(ticker: str):
+    """真正请求 yfinance，返回精简后的 info 字典；查不到时返回 None (不缓存)"""
+    import yfinance as yf  # 导入要拉起 pandas 等一整套依赖，第一次查行情时再加载
+
+    info = yf.Ticker(ticker).info
+    if not info:
+        return None
+    return {k: info.get(k) for k in QUOTE_FIELDS}
+
+
+def get_quote(ticker: str, rate_limiter=None):
+    """
+    带缓存的行情获取，同一代码的并发 miss 只会触发一次请求。
+    rate_limiter：可选，只有真正回源 (缓存 miss) 时才调用它的 acquire() 排队拿令牌。
+    """
+    ticker = normalize_ticker(ticker)
+
+    def _load():
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return _fetch_quote(ticker)
+
+    try:
+        return quote_cache.get_or_load(ticker, _load)
+    except TimeoutError:
+        if rate_limiter is not None:
+            raise
+        # 等的是别人 (筛选器) 发起的加载，它的回源配额用完了：这个超时跟本次调用无关，自己直接回源一次
+        try:
+            return quote_cache.get_or_load(ticker, lambda: _fetch_quote(ticker))
+        except TimeoutError as e:
+            raise RuntimeError(f"行情接口超时: {e}") from e
+
+
+def get_quote_cache_stats() -> dict:
+    """行情缓存的命中 / 未命中 / 合并请求计数"""
+    return quote_cache.stats()
+
+
+def _first_present(info: dict, *keys, default='未知'):
+    """按顺序取第一个不为 None 的字段"""
+    for key in keys:
+        if info.get(key) is not None:
+            return info[key]
+    return default
 
 
 def get_stock_data(ticker: str):
@@ -7,21 +85,19 @@ def get_stock_data(ticker: str):
     ticker: 股票代码，例如 'AAPL' (苹果), 'TSLA' (特斯拉), '600519.SS' (贵州茅台), '00700.HK' (腾讯)
     """
     try:
-        # 创建股票对象
-        stock = yf.Ticker(ticker)
-
-        # 获取基本信息 (info 字典可能很大，我们只取关键的)
-        info = stock.info
+        # 获取基本信息 (走行情缓存，只保留关键字段)
+        info = get_quote(ticker)
 
         # 容错处理：有时候 info 为空
         if not info:
             return f"未找到代码为 {ticker} 的股票信息，请检查代码格式（如A股需加后缀.SS或.SZ）。"
 
-        current_price = info.get('currentPrice', info.get('regularMarketPrice', '未知'))
-        market_cap = info.get('marketCap', '未知')
-        pe_ratio = info.get('trailingPE', '未知')
-        currency = info.get('currency', 'USD')
-        name = info.get('longName', ticker)
+        # 0 是真实的值 (比如亏损公司的 PE)，只有缺失时才写 "未知"
+        current_price = _first_present(info, 'currentPrice', 'regularMarketPrice')
+        market_cap = _first_present(info, 'marketCap')
+        pe_ratio = _first_present(info, 'trailingPE')
+        currency = info.get('currency') or 'USD'
+        name = info.get('longName') or ticker
 
         # 简单换算一下市值单位
         if isinstance(market_cap, (int, float)):
@@ -37,7 +113,70 @@ def get_stock_data(ticker: str):
         return f"获取股票数据失败: {str(e)}"
 
 
+def parse_tickers(tickers) -> list:
+    """把 'AAPL, TSLA；600519.SS' 或 ['AAPL', 'TSLA'] 统一成去重后的代码列表"""
+    if isinstance(tickers, str):
+        tickers = re.split(r"[,，;；、\s]+", tickers)
+    result = []
+    for t in tickers:
+        t = normalize_ticker(t) if t else ""
+        if t and t not in result:
+            result.append(t)
+    return result
+
+
+def _format_number(value, digits=2):
+    if isinstance(value, (int, float)):
+        return f"{value:.{digits}f}"
+    return "-"
+
+
+def get_batch_stock_data(tickers):
+    """
+    批量获取多只股票的行情，返回一张紧凑的对比表。
+    tickers: 代码列表，或用逗号分隔的字符串，例如 '600519.SS, 000858.SZ, 000568.SZ'
+    """
+    codes = parse_tickers(tickers)
+    if not codes:
+        return "请提供至少一个股票代码，多个代码用逗号分隔。"
+    if len(codes) > BATCH_QUOTE_MAX:
+        return f"一次最多查询 {BATCH_QUOTE_MAX} 只股票，当前为 {len(codes)} 只，请拆分后再查。"
+
+    def _safe_quote(code):
+        try:
+            return get_quote(code), None
+        except Exception as e:
+            return None, str(e)
+
+    # 并发拉取 (命中缓存的直接返回)，总耗时取决于最慢的那一只
+    results = list(quote_pool.map(_safe_quote, codes))
+
+    lines = [
+        "| 代码 | 名称 | 当前价格 | 币种 | 市值(亿) | 市盈率(PE) | 52周最高 | 52周最低 |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for code, (info, error) in zip(codes, results):
+        if not info:
+            reason = f"获取失败: {error}" if error else "未找到，请检查代码格式"
+            lines.append(f"| {code} | {reason} | - | - | - | - | - | - |")
+            continue
+        price = _first_present(info, 'currentPrice', 'regularMarketPrice', default=None)
+        market_cap = info.get('marketCap')
+        if isinstance(market_cap, (int, float)):
+            market_cap = market_cap / 100000000
+        lines.append(
+            f"| {code} | {info.get('longName') or code} | {_format_number(price)} "
+            f"| {info.get('currency') or '-'} | {_format_number(market_cap)} "
+            f"| {_format_number(info.get('trailingPE'))} "
+            f"| {_format_number(info.get('fiftyTwoWeekHigh'))} "
+            f"| {_format_number(info.get('fiftyTwoWeekLow'))} |"
+        )
+    return "\n".join(lines)
+
+
 # 单元测试
 if __name__ == "__main__":
     print(get_stock_data("AAPL"))  # 美股
-    print(get_stock_data("600519.SS"))  # A股
\ No newline at end of file
+    print(get_stock_data("600519.SS"))  # A股
+    print(get_batch_stock_data("600519.SS, 000858.SZ, 000568.SZ"))  # 白酒三巨头对比
+    print(get_quote_cache_stats())
@@ -1,22 +1,101 @@
+import contextlib
+import contextvars
+import hashlib
+import json
 import os
-from langchain_community.document_loaders import PyPDFLoader
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
 from langchain_core.tools import tool
 
+from tools.embedding_cache import CachedEmbeddings, EmbeddingStore
+from tools.pdf_pipeline import count_pages, iter_pdf_pages
+from tools.rag_index import KB_INDEX_TYPE, KB_MMAP, INDEX_FILE, DOCSTORE_FILE, build_index, read_folder, tune_index
+from metrics import RETRIEVER_DURATION
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+# 向量缓存：相同片段不重复编码，EMBED_CACHE_MAX_MB=0 表示不限制大小
+embedding_store = EmbeddingStore(
+    os.getenv("EMBED_CACHE_PATH", os.path.join(CACHE_DIR, "embeddings.sqlite")),
+    max_bytes=int(float(os.getenv("EMBED_CACHE_MAX_MB", "0")) * 1024 * 1024),
+)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# 多久检查一次基础索引是否被别的进程 (命令行 rebuild) 换掉
+KB_RELOAD_CHECK_SECONDS = float(os.getenv("KB_RELOAD_CHECK_SECONDS", "5"))
+# 增量部分超过这么多片段时自动在后台触发一次 rebuild 并入基础索引，0 表示只手动重建
+KB_REBUILD_DELTA_CHUNKS = int(os.getenv("KB_REBUILD_DELTA_CHUNKS", "20000"))
+# 增量里最多保留多少个独立的小索引，超出后在内存里合并成一个 (磁盘上仍是每个文档一个 shard)，
+# 检索时每个小索引各查一次，这个数决定了增量部分的检索次数上限
+KB_DELTA_MAX_STORES = int(os.getenv("KB_DELTA_MAX_STORES", "8"))
+
+# 多租户：每个 namespace (会话 / 投研小组 ...) 一套独立的磁盘索引，默认 namespace 沿用 KB_DB_PATH
+DEFAULT_NAMESPACE = "default"
+KB_DB_PATH = os.getenv("KB_DB_PATH", "faiss_index_db")
+KB_NAMESPACE_DIR = os.getenv("KB_NAMESPACE_DIR", os.path.join(KB_DB_PATH, "namespaces"))
+# 内存里常驻索引的总大小上限，超出后卸载最久没用的 namespace (下次用到再从磁盘加载)；0 表示不限制
+KB_CACHE_MAX_MB = float(os.getenv("KB_CACHE_MAX_MB", "2048"))
+# 内存里最多记多少个 namespace 对象：namespace 由客户端传入 (比如用会话ID)，
+# 超出后丢掉已卸载且没人在用的 (磁盘上的数据不受影响，下次用到时重新创建)
+KB_MAX_NAMESPACES = int(os.getenv("KB_MAX_NAMESPACES", "256"))
+_NAMESPACE_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# 当前请求使用的知识库：/chat 进入 Agent 前设置，工具在线程池里执行时随上下文一起带过去
+current_namespace = contextvars.ContextVar("kb_namespace", default=DEFAULT_NAMESPACE)
+
 
 # ==========================================
 # 1. 使用类作为容器，彻底避免 NameError
 # ==========================================
+class KnowledgeBase:
+    """
+    一个 namespace 的知识库。磁盘上是一个目录 (文档 shard + 清单 + 可选的基础索引)，
+    内存里的索引可以随时卸载，下次用到时再加载。
+    """
+
+    def __init__(self, namespace: str, db_path: str):
+        self.namespace = namespace
+        self.db_path = db_path
+        # 每个文档单独存一个小索引 (shard)，新增文档只落盘这一份增量
+        self.shard_dir = os.path.join(db_path, "shards")
+        self.manifest_path = os.path.join(db_path, "manifest.json")
+        self.manifest = None  # doc_id -> {"source", "chunks", "added_at"}
+        self.lock = threading.RLock()
+        self.loaded = False
+        # 增量部分：((doc_ids, 索引), ...)，新入库的文档各自一个小索引，个数超过 KB_DELTA_MAX_STORES 后合并；
+        # doc_ids 是这个索引包含的文档集合，旧版单一存档记为 None。
+        # 元组本身不可变，入库 / 删除时在 lock 内整体替换，检索拿到的是一份快照
+        self.delta_stores = ()
+        self.bytes = 0  # 已加载索引的大致内存占用
+        self.pins = 0  # 正在入库 / 删除 / 重建的任务数，大于 0 时不会被移出 RAGStorage.namespaces (受 RAGStorage.lock 保护)
+        # 可选的基础索引：rebuild 时用全部 shard 训练出的 IVF / HNSW / PQ 索引 (可 mmap 加载)，
+        # 此时 delta_stores 只存放 rebuild 之后新增的文档，检索时两边结果按距离合并
+        self.base_dir = os.path.join(db_path, "base")
+        self.base_meta_path = os.path.join(self.base_dir, "current.json")
+        self.base_store = None
+        self.base_meta = None  # {"version", "index_type", "factory", "ntotal", "doc_ids", "legacy", "deleted", "built_at"}
+        self.base_doc_ids = frozenset()
+        self.base_deleted = frozenset()  # 基础索引里已删除的文档，检索时过滤掉，下次 rebuild 时真正清除
+        self.base_mtime = 0
+        self.base_checked_at = 0.0
+
+
 class RAGStorage:
     """
-    一个简单的容器类，用来存放向量库和模型。
-    这样 Python 永远能通过 RAGStorage.vector_store 找到它。
+    一个简单的容器类，用来存放共享的 Embedding 模型和各 namespace 的知识库。
+    namespaces 按最近使用排序，只有已加载的那部分占内存。
     """
-    vector_store = None
     embeddings = None
-    db_path = "faiss_index_db"
+    embeddings_lock = threading.Lock()
+    namespaces = OrderedDict()  # namespace -> KnowledgeBase
+    lock = threading.Lock()
 
 
 # ==========================================
@@ -24,72 +103,682 @@ class RAGStorage:
 # ==========================================
 
 def get_embeddings():
-    """获取或初始化 Embedding 模型"""
-    if RAGStorage.embeddings is None:
-        print("🚀 正在初始化 Embedding 模型...")
-        try:
-            RAGStorage.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2"
-            )
-        except Exception as e:
-            print(f"❌ Embedding 加载失败: {e}")
-            raise e
+    """获取或初始化 Embedding 模型 (后台预热和第一次检索可能同时进来，加锁只加载一次)"""
+    if RAGStorage.embeddings is not None:
+        return RAGStorage.embeddings
+    with RAGStorage.embeddings_lock:
+        if RAGStorage.embeddings is None:
+            print("🚀 正在初始化 Embedding 模型...")
+            try:
+                # sentence-transformers / torch 很重，放到真正要用时再导入
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+
+                RAGStorage.embeddings = CachedEmbeddings(
+                    HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL),
+                    model_name=EMBEDDING_MODEL,
+                    store=embedding_store,
+                    batch_size=EMBED_BATCH_SIZE,
+                )
+            except Exception as e:
+                print(f"❌ Embedding 加载失败: {e}")
+                raise e
     return RAGStorage.embeddings
 
 
-def load_vector_store():
-    """尝试加载知识库"""
-    # 1. 如果内存里已经有了，直接返回
-    if RAGStorage.vector_store is not None:
-        return RAGStorage.vector_store
+def normalize_namespace(namespace=None) -> str:
+    """空值表示默认 namespace；只允许字母、数字和 _ . -，防止拼出越界的路径"""
+    namespace = (namespace or "").strip() or DEFAULT_NAMESPACE
+    if not _NAMESPACE_RE.match(namespace):
+        raise ValueError(f"非法的知识库 namespace: {namespace} (只允许字母、数字和 _ . -，最长 64 位)")
+    return namespace
+
 
-    # 2. 如果硬盘上有存档，加载它
-    if os.path.exists(RAGStorage.db_path):
-        print(f"📂 检测到本地存档 {RAGStorage.db_path}，正在加载...")
+def _namespace_path(namespace: str) -> str:
+    if namespace == DEFAULT_NAMESPACE:
+        return KB_DB_PATH
+    return os.path.join(KB_NAMESPACE_DIR, namespace)
+
+
+def get_knowledge_base(namespace=None, pin: bool = False) -> KnowledgeBase:
+    """
+    取 namespace 对应的知识库 (不负责加载)；不传时使用当前请求上下文里的 namespace。
+    pin=True 时同时占用一次 (要修改知识库的调用方用 _pinned_knowledge_base)。
+    """
+    namespace = normalize_namespace(namespace or current_namespace.get())
+    with RAGStorage.lock:
+        kb = RAGStorage.namespaces.get(namespace)
+        if kb is None:
+            kb = RAGStorage.namespaces[namespace] = KnowledgeBase(namespace, _namespace_path(namespace))
+            _drop_idle_namespaces(keep=kb)
+        RAGStorage.namespaces.move_to_end(namespace)
+        if pin:
+            kb.pins += 1
+        return kb
+
+
+def _drop_idle_namespaces(keep: KnowledgeBase):
+    """namespace 对象超过 KB_MAX_NAMESPACES 时，从最久没用的开始移除已卸载、没被占用的 (调用方需持有 RAGStorage.lock)"""
+    for name, kb in list(RAGStorage.namespaces.items()):
+        if len(RAGStorage.namespaces) <= KB_MAX_NAMESPACES:
+            break
+        if kb is keep or kb.loaded or kb.pins or not kb.lock.acquire(blocking=False):
+            continue
         try:
-            emb = get_embeddings()
-            RAGStorage.vector_store = FAISS.load_local(
-                RAGStorage.db_path,
-                emb,
-                allow_dangerous_deserialization=True
-            )
-            print("✅ 知识库加载成功！")
-            return RAGStorage.vector_store
-        except Exception as e:
-            print(f"⚠️ 加载存档失败: {e}")
-            return None
-    return None
+            del RAGStorage.namespaces[name]
+        finally:
+            kb.lock.release()
 
 
-def initialize_knowledge_base(file_path):
-    """构建并保存知识库"""
+@contextlib.contextmanager
+def _pinned_knowledge_base(namespace=None):
+    """修改知识库期间占用它，保证同一个 namespace 在内存里始终只有一个对象"""
+    kb = get_knowledge_base(namespace, pin=True)
     try:
-        emb = get_embeddings()
-        print(f"📄 处理文件: {file_path}...")
+        yield kb
+    finally:
+        with RAGStorage.lock:
+            kb.pins -= 1
 
-        loader = PyPDFLoader(file_path)
-        docs = loader.load()
 
-        if not docs:
+def load_manifest(kb: KnowledgeBase):
+    """读取已入库文档清单 (以文件内容哈希作为 doc_id)"""
+    if kb.manifest is None:
+        kb.manifest = {}
+        if os.path.exists(kb.manifest_path):
+            try:
+                with open(kb.manifest_path, "r", encoding="utf-8") as f:
+                    kb.manifest = json.load(f)
+            except Exception as e:
+                print(f"⚠️ 文档清单读取失败: {e}")
+    return kb.manifest
+
+
+def _save_manifest(kb: KnowledgeBase):
+    os.makedirs(kb.db_path, exist_ok=True)
+    tmp_path = kb.manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(kb.manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, kb.manifest_path)
+
+
+def _shard_path(kb: KnowledgeBase, doc_id: str) -> str:
+    return os.path.join(kb.shard_dir, doc_id)
+
+
+def _folder_bytes(folder: str, include_index: bool = True) -> int:
+    """按文件大小估算一个 FAISS 目录加载后的内存占用 (向量 + 文档 pickle；基础索引的 SQLite 文档存储留在磁盘上，不计入)"""
+    names = (INDEX_FILE, DOCSTORE_FILE) if include_index else (DOCSTORE_FILE,)
+    total = 0
+    for name in names:
+        try:
+            total += os.path.getsize(os.path.join(folder, name))
+        except OSError:
+            pass
+    return total
+
+
+def _refresh_bytes(kb: KnowledgeBase):
+    """按当前已加载的 基础索引 + 增量 shard 重新估算内存占用 (调用方需持有 kb.lock)"""
+    size = 0
+    if kb.base_store is not None and kb.base_meta:
+        # mmap 加载的向量在页缓存里，多个进程共享，不计入本进程的占用
+        size += _folder_bytes(os.path.join(kb.base_dir, kb.base_meta["version"]), include_index=not KB_MMAP)
+    for doc_ids, _ in kb.delta_stores:
+        for doc_id in doc_ids:
+            size += _folder_bytes(kb.db_path if doc_id is None else _shard_path(kb, doc_id))
+    kb.bytes = size
+
+
+def _copy_store(store):
+    """复制一份索引 (向量 + 文档)，只用于有界的增量部分，读者手里的旧索引不受影响"""
+    import faiss
+
+    return FAISS(store.embedding_function, faiss.clone_index(store.index),
+                 InMemoryDocstore(dict(store.docstore._dict)), dict(store.index_to_docstore_id))
+
+
+def _merge_stores(stores):
+    """把若干个小索引合成一个新索引，原来的不动"""
+    merged = _copy_store(stores[0])
+    for store in stores[1:]:
+        merged.merge_from(store)
+    return merged
+
+
+def _compact_delta(kb: KnowledgeBase):
+    """
+    增量里的小索引超过 KB_DELTA_MAX_STORES 个时合并成一个。
+    合并在锁外做 (只复制增量部分)，发布前确认这期间没有删除过其中的文档，否则放弃这次合并。
+    """
+    snapshot = kb.delta_stores
+    if len(snapshot) <= KB_DELTA_MAX_STORES:
+        return
+    merged = _merge_stores([store for _, store in snapshot])
+    doc_ids = frozenset().union(*(ids for ids, _ in snapshot))
+    with kb.lock:
+        current = kb.delta_stores
+        if current[:len(snapshot)] != snapshot:
+            return
+        kb.delta_stores = ((doc_ids, merged),) + current[len(snapshot):]
+    print(f"🗜️ 知识库 [{kb.namespace}] 增量合并: {len(snapshot)} 个小索引 -> 1")
+
+
+def _chunk_ids(doc_id: str, count: int) -> list:
+    return [f"{doc_id}:{i}" for i in range(count)]
+
+
+def _delta_vectors(delta_stores) -> int:
+    return sum(store.index.ntotal for _, store in delta_stores)
+
+
+def compute_doc_id(file_path) -> str:
+    """按文件内容计算 sha256，同一份文件换个名字上传也能识别出来"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def _read_base_meta(kb: KnowledgeBase):
+    if not os.path.exists(kb.base_meta_path):
+        return None
+    with open(kb.base_meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_base_meta(kb: KnowledgeBase, meta: dict):
+    os.makedirs(kb.base_dir, exist_ok=True)
+    tmp_path = kb.base_meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, kb.base_meta_path)
+    kb.base_mtime = os.stat(kb.base_meta_path).st_mtime_ns
+
+
+def _load_base(kb: KnowledgeBase, meta: dict, emb):
+    index, docstore, index_to_docstore_id = read_folder(
+        os.path.join(kb.base_dir, meta["version"]), mmap=KB_MMAP
+    )
+    return FAISS(emb, tune_index(index), docstore, index_to_docstore_id)
+
+
+def _load_all(kb: KnowledgeBase):
+    """
+    从硬盘加载 基础索引 + 增量 (调用方需持有 kb.lock)。
+    增量 = 旧版单一存档 (未并入基础索引时) + 不在基础索引里的文档 shard。
+    """
+    legacy_file = os.path.join(kb.db_path, INDEX_FILE)
+    manifest = load_manifest(kb)
+    meta = _read_base_meta(kb)
+    if meta is None and not os.path.exists(legacy_file) and not manifest:
+        kb.base_store = None
+        kb.base_meta = None
+        kb.delta_stores = ()
+        kb.bytes = 0
+        return
+
+    print(f"📂 检测到本地存档 {kb.db_path}，正在加载...")
+    emb = get_embeddings()
+    base = None
+    if meta:
+        base = _load_base(kb, meta, emb)
+    in_base = frozenset(meta["doc_ids"]) if meta else frozenset()
+    deleted = frozenset(meta.get("deleted", ())) if meta else frozenset()
+
+    # 加载阶段还没有读者，增量直接原地合并成一个索引，最后一次性发布
+    store = None
+    delta_ids = set()
+    if os.path.exists(legacy_file) and not (meta and meta.get("legacy")):
+        store = FAISS.load_local(
+            kb.db_path,
+            emb,
+            allow_dangerous_deserialization=True
+        )
+        delta_ids.add(None)
+    # 删除后又重新上传的文档，基础索引里那份仍带删除标记，新内容放在增量里
+    delta_docs = [doc_id for doc_id in manifest if doc_id not in in_base or doc_id in deleted]
+    for doc_id in delta_docs:
+        shard = FAISS.load_local(
+            _shard_path(kb, doc_id),
+            emb,
+            allow_dangerous_deserialization=True
+        )
+        delta_ids.add(doc_id)
+        if store is None:
+            store = shard
+        else:
+            store.merge_from(shard)
+
+    # 先换基础索引再换增量：中间态最多是同一片段出现两次 (检索时去重)，不会漏
+    kb.base_store = base
+    kb.base_meta = meta
+    kb.base_doc_ids = in_base
+    kb.base_deleted = deleted
+    kb.delta_stores = ((frozenset(delta_ids), store),) if store is not None else ()
+    _refresh_bytes(kb)
+    if os.path.exists(kb.base_meta_path):
+        kb.base_mtime = os.stat(kb.base_meta_path).st_mtime_ns
+    if base is not None:
+        print(f"✅ 基础索引 {meta['factory']} ({base.index.ntotal} 条向量{', mmap' if KB_MMAP else ''})")
+    print(f"✅ 知识库 [{kb.namespace}] 加载成功！共 {len(delta_docs)} 个增量文档")
+
+
+def _ensure_loaded(kb: KnowledgeBase):
+    """调用方需持有 kb.lock"""
+    if not kb.loaded:
+        _load_all(kb)
+        kb.loaded = True
+
+
+def _unload(kb: KnowledgeBase):
+    """释放内存里的索引 (调用方需持有 kb.lock)，文档清单很小，保留"""
+    kb.delta_stores = ()
+    kb.base_store = None
+    kb.loaded = False
+    kb.bytes = 0
+    print(f"📤 知识库 [{kb.namespace}] 已卸载")
+
+
+def _evict(keep: KnowledgeBase):
+    """已加载索引的总大小超过 KB_CACHE_MAX_MB 时，从最久没用的 namespace 开始卸载 (正在写入的跳过)"""
+    limit = KB_CACHE_MAX_MB * 1024 * 1024
+    if limit <= 0:
+        return
+    with RAGStorage.lock:
+        loaded = [kb for kb in RAGStorage.namespaces.values() if kb.loaded]
+    total = sum(kb.bytes for kb in loaded)
+    for kb in loaded:
+        if total <= limit:
+            break
+        if kb is keep or not kb.lock.acquire(blocking=False):
+            continue
+        try:
+            if kb.loaded:
+                total -= kb.bytes
+                _unload(kb)
+        finally:
+            kb.lock.release()
+
+
+def _load_kb(kb: KnowledgeBase):
+    """确保 kb 已从硬盘加载，返回它的增量索引快照 kb.delta_stores"""
+    if not kb.loaded:
+        with kb.lock:
+            try:
+                _ensure_loaded(kb)
+            except Exception as e:
+                print(f"⚠️ 加载存档失败: {e}")
+                kb.delta_stores = ()
+                kb.base_store = None
+                return ()
+        _evict(keep=kb)
+    return kb.delta_stores
+
+
+def load_vector_store(namespace=None):
+    """
+    确保知识库已从硬盘加载，返回增量索引快照 kb.delta_stores
+    (做过 rebuild 且之后没有新文档时为空，基础索引在 kb.base_store)
+    """
+    return _load_kb(get_knowledge_base(namespace))
+
+
+def _maybe_reload_base(kb: KnowledgeBase):
+    """基础索引被别的进程 (命令行 rebuild / 其他 worker 删除文档) 改过时重新加载，最多每隔几秒检查一次"""
+    now = time.monotonic()
+    if now - kb.base_checked_at < KB_RELOAD_CHECK_SECONDS:
+        return
+    kb.base_checked_at = now
+    try:
+        mtime = os.stat(kb.base_meta_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = 0
+    if mtime == kb.base_mtime:
+        return
+
+    with kb.lock:
+        if not kb.loaded:
+            return
+        meta = _read_base_meta(kb)
+        current = kb.base_meta
+        if meta and current and meta["version"] == current["version"]:
+            # 同一版本，只是删除标记变了
+            kb.base_meta = meta
+            kb.base_deleted = frozenset(meta.get("deleted", ()))
+            kb.base_mtime = mtime
+        else:
+            print(f"🔁 知识库 [{kb.namespace}] 基础索引已更新，重新加载...")
+            _load_all(kb)
+
+
+def ingest_document(file_path, progress=None, source=None, namespace=None) -> dict:
+    """
+    增量入库一个 PDF：
+    - 内容哈希已存在 -> 直接跳过；
+    - 否则只为这份文档建一个 shard 并落盘，再挂到内存里的增量列表上 (不复制已有索引)。
+    解析是流式的：多进程逐页抽取文本，页面一到就切分，攒满一批片段就向量化写入 shard，
+    内存占用与文档页数无关。
+    progress(pages_done, pages_total, chunks_done) 在每批片段入索引后回调一次。
+    返回 {"doc_id", "status": "added" | "skipped", "chunks"}
+    """
+    with _pinned_knowledge_base(namespace) as kb:
+        return _ingest_document(kb, file_path, progress, source)
+
+
+def _ingest_document(kb: KnowledgeBase, file_path, progress, source) -> dict:
+    progress = progress or (lambda pages_done, pages_total, chunks_done: None)
+    source = source or os.path.basename(file_path)
+    doc_id = compute_doc_id(file_path)
+    with kb.lock:
+        manifest = load_manifest(kb)
+    if doc_id in manifest:
+        print(f"⏭️ 文档已在知识库中，跳过: {source}")
+        return {"doc_id": doc_id, "status": "skipped", "chunks": manifest[doc_id]["chunks"]}
+
+    emb = get_embeddings()
+    total_pages = count_pages(file_path)
+    print(f"📄 处理文件: {source} ({total_pages} 页) -> [{kb.namespace}]...")
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    shard = None
+    batch = []
+    chunk_count = 0
+    pages_done = 0
+
+    def flush():
+        nonlocal shard, batch, chunk_count
+        if not batch:
+            return
+        ids = [f"{doc_id}:{i}" for i in range(chunk_count, chunk_count + len(batch))]
+        if shard is None:
+            shard = FAISS.from_documents(batch, emb, ids=ids)
+        else:
+            shard.add_documents(batch, ids=ids)
+        chunk_count += len(batch)
+        batch = []
+        progress(pages_done, total_pages, chunk_count)
+
+    # 页面按顺序到达，边切分边按固定批次向量化
+    for page_no, text in iter_pdf_pages(file_path, total_pages):
+        pages_done += 1
+        for piece in text_splitter.split_text(text):
+            batch.append(Document(
+                page_content=piece,
+                metadata={"source": source, "page": page_no, "doc_id": doc_id},
+            ))
+            if len(batch) >= EMBED_BATCH_SIZE:
+                flush()
+    flush()
+    progress(pages_done, total_pages, chunk_count)
+
+    if shard is None:
+        raise ValueError("PDF 中没有解析出任何内容")
+    print(f"🧠 增量索引构建完成 ({chunk_count} 个片段)")
+
+    print(f"💾 保存增量到硬盘...")
+    shard_path = _shard_path(kb, doc_id)
+    shard.save_local(shard_path)
+
+    # 3. 先确保已有存档被加载，再发布带上新 shard 的增量列表 (原子替换)
+    with kb.lock:
+        if doc_id in manifest:
+            # 同一文件被并发上传了两次，另一个任务已经先一步入库
+            return {"doc_id": doc_id, "status": "skipped", "chunks": manifest[doc_id]["chunks"]}
+        _ensure_loaded(kb)
+        kb.delta_stores = kb.delta_stores + ((frozenset([doc_id]), shard),)
+        _refresh_bytes(kb)
+        manifest[doc_id] = {
+            "source": source,
+            "chunks": chunk_count,
+            "added_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        _save_manifest(kb)
+    _compact_delta(kb)
+    _evict(keep=kb)
+
+    print("✅ 知识库处理完毕！")
+    return {"doc_id": doc_id, "status": "added", "chunks": chunk_count}
+
+
+def delete_document(doc_id: str, namespace=None) -> bool:
+    """按 doc_id 删除文档：从增量列表中摘掉它的 shard (或在基础索引里打删除标记)，并删掉对应 shard 目录"""
+    with _pinned_knowledge_base(namespace) as kb:
+        return _delete_document(kb, doc_id)
+
+
+def _delete_document(kb: KnowledgeBase, doc_id: str) -> bool:
+    with kb.lock:
+        manifest = load_manifest(kb)
+        entry = manifest.get(doc_id)
+        if entry is None:
             return False
 
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        splits = text_splitter.split_documents(docs)
+        _ensure_loaded(kb)
+        shard_path = _shard_path(kb, doc_id)
+        if doc_id in kb.base_doc_ids and doc_id not in kb.base_deleted:
+            # 基础索引可能是只读 mmap / 不支持删除的 HNSW，只打删除标记
+            meta = dict(kb.base_meta)
+            meta["deleted"] = sorted(set(meta.get("deleted", ())) | {doc_id})
+            _write_base_meta(kb, meta)
+            kb.base_meta = meta
+            kb.base_deleted = frozenset(meta["deleted"])
+        elif any(doc_id in ids for ids, _ in kb.delta_stores):
+            delta = []
+            for ids, store in kb.delta_stores:
+                if doc_id not in ids:
+                    delta.append((ids, store))
+                elif len(ids) > 1:
+                    # 合并过的索引：删掉这个文档的片段后换成新的一份，正在检索的读者仍用旧的
+                    store = _copy_store(store)
+                    store.delete(_chunk_ids(doc_id, entry["chunks"]))
+                    delta.append((ids - {doc_id}, store))
+            kb.delta_stores = tuple(delta)
+            _refresh_bytes(kb)
+        shutil.rmtree(shard_path, ignore_errors=True)
+        del manifest[doc_id]
+        _save_manifest(kb)
+    print(f"🗑️ 已删除文档: {doc_id} [{kb.namespace}]")
+    return True
+
+
+def get_embedding_cache_stats() -> dict:
+    """向量缓存的命中率和占用大小"""
+    return embedding_store.stats()
+
+
+def list_documents(namespace=None) -> dict:
+    """已增量入库的文档清单"""
+    kb = get_knowledge_base(namespace)
+    with kb.lock:
+        return dict(load_manifest(kb))
+
+
+def get_kb_version(namespace=None) -> str:
+    """知识库内容的版本号 (当前全部 doc_id 的哈希)：入库 / 删除后变化，重建索引不变"""
+    kb = get_knowledge_base(namespace)
+    with kb.lock:
+        doc_ids = sorted(load_manifest(kb))
+    return hashlib.md5("\n".join(doc_ids).encode("utf-8")).hexdigest()[:12]
 
-        print("🧠 构建 FAISS 索引...")
-        # 直接存入类属性中
-        RAGStorage.vector_store = FAISS.from_documents(splits, emb)
 
-        print(f"💾 保存到硬盘...")
-        RAGStorage.vector_store.save_local(RAGStorage.db_path)
+def list_namespaces() -> list:
+    """磁盘上已有的和本进程用过的全部 namespace，以及各自是否已加载、内存占用"""
+    names = {DEFAULT_NAMESPACE}
+    if os.path.isdir(KB_NAMESPACE_DIR):
+        names.update(n for n in os.listdir(KB_NAMESPACE_DIR) if _NAMESPACE_RE.match(n))
+    with RAGStorage.lock:
+        names.update(RAGStorage.namespaces)
+        known = dict(RAGStorage.namespaces)
+    result = []
+    for name in sorted(names):
+        kb = known.get(name)
+        result.append({
+            "namespace": name,
+            "loaded": bool(kb and kb.loaded),
+            "bytes": kb.bytes if kb and kb.loaded else 0,
+        })
+    return result
 
-        print("✅ 知识库处理完毕！")
+
+def get_kb_cache_stats() -> dict:
+    """已加载的 namespace 数和索引内存占用 (LRU 按 KB_CACHE_MAX_MB 卸载)"""
+    with RAGStorage.lock:
+        kbs = list(RAGStorage.namespaces.values())
+    loaded = [kb for kb in kbs if kb.loaded]
+    return {
+        "namespaces": len(kbs),
+        "loaded": len(loaded),
+        "bytes": sum(kb.bytes for kb in loaded),
+        "max_bytes": int(KB_CACHE_MAX_MB * 1024 * 1024),
+    }
+
+
+def initialize_knowledge_base(file_path, namespace=None):
+    """把文件增量加入知识库 (已存在的文档会被跳过)"""
+    try:
+        ingest_document(file_path, namespace=namespace)
         return True
     except Exception as e:
         print(f"❌ 构建失败: {e}")
         return False
 
 
+def warmup_embeddings():
+    """加载 Embedding 模型并跑一次编码，把权重加载、首次推理的开销提前付掉"""
+    get_embeddings().embed_query("warmup")
+
+
+def warmup_knowledge_base(namespace=DEFAULT_NAMESPACE) -> int:
+    """预加载硬盘上的 FAISS 存档，返回向量条数 (没有存档时为 0)"""
+    kb = get_knowledge_base(namespace)
+    delta = _load_kb(kb)
+    base = kb.base_store
+    return (base.index.ntotal if base is not None else 0) + _delta_vectors(delta)
+
+
+def search_knowledge_base(query: str, k: int = 3, namespace=None):
+    """
+    在 基础索引 + 增量 中检索，按 L2 距离合并取前 k 条；知识库为空时返回 None。
+    query 只编码一次，两个索引共用同一个向量。
+    """
+    kb = get_knowledge_base(namespace)
+    _load_kb(kb)
+    _maybe_reload_base(kb)
+    base, deleted, delta = kb.base_store, kb.base_deleted, kb.delta_stores
+    if base is None and not delta:
+        return None
+
+    vector = get_embeddings().embed_query(query)
+    hits = []
+    if base is not None:
+        if deleted:
+            hits += base.similarity_search_with_score_by_vector(
+                vector, k, filter=lambda md: md.get("doc_id") not in deleted, fetch_k=k * 10
+            )
+        else:
+            hits += base.similarity_search_with_score_by_vector(vector, k)
+    for _, store in delta:
+        hits += store.similarity_search_with_score_by_vector(vector, k)
+
+    hits.sort(key=lambda hit: hit[1])
+    docs, seen = [], set()
+    for doc, _ in hits:
+        key = (doc.metadata.get("doc_id"), doc.metadata.get("page"), doc.page_content)
+        if key not in seen:
+            seen.add(key)
+            docs.append(doc)
+    return docs[:k]
+
+
+def rebuild_knowledge_base(index_type: str = None, progress=None, namespace=None) -> dict:
+    """
+    用全部文档 shard (以及旧版单一存档) 训练并构建新的基础索引，写到 base/<version>/，
+    再原子切换 current.json。构建期间照常检索和入库：新入库的文档留在增量里，
+    构建期间被删除的文档记为删除标记。
+    progress(vectors_done, vectors_total) 透传给 build_index。
+    """
+    with _pinned_knowledge_base(namespace) as kb:
+        info = _rebuild_knowledge_base(kb, index_type, progress)
+        # 基础索引换了，占用也跟着变
+        _evict(keep=kb)
+        return info
+
+
+def _rebuild_knowledge_base(kb: KnowledgeBase, index_type, progress) -> dict:
+    index_type = (index_type or KB_INDEX_TYPE).lower()
+    with kb.lock:
+        doc_ids = list(load_manifest(kb))
+        legacy = os.path.exists(os.path.join(kb.db_path, INDEX_FILE))
+    sources = ([kb.db_path] if legacy else []) + [_shard_path(kb, d) for d in doc_ids]
+    if not sources:
+        raise ValueError("知识库为空，请先上传文档")
+
+    version = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    out_dir = os.path.join(kb.base_dir, version)
+    try:
+        info = build_index(sources, index_type, out_dir, progress)
+    except Exception:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise
+
+    with kb.lock:
+        manifest = load_manifest(kb)
+        meta = {
+            "version": version,
+            **info,
+            "doc_ids": doc_ids,
+            "legacy": legacy,
+            "deleted": [d for d in doc_ids if d not in manifest],
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        _write_base_meta(kb, meta)
+        if kb.loaded:
+            _load_all(kb)
+
+    # 旧版本目录可以直接删：其他进程 mmap 着的旧文件在删除后仍然可读，下次检查时会切到新版本
+    for name in os.listdir(kb.base_dir):
+        path = os.path.join(kb.base_dir, name)
+        if name != version and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return get_index_info(kb.namespace)
+
+
+def get_index_info(namespace=None) -> dict:
+    """当前索引结构：基础索引类型 / 向量数 / 删除标记数，以及增量部分的大小"""
+    kb = get_knowledge_base(namespace)
+    _load_kb(kb)
+    meta = kb.base_meta
+    delta = kb.delta_stores
+    info = {
+        "namespace": kb.namespace,
+        "configured_type": KB_INDEX_TYPE,
+        "mmap": KB_MMAP,
+        "bytes": kb.bytes,
+        "delta_vectors": _delta_vectors(delta),
+        "delta_shards": len(delta),
+        "base": None,
+    }
+    if meta:
+        info["base"] = {
+            "version": meta["version"],
+            "index_type": meta["index_type"],
+            "factory": meta["factory"],
+            "vectors": meta["ntotal"],
+            "documents": len(meta["doc_ids"]),
+            "deleted": len(meta.get("deleted", ())),
+            "built_at": meta["built_at"],
+        }
+    return info
+
+
+def needs_rebuild(namespace=None) -> bool:
+    """增量部分是否已经大到应该并入基础索引 (KB_REBUILD_DELTA_CHUNKS 控制)"""
+    if KB_REBUILD_DELTA_CHUNKS <= 0:
+        return False
+    return _delta_vectors(get_knowledge_base(namespace).delta_stores) >= KB_REBUILD_DELTA_CHUNKS
+
+
 # ==========================================
 # 3. 工具定义
 # ==========================================
@@ -99,22 +788,18 @@ def knowledge_base_tool(query: str):
     """
     只有当用户询问关于'上传文档'、'知识库'、'这篇报告'或'文件'相关内容时，才使用此工具。
     """
-    # 1. 自动尝试加载
-    db = load_vector_store()
-
-    if db is None:
-        return "当前知识库为空。请先上传 PDF 文档。"
-
     try:
-        # 2. 检索
-        retriever = db.as_retriever(search_kwargs={"k": 3})
-        docs = retriever.invoke(query)
+        # 1. 检索当前请求所属 namespace 的知识库 (自动加载；入库任务只会整体替换增量列表，检索中拿到的快照不会被改动)
+        with RETRIEVER_DURATION.time():
+            docs = search_knowledge_base(query, k=3)
 
+        if docs is None:
+            return "当前知识库为空。请先上传 PDF 文档。"
         if not docs:
             return "知识库里没找到相关信息。"
 
-        # 3. 结果拼接
+        # 2. 结果拼接
         context = "\n\n".join([d.page_content for d in docs])
         return f"【从文档中搜索到的内容】：\n{context}"
     except Exception as e:
-        return f"检索时发生错误: {str(e)}"
\ No newline at end of file
+        return f"检索时发生错误: {str(e)}"
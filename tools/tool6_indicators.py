@@ -0,0 +1,222 @@
+import os
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from tools.price_history import get_history
+from tools.tool4_finance import parse_tickers, quote_pool, BATCH_QUOTE_MAX
+from tools.tool_cache import TTLCache
+
+load_dotenv()
+
+# ==========================================
+# 1. 配置
+# ==========================================
+# 算指标用多长的日线 (EMA / MACD 需要足够的预热长度，MA60 至少要 60 根)
+INDICATOR_HISTORY_PERIOD = os.getenv("INDICATOR_HISTORY_PERIOD", "1y")
+INDICATOR_CACHE_SIZE = int(os.getenv("INDICATOR_CACHE_SIZE", "1024"))
+# 结果按 (代码, 最后一根 K 线) 缓存：K 线不变结果就不变，TTL 只是兜底清理
+INDICATOR_CACHE_TTL = float(os.getenv("INDICATOR_CACHE_TTL", "86400"))
+
+MA_WINDOWS = (5, 20, 60)
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BOLL_WINDOW, BOLL_K = 20, 2.0
+VOL_WINDOW = 20
+TRADING_DAYS = 252
+
+indicator_cache = TTLCache("indicator", maxsize=INDICATOR_CACHE_SIZE, ttl=INDICATOR_CACHE_TTL)
+
+
+def _bar_key(ticker: str, frame: pd.DataFrame) -> str:
+    """最后一根 K 线的日期 + 收盘价 (盘中收盘价会变，也要算进去)"""
+    last = frame.iloc[-1]
+    return f"{ticker}:{last['date']:%Y-%m-%d}:{last['close']:.6g}"
+
+
+# ==========================================
+# 2. 向量化计算
+# ==========================================
+def _close_matrix(frames: dict) -> pd.DataFrame:
+    """
+    把多只股票的收盘价拼成 (K 线序号 x 代码) 的矩阵，按最后一根 K 线右对齐：
+    不同市场交易日历不同，指标只看各自最近的 N 根，对齐日期反而会引入空洞。
+    历史较短的股票前面补 NaN。
+    """
+    length = max(len(f) for f in frames.values())
+    matrix = np.full((length, len(frames)), np.nan)
+    for col, frame in enumerate(frames.values()):
+        closes = frame["close"].to_numpy(dtype="float64")
+        matrix[length - len(closes):, col] = closes
+    return pd.DataFrame(matrix, columns=list(frames))
+
+
+def compute_indicators(frames: dict) -> dict:
+    """
+    一次性计算多只股票的技术指标，所有滚动 / 指数平均都在整张矩阵上按列进行。
+    frames: 代码 -> 日线 DataFrame；返回 代码 -> 最新一根 K 线的指标字典
+    """
+    close = _close_matrix(frames)
+    last = close.iloc[-1]
+    out = {
+        "close": last,
+        "change_1d": close.pct_change(1, fill_method=None).iloc[-1] * 100,
+        "change_20d": close.pct_change(20, fill_method=None).iloc[-1] * 100,
+    }
+    for window in MA_WINDOWS:
+        out[f"ma{window}"] = close.rolling(window).mean().iloc[-1]
+
+    ema_fast = close.ewm(span=MACD_FAST, adjust=False).mean()
+    ema_slow = close.ewm(span=MACD_SLOW, adjust=False).mean()
+    dif = ema_fast - ema_slow
+    dea = dif.ewm(span=MACD_SIGNAL, adjust=False).mean()
+    out["ema12"] = ema_fast.iloc[-1]
+    out["ema26"] = ema_slow.iloc[-1]
+    out["macd_dif"] = dif.iloc[-1]
+    out["macd_dea"] = dea.iloc[-1]
+    out["macd_hist"] = (dif - dea).iloc[-1] * 2
+
+    # RSI 用 Wilder 平滑 (alpha = 1/N)
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / RSI_PERIOD, adjust=False, min_periods=RSI_PERIOD).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / RSI_PERIOD, adjust=False, min_periods=RSI_PERIOD).mean()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - 100 / (1 + gain / loss)
+    out["rsi14"] = rsi.iloc[-1]
+
+    mid = close.rolling(BOLL_WINDOW).mean()
+    std = close.rolling(BOLL_WINDOW).std(ddof=0)
+    out["boll_mid"] = mid.iloc[-1]
+    out["boll_upper"] = (mid + BOLL_K * std).iloc[-1]
+    out["boll_lower"] = (mid - BOLL_K * std).iloc[-1]
+    width = out["boll_upper"] - out["boll_lower"]
+    out["boll_pct_b"] = ((last - out["boll_lower"]) / width.where(width != 0)) * 100
+
+    log_ret = np.log(close).diff()
+    out["volatility_20d"] = log_ret.rolling(VOL_WINDOW).std().iloc[-1] * np.sqrt(TRADING_DAYS) * 100
+    out["volatility_1y"] = log_ret.tail(TRADING_DAYS).std() * np.sqrt(TRADING_DAYS) * 100
+
+    result = {}
+    for col, ticker in enumerate(frames):
+        values = {name: series.iloc[col] for name, series in out.items()}
+        result[ticker] = {k: (None if pd.isna(v) else round(float(v), 4)) for k, v in values.items()}
+        result[ticker]["bars"] = int(len(frames[ticker]))
+        result[ticker]["date"] = f"{frames[ticker]['date'].iloc[-1]:%Y-%m-%d}"
+    return result
+
+
+def _signals(ind: dict) -> str:
+    """给 LLM 的一句话结论，避免它自己对着数字猜"""
+    notes = []
+    rsi = ind.get("rsi14")
+    if rsi is not None:
+        notes.append("RSI超买" if rsi >= 70 else "RSI超卖" if rsi <= 30 else "RSI中性")
+    close, upper, lower = ind.get("close"), ind.get("boll_upper"), ind.get("boll_lower")
+    if None not in (close, upper, lower):
+        if close > upper:
+            notes.append("突破布林上轨")
+        elif close < lower:
+            notes.append("跌破布林下轨")
+    dif, dea = ind.get("macd_dif"), ind.get("macd_dea")
+    if None not in (dif, dea):
+        notes.append("MACD多头" if dif > dea else "MACD空头")
+    ma20, ma60 = ind.get("ma20"), ind.get("ma60")
+    if None not in (close, ma20, ma60):
+        if close > ma20 > ma60:
+            notes.append("均线多头排列")
+        elif close < ma20 < ma60:
+            notes.append("均线空头排列")
+    return "、".join(notes) or "-"
+
+
+# ==========================================
+# 3. 对外接口
+# ==========================================
+def get_indicators(tickers) -> dict:
+    """
+    批量取技术指标：代码 -> 指标字典 (或 {"error": ...})。
+    日线走本地缓存并发读取；(代码, 最后一根 K 线) 没变的直接命中缓存，其余的合成一张矩阵一次算完。
+    """
+    codes = parse_tickers(tickers)
+
+    def _safe_history(code):
+        try:
+            return get_history(code, INDICATOR_HISTORY_PERIOD), None
+        except Exception as e:
+            return None, str(e)
+
+    results = {}
+    pending = {}
+    for code, (frame, error) in zip(codes, quote_pool.map(_safe_history, codes)):
+        if frame is None or frame.empty:
+            results[code] = {"error": f"获取失败: {error}" if error else "未找到历史行情，请检查代码格式"}
+            continue
+        key = _bar_key(code, frame)
+        cached = indicator_cache.get(key, record=True)
+        if cached is not None:
+            results[code] = cached
+        else:
+            pending[code] = (key, frame)
+
+    if pending:
+        computed = compute_indicators({code: frame for code, (_, frame) in pending.items()})
+        for code, (key, _) in pending.items():
+            indicator_cache.set(key, computed[code])
+            results[code] = computed[code]
+    return {code: results[code] for code in codes}
+
+
+def get_indicator_cache_stats() -> dict:
+    return indicator_cache.stats()
+
+
+def _fmt(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def get_technical_indicators(tickers):
+    """
+    计算一只或多只股票的技术指标 (MA / EMA / RSI / MACD / 布林带 / 波动率)，返回对比表格。
+    tickers: 代码列表，或用逗号分隔的字符串，例如 'AAPL, TSLA, 600519.SS'
+    """
+    codes = parse_tickers(tickers)
+    if not codes:
+        return "请提供至少一个股票代码，多个代码用逗号分隔。"
+    if len(codes) > BATCH_QUOTE_MAX:
+        return f"一次最多计算 {BATCH_QUOTE_MAX} 只股票，当前为 {len(codes)} 只，请拆分后再查。"
+
+    try:
+        indicators = get_indicators(codes)
+    except Exception as e:
+        return f"计算技术指标失败: {str(e)}"
+
+    lines = [
+        "| 代码 | 日期 | 收盘 | 日涨跌% | 20日涨跌% | MA5/MA20/MA60 | RSI14 | MACD(DIF/DEA/柱) "
+        "| 布林(上/中/下) | %B | 20日年化波动% | 信号 |",
+        "|---|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for code, ind in indicators.items():
+        if "error" in ind:
+            lines.append(f"| {code} | {ind['error']} | - | - | - | - | - | - | - | - | - | - |")
+            continue
+        lines.append(
+            f"| {code} | {ind['date']} | {_fmt(ind['close'])} | {_fmt(ind['change_1d'])} "
+            f"| {_fmt(ind['change_20d'])} "
+            f"| {_fmt(ind['ma5'])}/{_fmt(ind['ma20'])}/{_fmt(ind['ma60'])} | {_fmt(ind['rsi14'], 1)} "
+            f"| {_fmt(ind['macd_dif'], 3)}/{_fmt(ind['macd_dea'], 3)}/{_fmt(ind['macd_hist'], 3)} "
+            f"| {_fmt(ind['boll_upper'])}/{_fmt(ind['boll_mid'])}/{_fmt(ind['boll_lower'])} "
+            f"| {_fmt(ind['boll_pct_b'], 1)} | {_fmt(ind['volatility_20d'], 1)} | {_signals(ind)} |"
+        )
+    return "\n".join(lines)
+
+
+# 单元测试
+if __name__ == "__main__":
+    import time
+
+    print(get_technical_indicators("AAPL, TSLA, 600519.SS"))
+    start = time.perf_counter()
+    get_technical_indicators("AAPL, TSLA, 600519.SS")
+    print(f"第二次耗时 {time.perf_counter() - start:.6f}s")
+    print(get_indicator_cache_stats())
@@ -0,0 +1,292 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+
+from tools.tool4_finance import get_quote, parse_tickers, quote_cache
+
+load_dotenv()
+
+# ==========================================
+# 1. 配置
+# ==========================================
+# 一次最多扫描多少只股票
+SCREENER_MAX_UNIVERSE = int(os.getenv("SCREENER_MAX_UNIVERSE", "500"))
+# 扫描用的线程数 (独立于 batch_stock_tool 的 quote_pool，大扫描不会把对比查询堵住)
+SCREENER_WORKERS = int(os.getenv("SCREENER_WORKERS", "8"))
+# 回源 yfinance 的速率上限 (次/秒，所有扫描共享)，命中行情缓存的不计
+SCREENER_RATE = float(os.getenv("SCREENER_RATE", "5"))
+SCREENER_BURST = int(os.getenv("SCREENER_BURST", "10"))
+# 单次扫描的总耗时上限 (秒)，到点还没拿到的股票记为跳过，保证一步之内返回
+SCREENER_TIMEOUT = float(os.getenv("SCREENER_TIMEOUT", "45"))
+SCREENER_DEFAULT_TOP = int(os.getenv("SCREENER_DEFAULT_TOP", "10"))
+SCREENER_MAX_TOP = 50
+
+screener_pool = ThreadPoolExecutor(max_workers=SCREENER_WORKERS, thread_name_prefix="screener")
+
+
+# 可筛选 / 排序的字段：名字 -> (说明, 从精简 info 计算的函数)
+def _price(info):
+    return info.get("currentPrice") or info.get("regularMarketPrice")
+
+
+def _pct_from(info, key):
+    price, ref = _price(info), info.get(key)
+    if isinstance(price, (int, float)) and isinstance(ref, (int, float)) and ref:
+        return (price / ref - 1) * 100
+    return None
+
+
+FIELDS = {
+    "pe": ("市盈率(PE)", lambda info: info.get("trailingPE")),
+    "price": ("当前价格", _price),
+    "market_cap": ("市值(亿)", lambda info: info["marketCap"] / 100000000
+                   if isinstance(info.get("marketCap"), (int, float)) else None),
+    "high52": ("52周最高", lambda info: info.get("fiftyTwoWeekHigh")),
+    "low52": ("52周最低", lambda info: info.get("fiftyTwoWeekLow")),
+    "from_high": ("距52周高点%", lambda info: _pct_from(info, "fiftyTwoWeekHigh")),
+    "from_low": ("距52周低点%", lambda info: _pct_from(info, "fiftyTwoWeekLow")),
+}
+FIELD_ALIASES = {
+    "市盈率": "pe", "trailingpe": "pe", "价格": "price", "股价": "price",
+    "市值": "market_cap", "marketcap": "market_cap", "mcap": "market_cap",
+}
+_CONDITION_RE = re.compile(r"^\s*([A-Za-z_一-龥]+)\s*(<=|>=|<|>|==|=)\s*(-?[\d.]+(?:[eE][-+]?\d+)?)\s*$")
+_OPS = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+    "=": lambda a, b: a == b, "==": lambda a, b: a == b,
+}
+
+
+class RateLimiter:
+    """令牌桶：平均 rate 次/秒，允许 burst 次突发；线程安全"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = None):
+        """拿到令牌后返回；等待时间会超过 timeout 时抛 TimeoutError (不消耗令牌)"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait_seconds = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if timeout is not None and wait_seconds > timeout:
+                raise TimeoutError("回源速率已达上限")
+            # 先把令牌预支出去 (可以为负)，后来的线程排在后面等
+            self._tokens -= 1
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+
+rate_limiter = RateLimiter(SCREENER_RATE, SCREENER_BURST)
+
+
+class _Budget:
+    """把共享的令牌桶和本次扫描的截止时间绑在一起，交给 get_quote 在回源前调用"""
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.fetched = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        rate_limiter.acquire(timeout=max(0.0, self.deadline - time.monotonic()))
+        with self._lock:
+            self.fetched += 1
+
+
+# ==========================================
+# 2. 解析筛选条件
+# ==========================================
+def _field(name: str) -> str:
+    key = name.strip().lower()
+    key = FIELD_ALIASES.get(key, key)
+    if key not in FIELDS:
+        raise ValueError(f"不支持的字段: {name}，可选 {', '.join(FIELDS)}")
+    return key
+
+
+def parse_criteria(criteria) -> dict:
+    """
+    支持两种输入：
+    1. JSON：{"universe": "AAPL,MSFT,..." 或列表, "filters": ["pe<20", "market_cap>1000"]
+       或 {"pe": {"max": 20}}, "sort": "pe", "order": "asc", "top": 10}
+    2. 纯文本：逗号分隔的代码，默认按 PE 从低到高取前 10
+    返回 {"universe", "filters": [(field, op, value)], "sort", "descending", "top"}
+    """
+    if isinstance(criteria, str):
+        text = criteria.strip().strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+        try:
+            criteria = json.loads(text)
+        except json.JSONDecodeError:
+            criteria = {"universe": text}
+    if not isinstance(criteria, dict):
+        criteria = {"universe": criteria}
+
+    filters = []
+    raw_filters = criteria.get("filters") or []
+    if isinstance(raw_filters, str):
+        raw_filters = re.split(r"[,，;；]|\band\b|且", raw_filters)
+    if isinstance(raw_filters, dict):
+        for name, bounds in raw_filters.items():
+            if not isinstance(bounds, dict):
+                bounds = {"eq": bounds}
+            for bound, value in bounds.items():
+                op = {"min": ">=", "max": "<=", "gt": ">", "lt": "<", "eq": "="}.get(bound)
+                if op is None:
+                    raise ValueError(f"不支持的条件: {name}.{bound}，可用 min / max / gt / lt / eq")
+                filters.append((_field(name), op, float(value)))
+    else:
+        for condition in raw_filters:
+            if not condition or not condition.strip():
+                continue
+            match = _CONDITION_RE.match(condition)
+            if not match:
+                raise ValueError(f"无法解析条件: {condition}，格式如 pe<20、market_cap>=1000")
+            filters.append((_field(match.group(1)), match.group(2), float(match.group(3))))
+
+    order = str(criteria.get("order", "asc")).lower()
+    top = int(criteria.get("top") or criteria.get("top_n") or SCREENER_DEFAULT_TOP)
+    return {
+        "universe": parse_tickers(criteria.get("universe") or criteria.get("tickers") or []),
+        "filters": filters,
+        "sort": _field(criteria.get("sort") or criteria.get("sort_by") or "pe"),
+        "descending": order in ("desc", "descending", "降序"),
+        "top": max(1, min(top, SCREENER_MAX_TOP)),
+    }
+
+
+# ==========================================
+# 3. 扫描
+# ==========================================
+def screen(criteria) -> dict:
+    """
+    按条件扫描股票池：有界线程池并发拉行情 (命中缓存的不回源，回源的受令牌桶限速)，
+    超过 SCREENER_TIMEOUT 还没拿到的记为跳过。返回排序后的前 N 行和扫描统计。
+    """
+    spec = parse_criteria(criteria)
+    universe = spec["universe"]
+    if not universe:
+        raise ValueError("请提供股票池 universe (代码列表)")
+    if len(universe) > SCREENER_MAX_UNIVERSE:
+        raise ValueError(f"一次最多扫描 {SCREENER_MAX_UNIVERSE} 只股票，当前为 {len(universe)} 只")
+
+    started = time.monotonic()
+    budget = _Budget(started + SCREENER_TIMEOUT)
+    hits_before = quote_cache.stats()["hits"]
+
+    def _safe_quote(code):
+        if time.monotonic() >= budget.deadline:
+            return None, "timeout"
+        try:
+            return get_quote(code, rate_limiter=budget), None
+        except TimeoutError:
+            return None, "timeout"
+        except Exception as e:
+            return None, str(e)
+
+    futures = {screener_pool.submit(_safe_quote, code): code for code in universe}
+    done, not_done = wait(futures, timeout=max(0.0, budget.deadline - time.monotonic()))
+    for future in not_done:
+        future.cancel()
+
+    rows, failed, skipped = [], [], len(not_done)
+    for future in done:
+        code = futures[future]
+        info, error = future.result()
+        if error == "timeout":
+            skipped += 1
+            continue
+        if not info:
+            failed.append(code)
+            continue
+        row = {"code": code, "name": info.get("longName") or code, "currency": info.get("currency") or "-"}
+        row.update({name: func(info) for name, (_, func) in FIELDS.items()})
+        rows.append(row)
+
+    matched = [
+        row for row in rows
+        if all(isinstance(row[f], (int, float)) and _OPS[op](row[f], v) for f, op, v in spec["filters"])
+    ]
+    sort = spec["sort"]
+    ranked = sorted(
+        (row for row in matched if isinstance(row[sort], (int, float))),
+        key=lambda row: row[sort],
+        reverse=spec["descending"],
+    )
+    return {
+        "spec": spec,
+        "rows": ranked[:spec["top"]],
+        "scanned": len(universe),
+        "fetched_ok": len(rows),
+        "matched": len(ranked),
+        "failed": failed,
+        "skipped": skipped,
+        "upstream_calls": budget.fetched,
+        "cache_hits": quote_cache.stats()["hits"] - hits_before,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+
+def _format_number(value, digits=2):
+    if isinstance(value, (int, float)):
+        return f"{value:.{digits}f}"
+    return "-"
+
+
+def screen_stocks(criteria):
+    """
+    股票筛选器：在一个股票池里按条件过滤、排序，只返回前 N 名的表格。
+    criteria: JSON 字符串，例如
+      {"universe": "AAPL,MSFT,GOOG,...", "filters": ["pe<20", "market_cap>1000"], "sort": "pe", "order": "asc", "top": 10}
+    """
+    try:
+        result = screen(criteria)
+    except ValueError as e:
+        return f"筛选条件有误: {e}"
+    except Exception as e:
+        return f"筛选失败: {str(e)}"
+
+    spec = result["spec"]
+    conditions = "、".join(f"{f}{op}{v:g}" for f, op, v in spec["filters"]) or "无"
+    summary = (f"扫描 {result['scanned']} 只 | 成功 {result['fetched_ok']} | 符合条件 {result['matched']} | "
+               f"条件: {conditions} | 按 {FIELDS[spec['sort']][0]} {'降序' if spec['descending'] else '升序'} | "
+               f"耗时 {result['seconds']}s")
+    if result["failed"]:
+        summary += f"\n未找到: {', '.join(result['failed'][:10])}" + (" 等" if len(result["failed"]) > 10 else "")
+    if result["skipped"]:
+        summary += f"\n超时跳过 {result['skipped']} 只 (回源限速 {SCREENER_RATE:g} 次/秒，可缩小股票池或稍后重试)"
+    if not result["rows"]:
+        return summary + "\n没有符合条件的股票。"
+
+    lines = [
+        summary,
+        "| 排名 | 代码 | 名称 | 当前价格 | 币种 | 市值(亿) | 市盈率(PE) | 距52周高点% |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for rank, row in enumerate(result["rows"], 1):
+        lines.append(
+            f"| {rank} | {row['code']} | {row['name']} | {_format_number(row['price'])} | {row['currency']} "
+            f"| {_format_number(row['market_cap'])} | {_format_number(row['pe'])} "
+            f"| {_format_number(row['from_high'], 1)} |"
+        )
+    return "\n".join(lines)
+
+
+# 单元测试
+if __name__ == "__main__":
+    print(screen_stocks('{"universe": "AAPL,MSFT,GOOG,AMZN,META,NVDA,TSLA", "sort": "pe", "top": 3}'))
+    print(screen_stocks("600519.SS, 000858.SZ, 000568.SZ"))
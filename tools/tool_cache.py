@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    带过期时间 + LRU 淘汰的线程安全缓存。
+    get_or_load 做了 single-flight：同一个 key 同时 miss 时只有一个线程真正去拉数据，
+    其余线程等它的结果 (记为 coalesced)。
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl: float = 60,
+                 max_bytes: int = 0, sizer=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # 可选的按体积淘汰：sizer(value) 返回单条大小，总量超过 max_bytes 时淘汰最久未用的
+        self.max_bytes = max_bytes
+        self.sizer = sizer or (lambda value: 0)
+        self._bytes = 0
+        self._data = OrderedDict()  # key -> (expire_at, value)
+        self._inflight = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, record: bool = False):
+        """命中返回值，没命中或已过期返回 None；record=True 时计入命中 / 未命中统计"""
+        with self._lock:
+            value = self._get_locked(key)
+            if record:
+                if value is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._set_locked(key, value, ttl)
+
+    def get_or_load(self, key, loader, ttl: float = None):
+        """
+        先查缓存，miss 时调用 loader() 加载并写回。
+        loader 抛异常时不缓存，异常会抛给所有等待该 key 的调用方。
+        """
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.fail(e)
+            raise
+
+        with self._lock:
+            if value is not None:
+                self._set_locked(key, value, ttl)
+            self._inflight.pop(key, None)
+        flight.done(value)
+        return value
+
+    def invalidate(self, key=None):
+        """删除单个 key；不传 key 则清空整个缓存"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+                self._bytes = 0
+            elif key in self._data:
+                self._remove_locked(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses + self.coalesced
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / total, 4) if total else 0.0,
+            }
+
+    def save(self, path: str):
+        """
+        把未过期的条目写到 JSON 文件 (值需可 JSON 序列化)。
+        过期时间换算成墙上时间，重启后 load 回来仍按原来的剩余寿命过期。
+        """
+        now_mono, now_wall = time.monotonic(), time.time()
+        with self._lock:
+            items = [
+                [key, now_wall + (expire_at - now_mono), value]
+                for key, (expire_at, value) in self._data.items()
+                if expire_at > now_mono
+            ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """从 save 写出的文件恢复缓存，跳过已过期的条目，返回恢复条数"""
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        now_mono, now_wall = time.monotonic(), time.time()
+        loaded = 0
+        with self._lock:
+            for key, expire_wall, value in items:
+                remaining = expire_wall - now_wall
+                if remaining > 0:
+                    self._set_locked(key, value, remaining)
+                    loaded += 1
+        return loaded
+
+    # ---------- 内部方法 (调用方需持有 self._lock) ----------
+    def _get_locked(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expire_at, value = item
+        if expire_at < time.monotonic():
+            self._remove_locked(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _set_locked(self, key, value, ttl: float = None):
+        if key in self._data:
+            self._remove_locked(key)
+        expire_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expire_at, value)
+        self._bytes += self.sizer(value)
+        while len(self._data) > self.maxsize or (self.max_bytes and self._bytes > self.max_bytes):
+            if len(self._data) <= 1:
+                break
+            self._remove_locked(next(iter(self._data)))
+
+    def _remove_locked(self, key):
+        _, value = self._data.pop(key)
+        self._bytes -= self.sizer(value)
+
+
+class _Flight:
+    """一次正在进行中的加载，跟随者在这里等待领头线程的结果"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def done(self, value):
+        self._value = value
+        self._event.set()
+
+    def fail(self, error: Exception):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
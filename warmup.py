@@ -0,0 +1,115 @@
+import importlib
+import os
+import threading
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ==========================================
+# 1. 启动模式
+# ==========================================
+# lazy：重模块 (langchain Agent、Embedding 模型、FAISS 存档) 不在导入时加载，服务先起来，
+#       再由后台线程预热，/ready 报告进度；
+# eager：预热全部完成后才开始接收请求 (和以前一样慢，但第一条请求不会冷启动)；
+# cold：不预热，全部等到第一次用到时再加载 (本地调试 / 压测)。
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy").lower()
+
+# 预热顺序：先保证能聊天，再准备知识库
+STAGES = ("agent", "embeddings", "knowledge_base")
+
+
+def load_module(name: str):
+    """按需导入模块 (已导入时直接返回)，放到线程池里调用，避免首次导入卡住事件循环"""
+    return importlib.import_module(name)
+
+
+def _warm_agent():
+    load_module("agent_core").warmup_agent()
+
+
+def _warm_embeddings():
+    load_module("tools.tool5_rag").warmup_embeddings()
+
+
+def _warm_knowledge_base():
+    vectors = load_module("tools.tool5_rag").warmup_knowledge_base()
+    return f"{vectors} vectors"
+
+
+_STAGE_FUNCS = {
+    "agent": _warm_agent,
+    "embeddings": _warm_embeddings,
+    "knowledge_base": _warm_knowledge_base,
+}
+
+
+class WarmupState:
+    """预热进度容器：stage -> {"status": pending/running/ready/failed, "seconds", "detail"}"""
+    stages = {name: {"status": "pending"} for name in STAGES}
+    started_at = None
+    finished_at = None
+    thread = None
+    lock = threading.Lock()
+
+
+# ==========================================
+# 2. 预热
+# ==========================================
+def run_warmup():
+    """依次执行各预热阶段；某一阶段失败不影响后面的阶段，对应功能会在第一次使用时再重试加载"""
+    WarmupState.started_at = time.time()
+    for name in STAGES:
+        stage = WarmupState.stages[name]
+        stage["status"] = "running"
+        start = time.perf_counter()
+        try:
+            detail = _STAGE_FUNCS[name]()
+            stage["status"] = "ready"
+            if detail:
+                stage["detail"] = detail
+        except Exception as e:
+            traceback.print_exc()
+            stage["status"] = "failed"
+            stage["detail"] = str(e)
+        stage["seconds"] = round(time.perf_counter() - start, 3)
+        print(f"🔥 预热 {name}: {stage['status']} ({stage['seconds']}s)")
+    WarmupState.finished_at = time.time()
+
+
+def start_warmup():
+    """按 STARTUP_MODE 启动预热：lazy 在后台线程里跑，eager 阻塞到跑完"""
+    if STARTUP_MODE == "cold":
+        return
+    with WarmupState.lock:
+        if WarmupState.thread is not None:
+            return
+        WarmupState.thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+        WarmupState.thread.start()
+    if STARTUP_MODE == "eager":
+        WarmupState.thread.join()
+
+
+def readiness() -> dict:
+    """
+    ready：预热已结束 (cold 模式下始终为 True)；
+    status：ready / warming / degraded (有阶段失败，相关功能首次使用时会再尝试加载)
+    """
+    stages = {name: dict(info) for name, info in WarmupState.stages.items()}
+    if STARTUP_MODE == "cold":
+        return {"ready": True, "status": "ready", "mode": STARTUP_MODE, "stages": stages}
+
+    finished = WarmupState.finished_at is not None
+    if not finished:
+        status = "warming"
+    elif any(s["status"] == "failed" for s in stages.values()):
+        status = "degraded"
+    else:
+        status = "ready"
+    result = {"ready": finished, "status": status, "mode": STARTUP_MODE, "stages": stages}
+    if WarmupState.started_at is not None:
+        end = WarmupState.finished_at or time.time()
+        result["elapsed"] = round(end - WarmupState.started_at, 3)
+    return result